@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'cs_quiz_project.settings')
+# Serve the async quiz views unless explicitly disabled
+os.environ.setdefault('QUIZ_ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
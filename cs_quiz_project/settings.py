@@ -134,3 +134,137 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Question bank
+# The bank is refilled in the background with Gemini whenever it holds fewer
+# than QUIZ_BANK_MIN_SIZE questions. Once the bank is stocked, its size is
+# checked again at most every QUIZ_BANK_CHECK_INTERVAL seconds.
+QUIZ_BANK_MIN_SIZE = int(os.getenv('QUIZ_BANK_MIN_SIZE', '50'))
+QUIZ_BANK_REFILL_BATCH = int(os.getenv('QUIZ_BANK_REFILL_BATCH', '5'))
+QUIZ_BANK_CHECK_INTERVAL = float(os.getenv('QUIZ_BANK_CHECK_INTERVAL', '30'))
+
+# Number of unanswered questions left in a session batch at which the next
+# batch is requested in the background (0 waits until the batch runs out).
+QUIZ_PREFETCH_THRESHOLD = int(os.getenv('QUIZ_PREFETCH_THRESHOLD', '2'))
+
+# Warm pool of ready questions kept in memory by each worker process and
+# shared by all its sessions (0 disables the pool).
+QUIZ_POOL_SIZE = int(os.getenv('QUIZ_POOL_SIZE', '20'))
+QUIZ_POOL_REFILL_BATCH = int(os.getenv('QUIZ_POOL_REFILL_BATCH', '5'))
+# Fill the pool in the background when a gunicorn worker boots. Skipped when
+# the Gemini backend has no GOOGLE_API_KEY, so workers still boot without it.
+QUIZ_WARM_POOL = os.getenv('QUIZ_WARM_POOL', 'True').lower() in ('1', 'true', 'yes')
+
+# Ids of bank questions already shown to each session, so they are not served
+# again. They are kept in this cache under a key per session, not in the
+# session itself; with several workers use a cache shared between processes.
+QUIZ_SERVED_IDS_CACHE_ALIAS = os.getenv('QUIZ_SERVED_IDS_CACHE_ALIAS', 'default')
+
+# Generation task registry: finished tasks are kept for status checks for
+# QUIZ_TASK_TTL seconds, within an entry count and payload size budget.
+QUIZ_TASK_TTL = int(os.getenv('QUIZ_TASK_TTL', '300'))
+QUIZ_TASK_MAX_ENTRIES = int(os.getenv('QUIZ_TASK_MAX_ENTRIES', '1000'))
+QUIZ_TASK_MAX_BYTES = int(os.getenv('QUIZ_TASK_MAX_BYTES', str(10 * 1024 * 1024)))
+
+# Where generation tasks are tracked. 'memory' is per process; with several
+# gunicorn workers use 'cache' (a cache shared between processes), 'database'
+# or 'file' (workers on a single host) so any worker can report a task's status.
+# With QUIZ_ASYNC_VIEWS tasks are tracked from the event loop, so 'database'
+# (and 'cache' on a database cache) are refused there.
+QUIZ_TASK_BACKEND = os.getenv('QUIZ_TASK_BACKEND', 'memory')
+QUIZ_TASK_BACKEND_OPTIONS = {
+    'cache': {'alias': os.getenv('QUIZ_TASK_CACHE_ALIAS', 'default')},
+    'file': {'directory': os.getenv('QUIZ_TASK_FILE_DIR') or None},
+}.get(QUIZ_TASK_BACKEND, {})
+
+# Generation worker pool: maximum concurrent Gemini calls per process and
+# number of generations allowed to wait for a worker before new ones are rejected.
+QUIZ_GENERATION_WORKERS = int(os.getenv('QUIZ_GENERATION_WORKERS', '4'))
+QUIZ_GENERATION_QUEUE_SIZE = int(os.getenv('QUIZ_GENERATION_QUEUE_SIZE', '20'))
+
+# Async views (used when served through ASGI): generations run as asyncio
+# tasks instead of worker threads.
+QUIZ_ASYNC_VIEWS = os.getenv('QUIZ_ASYNC_VIEWS', 'False').lower() in ('1', 'true', 'yes')
+QUIZ_ASYNC_MAX_GENERATIONS = int(os.getenv('QUIZ_ASYNC_MAX_GENERATIONS', '1000'))
+QUIZ_ASYNC_CONCURRENCY = int(os.getenv('QUIZ_ASYNC_CONCURRENCY', '100'))
+
+# Maximum lifetime of a /generation_events/ stream; the browser reconnects
+# automatically afterwards. Under WSGI each open stream holds a worker thread,
+# so there the stream is a bounded long-poll of QUIZ_SSE_WSGI_MAX_DURATION.
+QUIZ_SSE_MAX_DURATION = int(os.getenv('QUIZ_SSE_MAX_DURATION', '60'))
+QUIZ_SSE_WSGI_MAX_DURATION = int(os.getenv('QUIZ_SSE_WSGI_MAX_DURATION', '5'))
+
+# Stream Gemini responses so each question is served as soon as it is parsed.
+QUIZ_STREAMING_GENERATION = os.getenv('QUIZ_STREAMING_GENERATION', 'True').lower() in ('1', 'true', 'yes')
+
+# Fan-out generation: one Gemini request per question, sent concurrently and
+# merged as they complete; failed items are retried individually.
+QUIZ_FANOUT_GENERATION = os.getenv('QUIZ_FANOUT_GENERATION', 'False').lower() in ('1', 'true', 'yes')
+QUIZ_FANOUT_CONCURRENCY = int(os.getenv('QUIZ_FANOUT_CONCURRENCY', '10'))
+QUIZ_FANOUT_RETRIES = int(os.getenv('QUIZ_FANOUT_RETRIES', '1'))
+
+# Register the static part of the generation prompt (instructions and JSON
+# example) as a Gemini cached content so each request only sends the
+# per-question lines. Falls back to sending it inline if it cannot be cached.
+QUIZ_CONTEXT_CACHE = os.getenv('QUIZ_CONTEXT_CACHE', 'False').lower() in ('1', 'true', 'yes')
+QUIZ_CONTEXT_CACHE_TTL = int(os.getenv('QUIZ_CONTEXT_CACHE_TTL', '3600'))
+
+# Ask Gemini for JSON constrained to the question schema, parsed by a
+# validated decoder. Disable to fall back to free-form output.
+QUIZ_STRUCTURED_OUTPUT = os.getenv('QUIZ_STRUCTURED_OUTPUT', 'True').lower() in ('1', 'true', 'yes')
+
+# When a response is short (truncated or with invalid questions), the
+# well-formed questions are kept and only the missing ones are requested again.
+QUIZ_TOPUP_MISSING = os.getenv('QUIZ_TOPUP_MISSING', 'True').lower() in ('1', 'true', 'yes')
+
+# Sessions only keep question ids; question payloads are read from the bank
+# through an in-process LRU cache of this many questions.
+QUIZ_QUESTION_CACHE_SIZE = int(os.getenv('QUIZ_QUESTION_CACHE_SIZE', '1000'))
+
+# Single-flight: sessions that need a batch while another session's batch of
+# the same size is being generated share that generation instead of
+# starting a new Gemini call.
+QUIZ_COALESCE_GENERATIONS = os.getenv('QUIZ_COALESCE_GENERATIONS', 'True').lower() in ('1', 'true', 'yes')
+
+# Model backend generation requests are sent to. 'fake' answers offline with
+# valid questions, for development and load tests; its latency (including
+# occasional slow outliers), failure rate and question size are configurable.
+QUIZ_MODEL_BACKEND = os.getenv('QUIZ_MODEL_BACKEND', 'gemini')
+QUIZ_MODEL_BACKEND_OPTIONS = {
+    'fake': {
+        'latency': float(os.getenv('QUIZ_FAKE_LATENCY', '0.5')),
+        'latency_per_question': float(os.getenv('QUIZ_FAKE_LATENCY_PER_QUESTION', '0')),
+        'latency_jitter': float(os.getenv('QUIZ_FAKE_LATENCY_JITTER', '0')),
+        'tail_rate': float(os.getenv('QUIZ_FAKE_TAIL_RATE', '0')),
+        'tail_latency': float(os.getenv('QUIZ_FAKE_TAIL_LATENCY', '0')),
+        'failure_rate': float(os.getenv('QUIZ_FAKE_FAILURE_RATE', '0')),
+        'question_size': int(os.getenv('QUIZ_FAKE_QUESTION_SIZE', '0')),
+        'seed': int(os.environ['QUIZ_FAKE_SEED']) if os.getenv('QUIZ_FAKE_SEED') else None,
+    },
+}.get(QUIZ_MODEL_BACKEND, {})
+
+# Generation metrics (per-stage timings and counters) served at /metrics in
+# Prometheus format. With several gunicorn workers, set a directory writable
+# by all of them so any worker reports the totals; gunicorn clears it on start.
+QUIZ_METRICS_DIR = os.getenv('QUIZ_METRICS_DIR') or None
+
+# Token usage of every model call, attributed to the topic, subtopic,
+# difficulty and type of the questions it requested, is added to the
+# GenerationUsage table every few seconds. Prices (USD per million tokens)
+# are used by the token_usage_report command to estimate cost.
+QUIZ_USAGE_ACCOUNTING = os.getenv('QUIZ_USAGE_ACCOUNTING', 'True').lower() in ('1', 'true', 'yes')
+QUIZ_USAGE_FLUSH_INTERVAL = float(os.getenv('QUIZ_USAGE_FLUSH_INTERVAL', '10'))
+QUIZ_PRICE_INPUT_PER_MTOK = float(os.getenv('QUIZ_PRICE_INPUT_PER_MTOK', '0.10'))
+QUIZ_PRICE_CACHED_PER_MTOK = float(os.getenv('QUIZ_PRICE_CACHED_PER_MTOK', '0.025'))
+QUIZ_PRICE_OUTPUT_PER_MTOK = float(os.getenv('QUIZ_PRICE_OUTPUT_PER_MTOK', '0.40'))
+
+# Hedged requests: when a non-streamed Gemini call is still running after the
+# given percentile of recent call latencies, a duplicate is sent and the first
+# valid response is used. The budget caps duplicates to that fraction of all
+# calls. Only batch, top-up and fan-out calls are hedged: streamed generations
+# are not, so with QUIZ_STREAMING_GENERATION on (the default) session batches
+# are not hedged; turn streaming off or use fan-out to hedge them.
+QUIZ_HEDGE_REQUESTS = os.getenv('QUIZ_HEDGE_REQUESTS', 'False').lower() in ('1', 'true', 'yes')
+QUIZ_HEDGE_PERCENTILE = float(os.getenv('QUIZ_HEDGE_PERCENTILE', '95'))
+QUIZ_HEDGE_BUDGET = float(os.getenv('QUIZ_HEDGE_BUDGET', '0.1'))
+QUIZ_HEDGE_MIN_DELAY = float(os.getenv('QUIZ_HEDGE_MIN_DELAY', '0.5'))
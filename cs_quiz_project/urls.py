@@ -21,16 +21,25 @@ from django.conf.urls.static import static
 from django.shortcuts import redirect
 from gemini_app import views
 
+# Bajo ASGI se usan las versiones async de las vistas que esperan a Gemini
+if settings.QUIZ_ASYNC_VIEWS:
+    from gemini_app import async_views as quiz_views
+else:
+    quiz_views = views
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('', views.index, name='index'),
+    path('', quiz_views.index, name='index'),
     path('submit_answer/', views.submit_answer, name='submit_answer'),
-    path('next_question/', views.next_question, name='next_question'),
+    path('next_question/', quiz_views.next_question, name='next_question'),
     path('get_metrics/', views.get_metrics, name='get_metrics'),
     path('reset_metrics/', views.reset_metrics, name='reset_metrics'),
     path('clear_session/', views.clear_session, name='clear_session'),
     path('refresh/', lambda request: redirect('/?refresh=1'), name='refresh'),
-    path('check_generation_status/', views.check_generation_status, name='check_generation_status'),
+    path('check_generation_status/', quiz_views.check_generation_status, name='check_generation_status'),
+    path('generation_events/', quiz_views.generation_events, name='generation_events'),
+    path('pool_stats/', views.pool_stats, name='pool_stats'),
+    path('metrics', views.metrics, name='metrics'),
 ]
 
 # Añadir configuración de archivos estáticos en desarrollo
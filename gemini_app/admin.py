@@ -1,3 +1,10 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import StoredQuestion
+
+
+@admin.register(StoredQuestion)
+class StoredQuestionAdmin(admin.ModelAdmin):
+    list_display = ('id', 'topic', 'subtopic', 'difficulty', 'times_served', 'created_at')
+    list_filter = ('topic', 'difficulty')
+    search_fields = ('topic', 'subtopic')
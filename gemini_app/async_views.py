@@ -0,0 +1,138 @@
+# gemini_app/async_views.py
+# Versiones async de las vistas del quiz para despliegues ASGI.
+# La generación se ejecuta como tarea asyncio con el cliente async de Gemini,
+# de modo que una petición esperando preguntas no ocupa un hilo. El acceso a
+# la sesión y al ORM se delega a los helpers síncronos de views.py.
+from django.shortcuts import render
+from django.http import JsonResponse
+from django.views.decorators.http import require_http_methods
+from django.views.decorators.csrf import ensure_csrf_cookie
+from asgiref.sync import sync_to_async
+from django.conf import settings
+import asyncio
+import logging
+import time
+import uuid
+
+from .controllers.question_controller import GenerationQueueFull
+from . import views
+from .views import get_controller, DEFAULT_BATCH_SIZE, FINAL_GENERATION_STATES, SSE_KEEPALIVE_SECONDS
+
+# Intervalo con el que el stream async comprueba si la tarea cambió
+SSE_POLL_INTERVAL = 0.25
+
+logger = logging.getLogger(__name__)
+
+# Se ejecuta cuando la request que inició la generación ya terminó, así que
+# no puede usar el hilo de esa request
+_astore_generated_questions = sync_to_async(views._store_generated_questions, thread_sensitive=False)
+
+
+async def _start_async_generation(request):
+    """
+    Inicia la generación de preguntas como tarea en el event loop actual.
+
+    La sesión ya debe estar cargada, ya que aquí solo se modifica en memoria.
+
+    Args:
+        request: HttpRequest de Django con la sesión activa
+    """
+    task_id = str(uuid.uuid4())
+    try:
+        await get_controller().start_generation(
+            count=DEFAULT_BATCH_SIZE,
+            task_id=task_id,
+            callback=_astore_generated_questions,
+            coalesce=True,
+        )
+    except GenerationQueueFull as e:
+        views._reject_generation(request, e)
+        return
+
+    views._register_generation(request, task_id)
+
+
+async def _ainit_quiz(request):
+    """
+    Versión async de _init_quiz: prepara la sesión en un hilo y, si hace falta,
+    lanza la generación en el event loop.
+
+    Args:
+        request: HttpRequest de Django con la sesión activa
+    """
+    pending = []
+    await sync_to_async(views._init_quiz)(request, start_generation=pending.append)
+    if pending:
+        await _start_async_generation(request)
+
+
+@ensure_csrf_cookie
+async def index(request):
+    try:
+        # Manejo especial para solicitudes HEAD para evitar disparar la generación de preguntas
+        if request.method == 'HEAD':
+            return await sync_to_async(render)(request, 'base.html', {
+                'loading': True,
+                'message': 'Health check ping received'
+            })
+
+        await _ainit_quiz(request)
+        return await sync_to_async(views._render_index)(request)
+
+    except Exception as e:
+        logger.error(f"Error rendering quiz: {e}", exc_info=True)
+        return await sync_to_async(render)(request, 'error.html', {'error': str(e)})
+
+
+@require_http_methods(["GET"])
+async def check_generation_status(request):
+    """Endpoint async para verificar el estado de la generación de preguntas"""
+    status = await sync_to_async(views._generation_status_payload)(request)
+    return JsonResponse(status)
+
+
+@require_http_methods(["GET"])
+async def next_question(request):
+    error = await sync_to_async(views._advance_question)(request)
+    if error is not None:
+        return error
+
+    # Re-inicializar el quiz si es necesario (batch agotado)
+    await _ainit_quiz(request)
+    return await sync_to_async(views._next_question_response)(request)
+
+
+@require_http_methods(["GET"])
+async def generation_events(request):
+    """
+    Endpoint SSE async: igual que views.generation_events, pero espera en el
+    event loop comprobando la versión de la tarea en lugar de bloquear un hilo.
+    """
+    task_id = await request.session.aget('generation_task_id')
+    controller = get_controller()
+
+    async def stream():
+        yield "retry: 1000\n\n"
+        if not task_id:
+            yield views._sse_event(await controller.aget_generation_status(''))
+            return
+
+        version = 0
+        last_sent = time.monotonic()
+        deadline = last_sent + settings.QUIZ_SSE_MAX_DURATION
+        while time.monotonic() < deadline:
+            new_version = await controller.aget_generation_version(task_id)
+            if new_version and new_version == version:
+                if time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                    last_sent = time.monotonic()
+                    yield ": keepalive\n\n"
+                await asyncio.sleep(SSE_POLL_INTERVAL)
+                continue
+            version = new_version
+            status = await controller.aget_generation_status(task_id)
+            last_sent = time.monotonic()
+            yield views._sse_event(status)
+            if status.get('status') in FINAL_GENERATION_STATES:
+                return
+
+    return views._sse_response(stream())
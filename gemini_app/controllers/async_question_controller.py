@@ -0,0 +1,380 @@
+"""
+Asyncio variant of the Gemini question controller for ASGI deployments
+"""
+import asyncio
+import logging
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+from ..models.quiz_question import QuizQuestion
+from ..models.prompt_template import PromptTemplate, QuestionParameters
+from .question_controller import GEMINI_MODEL, GeminiQuestionController, GenerationQueueFull, InFlightGeneration
+from .incremental_parser import IncrementalQuestionParser
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncGeminiQuestionController(GeminiQuestionController):
+    """
+    GeminiQuestionController with native asyncio generation.
+
+    Generations started with `start_generation` run as tasks on the event loop
+    using the genai async client, so waiting on Gemini does not hold a thread.
+    The synchronous API (worker pool, warm pool, task registry) is inherited
+    unchanged and shares the same task registry.
+    """
+
+    def __init__(self, *args, max_async_generations: int = 1000, max_async_concurrency: int = 100, **kwargs):
+        """
+        Initialize the controller.
+
+        Args:
+            max_async_generations: Maximum number of async generations in flight or waiting
+            max_async_concurrency: Maximum number of concurrent async calls to the Gemini API
+            *args, **kwargs: Passed to GeminiQuestionController
+        """
+        super().__init__(*args, **kwargs)
+        self._max_async_generations = max_async_generations
+        self._max_async_concurrency = max_async_concurrency
+        self._async_semaphore: Optional[asyncio.Semaphore] = None
+        # Keep references so pending tasks are not garbage collected
+        self._async_tasks: Set[asyncio.Task] = set()
+        # Single-flight for async generations by question count, joinable until they start
+        self._async_inflight: Dict[int, InFlightGeneration] = {}
+
+    async def agenerate_questions(
+        self,
+        count: int,
+        task_id: Optional[str] = None
+    ) -> Optional[List[QuizQuestion]]:
+        """
+        Generate quiz questions using the async Gemini client.
+
+        Args:
+            count: Number of questions to generate
+            task_id: Optional unique identifier for tracking this generation task
+
+        Returns:
+            List of QuizQuestion objects or None if an error occurs
+        """
+        task_id = task_id or f"gen_{uuid.uuid4()}"
+
+        registered = await self._offload(
+            self._generation_tasks.create,
+            task_id,
+            status="in_progress",
+            started_at=time.time(),
+            progress=0,
+            message="Initializing question generation..."
+        )
+        if not registered:
+            logger.info(f"Generation task {task_id} already in progress")
+            return None
+
+        return await self._arun_generation(count, task_id)
+
+    async def _offload(self, function: Callable, *args, **kwargs):
+        """
+        Call a function that uses the task registry without blocking the event loop.
+
+        The in-memory registry is called directly; shared registries do IO
+        (cache, database or files), so the call runs in a thread.
+        """
+        if self._generation_tasks.blocking_io:
+            return await asyncio.to_thread(function, *args, **kwargs)
+        return function(*args, **kwargs)
+
+    async def aget_generation_status(self, task_id: str) -> Dict:
+        """Async counterpart of get_generation_status"""
+        return await self._offload(self.get_generation_status, task_id)
+
+    async def aget_generation_version(self, task_id: str) -> int:
+        """Async counterpart of get_generation_version"""
+        return await self._offload(self.get_generation_version, task_id)
+
+    async def start_generation(
+        self,
+        count: int,
+        task_id: Optional[str] = None,
+        callback: Optional[Callable[[Optional[List[QuizQuestion]]], Awaitable[None]]] = None,
+        coalesce: bool = False
+    ) -> Optional[asyncio.Task]:
+        """
+        Schedule a generation on the running event loop.
+
+        Registry calls run in a thread for shared registries (see _offload).
+
+        With `coalesce`, joins a coalescable async generation of the same size
+        that has not started yet instead of starting another one, taking its
+        own share of the enlarged batch (see GeminiQuestionController.submit_generation).
+
+        Args:
+            count: Number of questions to generate
+            task_id: Optional unique identifier for tracking this generation task
+            callback: Optional coroutine function awaited with the generated questions (or None)
+            coalesce: Allow joining an identical queued generation
+
+        Returns:
+            The asyncio.Task running the generation, or None if the task already exists
+
+        Raises:
+            GenerationQueueFull: If too many async generations are already pending
+        """
+        task_id = task_id or f"gen_{uuid.uuid4()}"
+        coalesce = coalesce and self.coalesce
+
+        flight = self._async_inflight.get(count) if coalesce else None
+        if self._can_follow(flight):
+            return await self._afollow_generation(task_id, callback, flight)
+        flight = InFlightGeneration(task_id, count, callback) if coalesce else None
+
+        if len(self._async_tasks) >= self._max_async_generations:
+            logger.warning(f"Async generation limit reached, rejecting task {task_id}")
+            raise GenerationQueueFull("Too many question generations in progress, try again later")
+
+        registered = asyncio.get_running_loop().create_future()
+
+        async def run():
+            # Registered from the task, so it is already joinable while the registry call runs
+            try:
+                registered.set_result(await self._offload(
+                    self._generation_tasks.create,
+                    task_id,
+                    status="queued",
+                    started_at=time.time(),
+                    progress=0,
+                    message="Waiting for a free generation worker...",
+                    **self._share_fields(flight)
+                ))
+            except Exception as e:
+                registered.set_exception(e)
+                return None
+            if not registered.result():
+                return None
+            async with self._get_semaphore():
+                questions = await self._arun_generation(self._start_flight(flight, count), task_id)
+            if callback:
+                try:
+                    await callback(questions)
+                except Exception as e:
+                    logger.error(f"Error in generation callback for {task_id}: {e}", exc_info=True)
+            return questions
+
+        task = self._track(run())
+        if flight is not None:
+            flight.handle = task
+            self._async_inflight[count] = flight
+            with self._inflight_lock:
+                self._coalesce_stats["leaders"] += 1
+            task.add_done_callback(lambda _: self._finish_async_inflight(flight))
+        if not await registered:
+            logger.info(f"Generation task {task_id} already in progress")
+            return None
+        return task
+
+    async def _afollow_generation(
+        self,
+        task_id: str,
+        callback: Optional[Callable],
+        flight: InFlightGeneration
+    ) -> Optional[asyncio.Task]:
+        """
+        Register `task_id` as a follower of a queued async generation.
+
+        Returns:
+            The leader's task, or a task awaiting it and then `callback` with this task's share
+        """
+        # The share is taken before the registry call, which may let the leader start;
+        # if registering fails it stays unused (the leader's callback still gets it)
+        flight.followers.append(task_id)
+        share = len(flight.followers)
+        registered = await self._offload(self._generation_tasks.create, task_id, **self._follower_fields(flight, share))
+        if not registered:
+            logger.info(f"Generation task {task_id} already in progress")
+            return None
+        logger.info(f"Task {task_id} coalesced into queued generation {flight.task_id}")
+        with self._inflight_lock:
+            self._coalesce_stats["followers"] += 1
+        if not callback or callback is flight.callback:
+            return flight.handle
+
+        async def follow():
+            # Shielded so a cancelled follower does not cancel the shared generation
+            questions = self._share_of(await asyncio.shield(flight.handle), share, flight.count)
+            try:
+                await callback(questions)
+            except Exception as e:
+                logger.error(f"Error in generation callback for {task_id}: {e}", exc_info=True)
+            return questions
+
+        return self._track(follow())
+
+    def _finish_async_inflight(self, flight: InFlightGeneration) -> None:
+        if self._async_inflight.get(flight.count) is flight:
+            del self._async_inflight[flight.count]
+
+    def _track(self, coroutine) -> asyncio.Task:
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._async_tasks.add(task)
+        task.add_done_callback(self._async_tasks.discard)
+        return task
+
+    async def _arun_generation(self, count: int, task_id: str) -> Optional[List[QuizQuestion]]:
+        """
+        Run a registered generation task with the async client.
+
+        Args:
+            count: Number of questions to generate
+            task_id: Identifier of a task already present in the registry
+
+        Returns:
+            List of QuizQuestion objects or None if an error occurs
+        """
+        try:
+            if self.fanout:
+                return await self._arun_fanout_generation(count, task_id)
+            prompt, question_params = await self._offload(self._prepare_prompt, count, task_id)
+            if self.streaming:
+                questions = await self._arun_streaming_generation(count, task_id, prompt, question_params)
+            else:
+                with self._model_call("batch") as timing:
+                    response = await self._asend("batch", prompt)
+                questions = await self._offload(self._process_response, task_id, response)
+                self._record_usage("batch", question_params, response, timing, questions)
+
+            missing = await self._offload(self._missing_prompt, task_id, count, questions)
+            if missing:
+                missing_prompt, missing_params = missing
+                try:
+                    with self._model_call("topup") as timing:
+                        response = await self._asend("topup", missing_prompt)
+                    merged = self._merge_missing(task_id, count, questions, response)
+                    self._record_usage("topup", missing_params, response, timing, merged[len(questions):])
+                    questions = merged
+                except Exception as e:
+                    logger.warning(f"Top-up request failed, keeping {len(questions)} questions: {e}")
+
+            return await self._offload(self._complete_generation, task_id, questions)
+        except Exception as e:
+            return await self._offload(self._fail_generation, task_id, e)
+
+    async def _arun_fanout_generation(self, count: int, task_id: str) -> List[QuizQuestion]:
+        """
+        Async counterpart of _run_fanout_generation.
+
+        Args:
+            count: Number of questions to generate
+            task_id: Identifier of a task already present in the registry
+
+        Returns:
+            List of QuizQuestion objects (may be shorter than `count` if items kept failing)
+        """
+        pending = PromptTemplate._generate_random_question_params(count)
+        questions: List[QuizQuestion] = []
+        await self._offload(
+            self._generation_tasks.update,
+            task_id,
+            status="in_progress",
+            message=f"Sending {count} requests to Gemini API...",
+            progress=10
+        )
+
+        for attempt in range(self.fanout_retries + 1):
+            tasks = {
+                asyncio.ensure_future(self._agenerate_single_question(params)): params
+                for params in pending
+            }
+            for future in asyncio.as_completed(list(tasks)):
+                question = None
+                try:
+                    question = await future
+                except Exception as e:
+                    logger.warning(f"Fan-out request failed: {e}")
+                if question is None:
+                    continue
+                questions.append(question)
+                await self._offload(self._publish_fanout_progress, task_id, count, questions)
+
+            # as_completed yields new awaitables, so failures are read back from the tasks
+            failed = [
+                params for task, params in tasks.items()
+                if task.exception() is not None or task.result() is None
+            ]
+            if not failed:
+                break
+            pending = failed
+        else:
+            logger.warning(f"{len(pending)} fan-out requests failed after {self.fanout_retries} retries")
+
+        return await self._offload(self._finish_fanout_generation, task_id, questions)
+
+    async def _agenerate_single_question(self, params: QuestionParameters) -> Optional[QuizQuestion]:
+        """Async counterpart of _generate_single_question"""
+        with self.metrics.timer("prompt_build_seconds"):
+            prompt = PromptTemplate.get_question_prompt(count=1, question_params=[params])
+        with self._model_call("direct") as timing:
+            response = await self._asend("direct", prompt)
+        parsed = self._parse_response(getattr(response, 'text', None) or "")
+        self._record_usage("direct", [params], response, timing, parsed)
+        return parsed[0] if parsed else None
+
+    async def _arun_streaming_generation(
+        self,
+        count: int,
+        task_id: str,
+        prompt: str,
+        question_params: Optional[List[QuestionParameters]] = None
+    ) -> List[QuizQuestion]:
+        """
+        Async counterpart of _run_streaming_generation.
+
+        Args:
+            count: Number of questions requested
+            task_id: Identifier of the generation task
+            prompt: Varying part of the prompt to send
+            question_params: Parameters of the questions in the prompt, for usage accounting
+
+        Returns:
+            List of QuizQuestion objects
+        """
+        parser = IncrementalQuestionParser()
+        questions: List[QuizQuestion] = []
+        chunks: List[str] = []
+        usage_chunk = None
+
+        with self._model_call("stream") as stream_timing:
+            async for chunk in await self.client.aio.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                **await self._aprompt_request(prompt)
+            ):
+                with stream_timing.parsing():
+                    await self._offload(self._consume_stream_chunk, task_id, count, parser, chunk, chunks, questions)
+                if getattr(chunk, 'usage_metadata', None) is not None:
+                    usage_chunk = chunk
+
+        questions = self._collect_streamed_questions(parser, chunks, questions, stream_timing.parse_seconds)
+        self._record_usage("stream", question_params, usage_chunk, stream_timing, questions)
+        return questions
+
+    async def _asend(self, call: str, prompt: str):
+        """Async counterpart of _send; a losing hedged request is cancelled"""
+        request = await self._aprompt_request(prompt)
+
+        def send():
+            return self.client.aio.models.generate_content(model=GEMINI_MODEL, **request)
+
+        if self.hedger is None:
+            return await send()
+        return await self.hedger.acall(call, send, is_valid=self._has_text)
+
+    async def _aprompt_request(self, prompt: str) -> Dict[str, Any]:
+        """Async counterpart of _generation_request, creating the prefix cache off the event loop when needed"""
+        if self.prompt_cache.is_fresh():
+            return self._generation_request(prompt)
+        return await asyncio.to_thread(self._generation_request, prompt)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the event loop that serves requests
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self._max_async_concurrency)
+        return self._async_semaphore
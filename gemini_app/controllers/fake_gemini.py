@@ -0,0 +1,234 @@
+"""
+Offline stand-in for the Gemini client, for tests, load tests and bulk generation dry runs
+"""
+import asyncio
+import itertools
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Tuple
+
+_PARAMS_PATTERN = re.compile(
+    r"- Tema: (?P<topic>.*)\n"
+    r"- Subtema: (?P<subtopic>.*)\n"
+    r"- Dificultad: (?P<difficulty>\d+)[^\n]*\n"
+    r"- Tipo de pregunta: (?P<question_type>\w+)"
+)
+_COUNT_PATTERN = re.compile(r"Número de preguntas: (\d+)")
+# Rough characters per token, for the simulated usage metadata
+_CHARS_PER_TOKEN = 4
+
+
+class FakeGeminiError(Exception):
+    """Simulated API failure raised by FakeGeminiClient"""
+
+
+class FakeGeminiClient:
+    """
+    Answers generate_content calls with valid questions built from the prompt.
+
+    Mirrors the parts of genai.Client the controllers use: `models`
+    (generate_content, generate_content_stream), `aio.models` and
+    `caches.create`. Each question follows the topic, subtopic, difficulty
+    and type requested in the prompt, and its text is numbered within a
+    random tag of the client, so every generated question is a new entry in
+    the question bank, also across runs.
+
+    Latency, failures and response size are configurable, and jitter and
+    failures are drawn from a seeded generator, so load tests are
+    repeatable. Responses carry usage metadata estimated from the prompt and
+    response lengths, counting cached prompt prefixes as cached tokens.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_per_question: float = 0.0,
+        latency_jitter: float = 0.0,
+        tail_rate: float = 0.0,
+        tail_latency: float = 0.0,
+        failure_rate: float = 0.0,
+        question_size: int = 0,
+        chunk_size: int = 256,
+        seed: Optional[int] = None,
+    ):
+        """
+        Initialize the client.
+
+        Args:
+            latency: Seconds each call takes before answering
+            latency_per_question: Extra seconds per question in the response
+            latency_jitter: Maximum random seconds added to each call
+            tail_rate: Probability (0-1) that a call is a slow outlier
+            tail_latency: Extra seconds taken by slow outliers
+            failure_rate: Probability (0-1) that a call raises FakeGeminiError
+            question_size: Approximate characters per question; the summary is
+                padded up to it (0 keeps questions minimal)
+            chunk_size: Characters per chunk of streamed responses
+            seed: Seed for jitter and failures
+        """
+        self.latency = latency
+        self.latency_per_question = latency_per_question
+        self.latency_jitter = latency_jitter
+        self.tail_rate = tail_rate
+        self.tail_latency = tail_latency
+        self.failure_rate = failure_rate
+        self.question_size = question_size
+        self.chunk_size = chunk_size
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        # Not drawn from the seeded generator, so seeded runs do not repeat questions
+        self._tag = uuid.uuid4().hex[:8]
+        self._cached_tokens: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.models = SimpleNamespace(
+            generate_content=self.generate_content,
+            generate_content_stream=self.generate_content_stream,
+        )
+        self.aio = SimpleNamespace(models=SimpleNamespace(
+            generate_content=self.agenerate_content,
+            generate_content_stream=self.agenerate_content_stream,
+        ))
+        self.caches = SimpleNamespace(create=self.create_cache)
+
+    def generate_content(self, model: str, contents: Any, config: Optional[Dict] = None):
+        text, delay = self._answer(contents)
+        time.sleep(delay)
+        return SimpleNamespace(text=text, usage_metadata=self._usage(contents, config, text))
+
+    def generate_content_stream(self, model: str, contents: Any, config: Optional[Dict] = None):
+        text, delay = self._answer(contents)
+        chunks = range(0, len(text), self.chunk_size)
+        # The delay is spread over the chunks, like a model producing tokens
+        for start in chunks:
+            time.sleep(delay / len(chunks))
+            yield self._chunk(contents, config, text, start)
+
+    async def agenerate_content(self, model: str, contents: Any, config: Optional[Dict] = None):
+        text, delay = self._answer(contents)
+        await asyncio.sleep(delay)
+        return SimpleNamespace(text=text, usage_metadata=self._usage(contents, config, text))
+
+    async def agenerate_content_stream(self, model: str, contents: Any, config: Optional[Dict] = None):
+        text, delay = self._answer(contents)
+        await asyncio.sleep(delay)
+
+        async def chunks():
+            for start in range(0, len(text), self.chunk_size):
+                yield self._chunk(contents, config, text, start)
+        return chunks()
+
+    def create_cache(self, model: str, config: Optional[Dict] = None):
+        tokens = len(self._prompt_text((config or {}).get("contents", ""))) // _CHARS_PER_TOKEN
+        with self._lock:
+            name = f"cachedContents/fake-{next(self._ids)}"
+            self._cached_tokens[name] = tokens
+            return SimpleNamespace(name=name)
+
+    def _chunk(self, contents: Any, config: Optional[Dict], text: str, start: int) -> SimpleNamespace:
+        """Streamed chunk starting at `start`; the last one carries the usage metadata"""
+        end = start + self.chunk_size
+        usage = self._usage(contents, config, text) if end >= len(text) else None
+        return SimpleNamespace(text=text[start:end], usage_metadata=usage)
+
+    def _usage(self, contents: Any, config: Optional[Dict], text: str) -> SimpleNamespace:
+        """Usage metadata of a call, like genai's GenerateContentResponseUsageMetadata"""
+        cached = self._cached_tokens.get((config or {}).get("cached_content"), 0)
+        prompt_tokens = len(self._prompt_text(contents)) // _CHARS_PER_TOKEN + cached
+        output_tokens = len(text) // _CHARS_PER_TOKEN
+        return SimpleNamespace(
+            prompt_token_count=prompt_tokens,
+            cached_content_token_count=cached or None,
+            candidates_token_count=output_tokens,
+            total_token_count=prompt_tokens + output_tokens,
+        )
+
+    @staticmethod
+    def _prompt_text(contents: Any) -> str:
+        return contents if isinstance(contents, str) else "\n".join(map(str, contents))
+
+    def get_stats(self) -> Dict[str, int]:
+        """Number of calls answered and of simulated failures"""
+        with self._lock:
+            return {"calls": self.calls, "failures": self.failures}
+
+    def _answer(self, contents: Any):
+        """Response text and delay of a call, or FakeGeminiError for a simulated failure"""
+        with self._lock:
+            failed = self._random.random() < self.failure_rate
+            jitter = self._random.uniform(0, self.latency_jitter) if self.latency_jitter else 0.0
+            if self.tail_rate and self._random.random() < self.tail_rate:
+                jitter += self.tail_latency
+            if failed:
+                self.failures += 1
+        if failed:
+            time.sleep(self.latency + jitter)
+            raise FakeGeminiError("Simulated Gemini API failure")
+        text, count = self._response(contents)
+        return text, self.latency + jitter + self.latency_per_question * count
+
+    def response_text(self, contents: Any) -> str:
+        """
+        Build the JSON array answering a question generation prompt.
+
+        Args:
+            contents: Prompt sent to the model (string or list of strings)
+
+        Returns:
+            JSON text with one question per parameter block in the prompt
+        """
+        return self._response(contents)[0]
+
+    def _response(self, contents: Any) -> Tuple[str, int]:
+        prompt = self._prompt_text(contents)
+        params = [match.groupdict() for match in _PARAMS_PATTERN.finditer(prompt)]
+        if not params:
+            count_match = _COUNT_PATTERN.search(prompt)
+            count = int(count_match.group(1)) if count_match else 1
+            params = [{
+                "topic": "General",
+                "subtopic": "General",
+                "difficulty": "3",
+                "question_type": "conceptual",
+            }] * count
+        with self._lock:
+            self.calls += 1
+            ids = [next(self._ids) for _ in params]
+        text = json.dumps(
+            [self._question(f"{self._tag}-{n}", p, self.question_size) for n, p in zip(ids, params)],
+            ensure_ascii=False,
+        )
+        return text, len(params)
+
+    @staticmethod
+    def _question(n: str, params: Dict[str, str], size: int = 0) -> Dict[str, Any]:
+        topic, subtopic = params["topic"].strip(), params["subtopic"].strip()
+        options: List[Dict[str, Any]] = [
+            {"label": f"Opción {k + 1} de la pregunta {n}", "answer": k == 0}
+            for k in range(5)
+        ]
+        summary = f"Respuesta de prueba sobre {subtopic}."
+        # About 400 characters are taken by the rest of the question
+        if size > 400 + len(summary):
+            summary += " " + "x" * (size - 400 - len(summary))
+        return {
+            "question": f"Pregunta de prueba {n} sobre {subtopic} ({topic})",
+            "clues": [f"Pista sobre {subtopic}"],
+            "questionType": params["question_type"],
+            "answerType": "respuesta_unica",
+            "options": options,
+            "metadata": {
+                "topic": topic,
+                "subtopic": subtopic,
+                "difficulty": int(params["difficulty"]),
+                "tags": ["fake"],
+            },
+            "summary": summary,
+            "references": [{"type": "book", "title": "Referencia de prueba", "authors": "Anónimo"}],
+        }
@@ -0,0 +1,259 @@
+"""
+Hedged model calls: a duplicate request is sent when a call is slower than most recent ones
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+from .metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def _percentile(values, pct: float) -> float:
+    """Nearest-rank percentile of a non-empty sequence"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(pct / 100 * len(ordered)), 1) - 1]
+
+
+class Hedger:
+    """
+    Sends a second copy of a model call that has not returned after the
+    `percentile` of the recent latencies of its kind, and returns the first
+    valid response.
+
+    Hedges are limited by a budget: every call earns `budget` of a hedge
+    (up to `burst` saved), and a hedge spends one. So at most about
+    `budget` extra calls are made per call, even when the API is slow
+    across the board. Calls are not hedged until `min_samples` latencies of
+    their kind have been seen.
+
+    A sync call that cannot be hedged (too few samples, or no budget left)
+    runs on the caller's thread. Otherwise both requests run on the hedger's
+    own pool, so the caller can return with the hedge while the primary is
+    still waiting. The losing request of a sync call cannot be cancelled; it
+    runs to the end and its response is passed to `on_discard`. Losing async
+    requests are cancelled.
+    """
+
+    def __init__(
+        self,
+        metrics: MetricsRegistry,
+        percentile: float = 95,
+        budget: float = 0.1,
+        burst: float = 10,
+        min_delay: float = 0.5,
+        min_samples: int = 20,
+        window: int = 200,
+        max_workers: int = 32,
+    ):
+        """
+        Initialize the hedger.
+
+        Args:
+            metrics: Registry where hedges are counted (see generation_metrics)
+            percentile: Percentile of recent latencies after which a call is hedged
+            budget: Hedges allowed per call (e.g. 0.1 for at most 10% extra calls)
+            burst: Maximum hedges saved up while calls are fast
+            min_delay: Minimum seconds before hedging, whatever the percentile
+            min_samples: Latencies of a call kind needed before it is hedged
+            window: Number of recent latencies kept per call kind
+            max_workers: Threads running sync requests that may be hedged, including
+                losing requests that have not returned yet
+        """
+        self.metrics = metrics
+        self.percentile = percentile
+        self.budget = budget
+        self.burst = burst
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self._window = window
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._tokens = burst
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-hedge")
+
+    def delay(self, call: str) -> Optional[float]:
+        """Seconds after which a call of this kind is hedged, or None while there are too few samples"""
+        with self._lock:
+            latencies = list(self._latencies.get(call, ()))
+        if len(latencies) < self.min_samples:
+            return None
+        return max(_percentile(latencies, self.percentile), self.min_delay)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hedge_tokens": round(self._tokens, 2),
+                "delays": {
+                    call: round(max(_percentile(values, self.percentile), self.min_delay), 3)
+                    for call, values in self._latencies.items() if len(values) >= self.min_samples
+                },
+            }
+
+    def _observe(self, call: str, seconds: float) -> None:
+        with self._lock:
+            latencies = self._latencies.get(call)
+            if latencies is None:
+                latencies = self._latencies[call] = deque(maxlen=self._window)
+            latencies.append(seconds)
+
+    def _earn(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.budget, self.burst)
+
+    def _has_budget(self) -> bool:
+        with self._lock:
+            return self._tokens >= 1
+
+    def _spend(self, call: str) -> bool:
+        """Take one hedge from the budget; counted as denied if there is none left"""
+        with self._lock:
+            allowed = self._tokens >= 1
+            if allowed:
+                self._tokens -= 1
+        if not allowed:
+            self.metrics.inc("hedges_denied_total", call=call)
+        return allowed
+
+    def _attempt(self, call: str, send: Callable[[], Any]) -> Any:
+        """Make one request and record its latency"""
+        started = time.perf_counter()
+        result = send()
+        self._observe(call, time.perf_counter() - started)
+        return result
+
+    def _start(self, call: str, send: Callable[[], Any]) -> Future:
+        """Run one attempt on the hedger's pool, so a slow loser never holds a generation worker"""
+        return self._executor.submit(self._attempt, call, send)
+
+    def call(
+        self,
+        call: str,
+        send: Callable[[], Any],
+        is_valid: Callable[[Any], bool] = lambda response: True,
+        on_discard: Optional[Callable[[Any], None]] = None,
+    ) -> Any:
+        """
+        Make a model call, hedged if it is slow.
+
+        Args:
+            call: Kind of call, used to keep latencies apart and as metrics label
+            send: Makes the request and returns its response
+            is_valid: Whether a response can be used; an invalid one only wins
+                if the other request fails too
+            on_discard: Called with the response of the losing request, if it succeeds
+
+        Returns:
+            The first valid response
+
+        Raises:
+            Exception: The error of the primary request, if no request succeeded
+        """
+        self._earn()
+        delay = self.delay(call)
+        if delay is None or not self._has_budget():
+            started = time.perf_counter()
+            result = self._attempt(call, send)
+            if delay is not None and time.perf_counter() - started > delay:
+                self.metrics.inc("hedges_denied_total", call=call)
+            return result
+
+        primary = self._start(call, send)
+        wait([primary], timeout=delay)
+        if primary.done() or not self._spend(call):
+            return primary.result()
+
+        logger.info(f"Hedging {call} call still running after {delay:.2f}s")
+        hedge = self._start(call, send)
+        pending = {primary, hedge}
+        fallback = error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    if future is primary or error is None:
+                        error = future.exception()
+                    continue
+                if not is_valid(future.result()) and pending:
+                    fallback = future
+                    continue
+                self.metrics.inc("hedges_total", call=call, winner="hedge" if future is hedge else "primary")
+                for loser in (pending | done | {fallback}) - {future, None}:
+                    loser.add_done_callback(lambda f: self._discard(f, on_discard))
+                return future.result()
+        self.metrics.inc("hedges_total", call=call, winner="none")
+        if fallback is not None:
+            return fallback.result()
+        raise error
+
+    @staticmethod
+    def _discard(future: Future, on_discard: Optional[Callable[[Any], None]]) -> None:
+        """Pass the response of a losing request to `on_discard`"""
+        if on_discard is None or future.exception() is not None:
+            return
+        try:
+            on_discard(future.result())
+        except Exception as e:
+            logger.warning(f"Error handling a discarded hedged response: {e}")
+
+    async def acall(
+        self,
+        call: str,
+        send: Callable[[], Awaitable[Any]],
+        is_valid: Callable[[Any], bool] = lambda response: True,
+    ) -> Any:
+        """
+        Async counterpart of call; the losing request is cancelled.
+
+        Args:
+            call: Kind of call, used to keep latencies apart and as metrics label
+            send: Returns a new awaitable making the request
+
+        Returns:
+            The first valid response
+        """
+        async def attempt():
+            started = time.perf_counter()
+            result = await send()
+            self._observe(call, time.perf_counter() - started)
+            return result
+
+        self._earn()
+        primary = asyncio.ensure_future(attempt())
+        pending = {primary}
+        fallback = error = None
+        try:
+            delay = self.delay(call)
+            if delay is not None:
+                await asyncio.wait(pending, timeout=delay)
+            if delay is None or primary.done() or not self._spend(call):
+                return await primary
+
+            logger.info(f"Hedging {call} call still running after {delay:.2f}s")
+            hedge = asyncio.ensure_future(attempt())
+            pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        if task is primary or error is None:
+                            error = task.exception()
+                        continue
+                    response = task.result()
+                    if not is_valid(response) and pending:
+                        fallback = response
+                        continue
+                    self.metrics.inc("hedges_total", call=call, winner="hedge" if task is hedge else "primary")
+                    return response
+        finally:
+            for task in pending:
+                task.cancel()
+        self.metrics.inc("hedges_total", call=call, winner="none")
+        if fallback is not None:
+            return fallback
+        raise error
@@ -0,0 +1,114 @@
+"""
+Incremental parser that extracts question objects from a streamed JSON array
+"""
+import json
+import logging
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class IncrementalQuestionParser:
+    """
+    Extract the objects of a JSON array as soon as each one is closed.
+
+    Text is fed in arbitrary chunks (as they arrive from a streaming
+    response). The parser tracks strings, escapes and nesting, and emits
+    every object that is a direct child of the question array: a top-level
+    array, or the value of the `questions` key of a top-level object. Arrays
+    inside a question (options, references) are never taken for it, so a
+    bare question object yields nothing. Markdown fences and any other text
+    outside the JSON are ignored. Only the text of the object being read is
+    buffered.
+    """
+
+    questions_key = "questions"
+
+    def __init__(self):
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._item_depth: Optional[int] = None
+        # Key being read / last key read in the top-level object, until the question array is found
+        self._key: Optional[List[str]] = None
+        self._last_key: Optional[str] = None
+        self._buffer: List[str] = []
+        self._capturing = False
+        self.parsed = 0
+        self.dropped = 0
+
+    @property
+    def truncated(self) -> bool:
+        """True if the text fed so far ends inside a question object"""
+        return self._capturing
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Consume a chunk of text.
+
+        Args:
+            text: Next chunk of the response
+
+        Returns:
+            List of the objects completed within this chunk
+        """
+        completed = []
+        segment_start = 0 if self._capturing else None
+
+        for i, char in enumerate(text):
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._key is not None:
+                        self._last_key = ''.join(self._key)
+                        self._key = None
+                    continue
+                if self._key is not None:
+                    self._key.append(char)
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._item_depth is None and len(self._stack) == 1 and self._stack[0] == '{':
+                    self._key = []
+            elif char == ',' and len(self._stack) == 1:
+                self._last_key = None
+            elif char in '[{':
+                if char == '[' and self._item_depth is None and (
+                    not self._stack
+                    or (self._stack == ['{'] and self._last_key == self.questions_key)
+                ):
+                    self._item_depth = len(self._stack) + 1
+                if char == '{' and len(self._stack) == self._item_depth:
+                    self._capturing = True
+                    segment_start = i
+                self._stack.append(char)
+            elif char in ']}':
+                if self._stack:
+                    self._stack.pop()
+                if char == '}' and self._capturing and len(self._stack) == self._item_depth:
+                    self._buffer.append(text[segment_start:i + 1])
+                    item = self._decode(''.join(self._buffer))
+                    if item is not None:
+                        completed.append(item)
+                    self._buffer = []
+                    self._capturing = False
+                    segment_start = None
+
+        if self._capturing and segment_start is not None:
+            self._buffer.append(text[segment_start:])
+        return completed
+
+    def _decode(self, raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            item = json.loads(raw)
+        except json.JSONDecodeError as e:
+            logger.warning(f"Dropping malformed question object: {e}")
+            self.dropped += 1
+            return None
+        self.parsed += 1
+        return item
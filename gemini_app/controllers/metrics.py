@@ -0,0 +1,273 @@
+"""
+Generation metrics in Prometheus text format, aggregated across worker processes
+"""
+import atexit
+import bisect
+import glob
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Bucket upper bounds; +Inf is implicit
+API_SECONDS_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 3, 5, 7.5, 10, 15, 20, 30, 60)
+CPU_SECONDS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+QUESTION_COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 10, 20, 50)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_key(labels: Dict[str, str]) -> str:
+    """Prometheus label set, e.g. `call="batch"`, used as the series key"""
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in sorted(labels.items()))
+
+
+class CallTiming:
+    """
+    Timing of an API call: its latency, set when the call ends, and the time
+    spent parsing inside it (streamed chunks), which is excluded from it
+    """
+
+    __slots__ = ("parse_seconds", "api_seconds")
+
+    def __init__(self):
+        self.parse_seconds = 0.0
+        self.api_seconds = 0.0
+
+    @contextmanager
+    def parsing(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.parse_seconds += time.perf_counter() - started
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms of one process, rendered in the Prometheus text
+    exposition format.
+
+    With a `directory`, each process also writes its values to its own file
+    there (at most every `flush_interval` seconds), and `render` sums the
+    files of every process, so a scrape served by any gunicorn worker
+    reports the totals of all of them. Files of exited workers are kept, so
+    counters never go backwards; clear the directory when the server starts.
+    """
+
+    def __init__(self, namespace: str, directory: Optional[str] = None, flush_interval: float = 1.0):
+        """
+        Initialize the registry.
+
+        Args:
+            namespace: Prefix of every metric name
+            directory: Directory shared by the worker processes (None keeps metrics per process)
+            flush_interval: Minimum seconds between writes of this process's file
+        """
+        self.namespace = namespace
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._counters: Dict[str, Dict[str, float]] = {}
+        self._histograms: Dict[str, Dict[str, Dict]] = {}
+        self._lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        self._last_flush = 0.0
+        self._pid = None
+        self._path = None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            atexit.register(self.flush)
+
+    def counter(self, name: str, help_text: str) -> None:
+        """Declare a counter"""
+        self._help[name] = ("counter", help_text)
+        self._counters[name] = {}
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float]) -> None:
+        """Declare a histogram with the given bucket upper bounds"""
+        self._help[name] = ("histogram", help_text)
+        self._buckets[name] = tuple(buckets)
+        self._histograms[name] = {}
+
+    def _check_pid(self) -> None:
+        """Start from zero with a file of its own in a forked process (e.g. gunicorn --preload)"""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid is not None:
+                for series in list(self._counters.values()) + list(self._histograms.values()):
+                    series.clear()
+                self._flush_timer = None
+            self._pid = os.getpid()
+            if self.directory:
+                # The token keeps a reused pid from overwriting an exited worker's file
+                self._path = os.path.join(self.directory, f"metrics-{self._pid}-{uuid.uuid4().hex[:8]}.json")
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        """Add `amount` to a counter"""
+        self._check_pid()
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + amount
+        self._schedule_flush()
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        """Record one value in a histogram"""
+        self._check_pid()
+        buckets = self._buckets[name]
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms[name].get(key)
+            if series is None:
+                series = self._histograms[name][key] = {"counts": [0] * (len(buckets) + 1), "sum": 0.0}
+            series["counts"][bisect.bisect_left(buckets, value)] += 1
+            series["sum"] += value
+        self._schedule_flush()
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observe the duration of the block in a histogram, also when it raises"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def snapshot(self) -> Dict:
+        """Copy of this process's values"""
+        with self._lock:
+            return {
+                "counters": {name: dict(series) for name, series in self._counters.items()},
+                "histograms": {
+                    name: {key: {"counts": list(s["counts"]), "sum": s["sum"]} for key, s in series.items()}
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def flush(self) -> None:
+        """Write this process's values to its file in the shared directory"""
+        if not self.directory:
+            return
+        self._check_pid()
+        with self._lock:
+            self._flush_timer = None
+            self._last_flush = time.monotonic()
+        temp_path = f"{self._path}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temp_path, self._path)
+        except OSError as e:
+            logger.warning(f"Could not write metrics file {self._path}: {e}")
+
+    def _schedule_flush(self) -> None:
+        if not self.directory:
+            return
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            delay = max(self._last_flush + self.flush_interval - time.monotonic(), 0)
+            # A pending write picks up every update made before it runs
+            self._flush_timer = threading.Timer(delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _collect(self) -> List[Dict]:
+        """Snapshots of every process, this one read from memory"""
+        self._check_pid()
+        snapshots = [self.snapshot()]
+        if not self.directory:
+            return snapshots
+        for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+            if path == self._path:
+                continue
+            try:
+                with open(path, encoding="utf-8") as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping metrics file {path}: {e}")
+        return snapshots
+
+    def render(self) -> str:
+        """
+        Render the metrics of all processes in the Prometheus text format.
+
+        Returns:
+            Exposition text, version 0.0.4
+        """
+        counters: Dict[str, Dict[str, float]] = {name: {} for name in self._counters}
+        histograms: Dict[str, Dict[str, Dict]] = {name: {} for name in self._histograms}
+        for snapshot in self._collect():
+            for name, series in snapshot.get("counters", {}).items():
+                if name not in counters:
+                    continue
+                for key, value in series.items():
+                    counters[name][key] = counters[name].get(key, 0) + value
+            for name, series in snapshot.get("histograms", {}).items():
+                if name not in histograms:
+                    continue
+                size = len(self._buckets[name]) + 1
+                for key, s in series.items():
+                    if len(s["counts"]) != size:
+                        # Written with different buckets (e.g. by an older release)
+                        continue
+                    total = histograms[name].setdefault(key, {"counts": [0] * size, "sum": 0.0})
+                    total["counts"] = [a + b for a, b in zip(total["counts"], s["counts"])]
+                    total["sum"] += s["sum"]
+
+        lines = []
+        for name, (kind, help_text) in self._help.items():
+            full_name = f"{self.namespace}_{name}"
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            if kind == "counter":
+                for key, value in sorted(counters[name].items()):
+                    lines.append(f"{full_name}{{{key}}} {value:g}" if key else f"{full_name} {value:g}")
+                continue
+            for key, series in sorted(histograms[name].items()):
+                cumulative = 0
+                bounds = [f"{b:g}" for b in self._buckets[name]] + ["+Inf"]
+                for bound, count in zip(bounds, series["counts"]):
+                    cumulative += count
+                    le = f'le="{bound}"'
+                    lines.append(f"{full_name}_bucket{{{key + ',' if key else ''}{le}}} {cumulative}")
+                suffix = f"{{{key}}}" if key else ""
+                lines.append(f"{full_name}_sum{suffix} {series['sum']:g}")
+                lines.append(f"{full_name}_count{suffix} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+def generation_metrics(directory: Optional[str] = None) -> MetricsRegistry:
+    """
+    Create the registry of question generation metrics.
+
+    Args:
+        directory: Directory shared by the worker processes, see MetricsRegistry
+
+    Returns:
+        MetricsRegistry with the generation counters and histograms declared
+    """
+    metrics = MetricsRegistry("quiz_generation", directory)
+    metrics.histogram("prompt_build_seconds", "Time spent building generation prompts", CPU_SECONDS_BUCKETS)
+    metrics.histogram("api_seconds", "Latency of model API calls, by call kind", API_SECONDS_BUCKETS)
+    metrics.histogram("parse_seconds", "Time spent parsing model responses", CPU_SECONDS_BUCKETS)
+    metrics.histogram("questions_per_call", "Valid questions obtained per model API call", QUESTION_COUNT_BUCKETS)
+    metrics.counter("api_errors_total", "Model API calls that raised, by call kind")
+    metrics.counter("generations_total", "Finished generation tasks, by status")
+    metrics.counter("salvaged_responses_total", "Responses that had to be salvaged")
+    metrics.counter("dropped_questions_total", "Invalid or truncated questions dropped from responses")
+    metrics.counter("hedges_total", "Duplicate requests sent for slow model calls, by call kind and winning request")
+    metrics.counter("hedges_denied_total", "Slow model calls not hedged because the hedge budget was spent")
+    metrics.counter("tokens_total", "Tokens used by model API calls, by kind (input includes cached) and call kind")
+    return metrics
@@ -0,0 +1,65 @@
+"""
+Model backends: the client the question controllers send generation requests to
+"""
+import logging
+import os
+from typing import Any, Dict, Optional
+from .fake_gemini import FakeGeminiClient
+
+logger = logging.getLogger(__name__)
+
+
+def build_gemini_client(api_key: Optional[str] = None):
+    """
+    Create the genai client for the Gemini API.
+
+    Args:
+        api_key: API key, defaults to the GOOGLE_API_KEY environment variable
+
+    Returns:
+        genai.Client instance
+
+    Raises:
+        ValueError: If no API key is set or the client cannot be created
+    """
+    # Imported on first use: the SDK is slow to import and not needed by
+    # the fake backend or management commands that never call the model
+    from google import genai
+
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    if not api_key:
+        logger.error("GOOGLE_API_KEY environment variable not set")
+        raise ValueError("GOOGLE_API_KEY environment variable not set")
+
+    try:
+        client = genai.Client(api_key=api_key)
+        logger.info("Gemini API client initialized successfully")
+        return client
+    except Exception as e:
+        logger.error(f"Gemini API client initialization failed: {e}")
+        raise ValueError(f"Gemini API client initialization failed: {e}")
+
+
+MODEL_BACKENDS = {
+    "gemini": build_gemini_client,
+    "fake": FakeGeminiClient,
+}
+
+
+def build_model_client(backend: str = "gemini", options: Optional[Dict[str, Any]] = None):
+    """
+    Create the client for a model backend name.
+
+    Args:
+        backend: "gemini" (the real API) or "fake" (FakeGeminiClient, offline)
+        options: Backend specific arguments (e.g. `api_key` for gemini,
+            `latency` or `failure_rate` for fake)
+
+    Returns:
+        A genai.Client or a client exposing the same interface
+    """
+    try:
+        factory = MODEL_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown model backend: {backend}")
+    return factory(**(options or {}))
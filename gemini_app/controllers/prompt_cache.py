@@ -0,0 +1,138 @@
+"""
+Cached context for the static part of the question generation prompt
+"""
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+from ..models.prompt_template import PromptTemplate
+
+logger = logging.getLogger(__name__)
+
+
+class LocalPromptCache:
+    """
+    Stand-in for the Gemini context cache that sends the static prefix inline.
+
+    Used when context caching is disabled, in tests, and as the fallback
+    when the prefix cannot be cached.
+    """
+
+    def __init__(self, prefix: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            prefix: Static part of the prompt, defaults to PromptTemplate.get_static_prefix()
+        """
+        self.prefix = prefix if prefix is not None else PromptTemplate.get_static_prefix()
+        self._lock = threading.Lock()
+        self._cached_requests = 0
+        self._inline_requests = 0
+
+    def request(self, prompt: str) -> Dict[str, Any]:
+        """
+        Build the generate_content arguments for a prompt.
+
+        Args:
+            prompt: Varying part of the prompt (see PromptTemplate.get_question_prompt)
+
+        Returns:
+            Dict with the `contents` and, when the prefix is cached, the `config` to send
+        """
+        with self._lock:
+            self._inline_requests += 1
+        return {"contents": self.prefix + prompt}
+
+    def is_fresh(self) -> bool:
+        """True if `request` will not need to call the API"""
+        return True
+
+    def get_stats(self) -> Dict:
+        """
+        Get the number of requests sent with and without the cached prefix
+
+        Returns:
+            Dict with cache statistics
+        """
+        with self._lock:
+            return {
+                "cache": None,
+                "cached_requests": self._cached_requests,
+                "inline_requests": self._inline_requests,
+            }
+
+
+class GeminiPromptCache(LocalPromptCache):
+    """
+    Registers the static prefix as a Gemini cached content, so each request
+    only sends the per-question part.
+
+    The cache is created on first use and recreated before its TTL runs out.
+    If creation fails (e.g. the prefix is below the model's minimum cacheable
+    size, or the model does not support caching) the prefix is sent inline
+    and creation is retried after another TTL.
+    """
+
+    # Fraction of the TTL after which the cache is recreated, so requests in
+    # flight never reference an expired cache
+    REFRESH_FRACTION = 0.9
+
+    def __init__(self, client, model: str, ttl: int = 3600, prefix: Optional[str] = None):
+        """
+        Initialize the cache.
+
+        Args:
+            client: genai.Client used to create the cached content
+            model: Model the cached content is created for; must match the generation model
+            ttl: Lifetime in seconds of each cached content
+            prefix: Static part of the prompt, defaults to PromptTemplate.get_static_prefix()
+        """
+        super().__init__(prefix)
+        self.client = client
+        self.model = model
+        self.ttl = ttl
+        self._name: Optional[str] = None
+        self._refresh_at = 0.0
+        self._create_lock = threading.Lock()
+
+    def request(self, prompt: str) -> Dict[str, Any]:
+        name = self._cache_name()
+        if name is None:
+            return super().request(prompt)
+        with self._lock:
+            self._cached_requests += 1
+        return {"contents": prompt, "config": {"cached_content": name}}
+
+    def is_fresh(self) -> bool:
+        return time.monotonic() < self._refresh_at
+
+    def get_stats(self) -> Dict:
+        stats = super().get_stats()
+        stats["cache"] = self._name
+        return stats
+
+    def _cache_name(self) -> Optional[str]:
+        """Name of the current cached content, creating it if needed (None on failure)"""
+        if self.is_fresh():
+            return self._name
+        with self._create_lock:
+            # Another thread may have refreshed it while we waited
+            if self.is_fresh():
+                return self._name
+            try:
+                cache = self.client.caches.create(
+                    model=self.model,
+                    config={
+                        "contents": [self.prefix],
+                        "ttl": f"{self.ttl}s",
+                        "display_name": "cs-quiz-prompt-prefix",
+                    },
+                )
+                self._name = cache.name
+                logger.info(f"Created prompt prefix cache {cache.name}")
+            except Exception as e:
+                self._name = None
+                logger.warning(f"Could not cache prompt prefix, sending it inline: {e}")
+            self._refresh_at = time.monotonic() + self.ttl * self.REFRESH_FRACTION
+            return self._name
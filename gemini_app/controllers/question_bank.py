@@ -0,0 +1,276 @@
+"""
+Persistent question bank backed by the StoredQuestion model
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Iterable, Dict, Any, Tuple
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F, Max, Min
+from ..models.quiz_question import QuizQuestion
+from ..models.question_bank import StoredQuestion
+from .question_controller import GenerationQueueFull
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionBank:
+    # Random primary keys tried per lookup round in `take`, per question wanted
+    sample_factor = 2
+    sample_rounds = 4
+    # Seconds the primary key range of a filter is reused by `take`
+    id_range_ttl = 60
+
+    def __init__(
+        self,
+        controller,
+        min_size: int = 50,
+        refill_batch: int = 5,
+        cache_size: int = 1000,
+        check_interval: float = 30,
+    ):
+        """
+        Initialize the question bank.
+
+        Args:
+            controller: GeminiQuestionController used to keep the bank stocked
+            min_size: Number of stored questions below which a refill is started
+            refill_batch: Number of questions requested per refill call
+            cache_size: Number of question payloads kept in the in-process LRU cache
+            check_interval: Seconds `ensure_stocked` trusts a count at or above `min_size`
+        """
+        self.controller = controller
+        self.min_size = min_size
+        self.refill_batch = refill_batch
+        self.check_interval = check_interval
+        self._refill_lock = threading.Lock()
+        self._refilling = False
+        self._next_check = 0.0
+        # (low, high, expiry) primary key range by filter, for random sampling
+        self._id_ranges: Dict[Tuple, Tuple[int, int, float]] = {}
+        # Stored questions never change, so cached payloads never go stale
+        self._cache_size = cache_size
+        self._cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def count(self, **filters) -> int:
+        """
+        Count the stored questions, optionally filtered by topic, subtopic or difficulty.
+        """
+        return StoredQuestion.objects.filter(**filters).count()
+
+    def store(self, questions: Iterable[QuizQuestion]) -> List[StoredQuestion]:
+        """
+        Persist generated questions, skipping the ones already in the bank.
+
+        Args:
+            questions: QuizQuestion objects to store
+
+        Returns:
+            List of StoredQuestion rows (new or pre-existing) for the given questions
+        """
+        stored = []
+        for question in questions:
+            row = StoredQuestion.from_question(question)
+            try:
+                with transaction.atomic():
+                    row.save()
+            except IntegrityError:
+                row = StoredQuestion.objects.get(fingerprint=row.fingerprint)
+            stored.append(row)
+        self._cache_rows(stored)
+        # New rows may fall outside the cached id ranges
+        self._id_ranges.clear()
+        return stored
+
+    def take(
+        self,
+        count: int,
+        exclude_ids: Iterable[int] = (),
+        topic: Optional[str] = None,
+        subtopic: Optional[str] = None,
+        difficulty: Optional[int] = None,
+    ) -> List[StoredQuestion]:
+        """
+        Pick up to `count` random stored questions.
+
+        Random primary keys are drawn from the (cached) id range of the
+        filter and looked up in batches; keys that are missing, filtered out
+        or excluded are retried with new draws. If the range is too sparse
+        for that, the rest is picked with a random ordering.
+
+        Args:
+            count: Number of questions wanted
+            exclude_ids: Question ids the caller has already served
+            topic: Optional topic filter
+            subtopic: Optional subtopic filter
+            difficulty: Optional difficulty filter
+
+        Returns:
+            List of StoredQuestion objects (may be shorter than `count`)
+        """
+        filters = {}
+        if topic:
+            filters['topic'] = topic
+        if subtopic:
+            filters['subtopic'] = subtopic
+        if difficulty:
+            filters['difficulty'] = difficulty
+        queryset = StoredQuestion.objects.filter(**filters)
+        id_range = self._id_range(queryset, filters)
+        if id_range is None:
+            return []
+
+        low, high = id_range
+        skip = set(exclude_ids)
+        picked = []
+        for _ in range(self.sample_rounds):
+            wanted = count - len(picked)
+            if wanted <= 0:
+                break
+            candidates = {random.randint(low, high) for _ in range(wanted * self.sample_factor)} - skip
+            skip |= candidates
+            rows = list(queryset.filter(pk__in=candidates))
+            random.shuffle(rows)
+            picked += rows[:wanted]
+        if len(picked) < count:
+            exclude = set(exclude_ids) | {q.pk for q in picked}
+            picked += list(queryset.exclude(pk__in=exclude).order_by('?')[:count - len(picked)])
+
+        if picked:
+            StoredQuestion.objects.filter(pk__in=[q.pk for q in picked]).update(
+                times_served=F('times_served') + 1
+            )
+        self._cache_rows(picked)
+        return picked
+
+    def _id_range(self, queryset, filters: Dict[str, Any]) -> Optional[Tuple[int, int]]:
+        """Lowest and highest primary key matching `filters`, or None if there are none"""
+        key = tuple(sorted(filters.items()))
+        cached = self._id_ranges.get(key)
+        if cached is not None and cached[2] > time.monotonic():
+            return cached[0], cached[1]
+        bounds = queryset.aggregate(low=Min('pk'), high=Max('pk'))
+        if bounds['low'] is None:
+            # Not cached, so the first stored question is seen right away
+            return None
+        self._id_ranges[key] = (bounds['low'], bounds['high'], time.monotonic() + self.id_range_ttl)
+        return bounds['low'], bounds['high']
+
+    def get_many(self, ids: Iterable[int]) -> List[StoredQuestion]:
+        """
+        Fetch stored questions by id, preserving the order of `ids`.
+        """
+        ids = list(ids)
+        rows = StoredQuestion.objects.in_bulk(ids)
+        return [rows[pk] for pk in ids if pk in rows]
+
+    def get_payloads(self, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        Get the question dicts of stored questions, served from the LRU cache when possible.
+
+        Args:
+            ids: Ids of stored questions
+
+        Returns:
+            Dict mapping each id found in the bank to its question dict (with an 'id' key)
+        """
+        found = {}
+        missing = []
+        with self._cache_lock:
+            for pk in ids:
+                payload = self._cache.get(pk)
+                if payload is None:
+                    missing.append(pk)
+                else:
+                    self._cache.move_to_end(pk)
+                    found[pk] = payload
+        if missing:
+            rows = self.get_many(missing)
+            self._cache_rows(rows)
+            found.update((row.pk, row.to_dict()) for row in rows)
+        return found
+
+    def get_payload(self, pk: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the question dict of a stored question, or None if it is not in the bank.
+        """
+        return self.get_payloads([pk]).get(pk)
+
+    def resolve_ids(self, questions: List[Dict[str, Any]]) -> List[int]:
+        """
+        Get the bank ids of question dicts, storing the ones not in the bank yet.
+
+        Args:
+            questions: Question dictionaries as produced by QuizQuestion.to_dict
+
+        Returns:
+            List of ids in the same order as `questions`
+        """
+        fingerprints = [StoredQuestion.fingerprint_for(q) for q in questions]
+        ids = dict(
+            StoredQuestion.objects.filter(fingerprint__in=fingerprints).values_list('fingerprint', 'pk')
+        )
+        missing = [q for q, fp in zip(questions, fingerprints) if fp not in ids]
+        if missing:
+            for row in self.store(QuizQuestion.from_dict(q) for q in missing):
+                ids[row.fingerprint] = row.pk
+        return [ids[fp] for fp in fingerprints]
+
+    def _cache_rows(self, rows: Iterable[StoredQuestion]) -> None:
+        with self._cache_lock:
+            for row in rows:
+                self._cache[row.pk] = row.to_dict()
+                self._cache.move_to_end(row.pk)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def ensure_stocked(self) -> bool:
+        """
+        Start a background refill if the bank is below its minimum size.
+
+        A stocked bank is not counted again for `check_interval` seconds, so
+        calling this on every batch load does not run a COUNT each time.
+
+        Returns:
+            True if a refill was started, False otherwise
+        """
+        if self._refilling or time.monotonic() < self._next_check:
+            return False
+        if self.count() >= self.min_size:
+            self._next_check = time.monotonic() + self.check_interval
+            return False
+
+        with self._refill_lock:
+            if self._refilling:
+                return False
+            self._refilling = True
+
+        try:
+            self.controller.submit_generation(
+                count=self.refill_batch,
+                task_id=f"bank_refill_{uuid.uuid4()}",
+                callback=self._store_refill,
+            )
+        except GenerationQueueFull:
+            logger.warning("Generation queue full, postponing question bank refill")
+            with self._refill_lock:
+                self._refilling = False
+            return False
+        return True
+
+    def _store_refill(self, questions: Optional[List[QuizQuestion]]):
+        """Store a refill batch generated by the controller's worker pool"""
+        try:
+            if questions:
+                stored = self.store(questions)
+                logger.info(f"Question bank refilled with {len(stored)} questions")
+            else:
+                logger.warning("Question bank refill returned no questions")
+        finally:
+            with self._refill_lock:
+                self._refilling = False
+            close_old_connections()
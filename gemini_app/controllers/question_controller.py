@@ -5,36 +5,350 @@ import json
 import logging
 import threading
 import time
-from google import genai
-from typing import List, Optional, Dict
+import uuid
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Callable, List, Optional, Dict, Tuple
 from ..models.quiz_question import QuizQuestion
-from ..models.prompt_template import PromptTemplate
-import os
+from ..models.prompt_template import PromptTemplate, QuestionParameters
+from .shared_task_registry import build_task_registry
+from .model_backend import build_model_client
+from .metrics import CallTiming, generation_metrics
+from .usage_accounting import UsageRecorder, usage_from_response
+from .hedging import Hedger
+from .incremental_parser import IncrementalQuestionParser
+from .prompt_cache import GeminiPromptCache, LocalPromptCache
+from .question_decoder import QuestionDecoder
+from ..models.response_schema import QUESTION_LIST_SCHEMA
 import re
 
 # Configure logging for the controller
 logger = logging.getLogger(__name__)
 
+GEMINI_MODEL = "gemini-2.0-flash"
+
+
+class GenerationQueueFull(Exception):
+    """Raised when a generation is submitted while the worker queue is full"""
+
+
+@dataclass
+class InFlightGeneration:
+    """
+    A coalescable generation that other tasks of the same size can join.
+
+    Followers join while the generation is still waiting for a worker; once
+    it starts, the batch is enlarged to one share of `count` questions per
+    task, so every task gets different questions.
+    """
+    task_id: str
+    count: int
+    callback: Optional[Callable]
+    handle: Any = None
+    followers: List[str] = field(default_factory=list)
+    started: bool = False
+
+    @property
+    def total(self) -> int:
+        """Questions to generate: one share for the leader and for each follower"""
+        return self.count * (1 + len(self.followers))
+
+
 class GeminiQuestionController:
-    def __init__(self):
+    # Followers a queued generation accepts; each one adds a share to its batch
+    max_followers = 4
+    
+    def __init__(
+        self,
+        pool_size: int = 0,
+        pool_refill_batch: int = 5,
+        task_ttl: float = 300,
+        max_tasks: int = 1000,
+        max_task_bytes: int = 10 * 1024 * 1024,
+        task_backend: str = "memory",
+        task_backend_options: Optional[Dict] = None,
+        max_workers: int = 4,
+        max_queue: int = 20,
+        streaming: bool = False,
+        fanout: bool = False,
+        fanout_concurrency: int = 5,
+        fanout_retries: int = 1,
+        context_cache: bool = False,
+        context_cache_ttl: int = 3600,
+        structured_output: bool = True,
+        topup_missing: bool = True,
+        coalesce: bool = True,
+        model_backend: str = "gemini",
+        model_backend_options: Optional[Dict] = None,
+        client=None,
+        metrics_dir: Optional[str] = None,
+        usage_accounting: bool = True,
+        usage_flush_interval: float = 10.0,
+        hedging: bool = False,
+        hedge_percentile: float = 95,
+        hedge_budget: float = 0.1,
+        hedge_min_delay: float = 0.5,
+        async_views: bool = False,
+    ):
         """
         Initialize the GeminiQuestionController with the provided API key.
+        
+        Args:
+            pool_size: Maximum number of ready questions kept in the warm pool (0 disables it)
+            pool_refill_batch: Number of questions requested per pool refill call
+            task_ttl: Seconds a generation task stays visible after its last update
+            max_tasks: Maximum number of generation tasks tracked at once
+            max_task_bytes: Maximum approximate size of the questions kept for tracked tasks
+            task_backend: Where generation tasks are tracked: "memory" (this process only),
+                "cache", "database" or "file" (shared by all worker processes)
+            task_backend_options: Backend specific arguments, see build_task_registry
+            max_workers: Maximum number of concurrent calls to the Gemini API
+            max_queue: Maximum number of submitted generations waiting for a worker
+            streaming: Stream Gemini responses and publish each question as soon as it is parsed
+            fanout: Send one request per question concurrently instead of a single batch prompt
+            fanout_concurrency: Maximum concurrent per-question requests across all fan-out generations
+            fanout_retries: Number of times a failed per-question request is retried
+            context_cache: Register the static prompt prefix as a Gemini cached content
+            context_cache_ttl: Lifetime in seconds of the cached prompt prefix
+            structured_output: Ask for JSON constrained to the question response schema
+            topup_missing: Request the questions missing from a short or damaged batch once
+            coalesce: Let coalescable submissions share an in-flight generation of the same size
+            model_backend: Client generation requests are sent to: "gemini" (the API,
+                needs GOOGLE_API_KEY) or "fake" (offline FakeGeminiClient)
+            model_backend_options: Backend specific arguments, see build_model_client
+            client: Pre-built client, used instead of creating one for `model_backend`
+            metrics_dir: Directory where each worker process writes its generation metrics,
+                so `metrics.render()` reports all of them (None keeps them per process)
+            usage_accounting: Record the token usage of every call per question parameters
+                in the GenerationUsage table
+            usage_flush_interval: Seconds between writes of the recorded token usage
+            hedging: Send a duplicate of a non-streamed call (batch, top-up or fan-out)
+                that is slower than most recent calls of its kind, and use the first
+                valid response; streamed generations are never hedged
+            hedge_percentile: Percentile of recent latencies after which a call is hedged
+            hedge_budget: Hedged calls allowed per call (e.g. 0.1 for at most 10% extra calls)
+            hedge_min_delay: Minimum seconds a call runs before it is hedged
+            async_views: Generations are started and tracked from the event loop of the
+                async views, so task backends that query the database are refused
         """
-        api_key = os.getenv("GOOGLE_API_KEY")
-        if not api_key:
-            logger.error("GOOGLE_API_KEY environment variable not set")
-            raise ValueError("GOOGLE_API_KEY environment variable not set")
+        self.client = client if client is not None else build_model_client(model_backend, model_backend_options)
+        
+        # Per-stage timings and counters, exported in Prometheus format
+        self.metrics = generation_metrics(metrics_dir)
+        
+        # Token usage per topic, subtopic, difficulty and question type
+        self.usage = UsageRecorder(model_backend, usage_flush_interval) if usage_accounting else None
+        
+        # Duplicate requests for calls in the latency tail, within a budget
+        self.hedger = (
+            Hedger(self.metrics, percentile=hedge_percentile, budget=hedge_budget, min_delay=hedge_min_delay)
+            if hedging else None
+        )
+        
+        # Track generation tasks in progress to avoid duplicates
+        self._generation_tasks = build_task_registry(
+            task_backend,
+            task_backend_options,
+            event_loop=async_views,
+            ttl=task_ttl,
+            max_entries=max_tasks,
+            max_bytes=max_task_bytes,
+        )
+        
+        # Static prompt prefix, cached server-side or sent inline with every request
+        self.prompt_cache = (
+            GeminiPromptCache(self.client, GEMINI_MODEL, ttl=context_cache_ttl)
+            if context_cache else LocalPromptCache()
+        )
+        
+        # JSON output constrained to the schema of the question dataclasses
+        self._generation_config = (
+            {"response_mime_type": "application/json", "response_schema": QUESTION_LIST_SCHEMA}
+            if structured_output else {}
+        )
+        self._decoder = QuestionDecoder()
+        self.topup_missing = topup_missing
+        self._parse_stats = {
+            "responses": 0,
+            "salvaged_responses": 0,
+            "dropped_questions": 0,
+            "topup_requests": 0,
+            "topup_questions": 0,
+        }
+        self._parse_stats_lock = threading.Lock()
+        
+        self.streaming = streaming
+        self.fanout = fanout
+        self.fanout_retries = fanout_retries
+        if self.hedger is not None and streaming and not fanout:
+            logger.warning(
+                "Hedging enabled with streaming generation: streamed batches are not hedged, "
+                "only top-up and direct calls"
+            )
+        # Separate pool for per-question requests, so fan-out generations
+        # running on the main pool never wait on their own workers
+        self._fanout_executor = (
+            ThreadPoolExecutor(max_workers=fanout_concurrency, thread_name_prefix="gemini-fanout")
+            if fanout else None
+        )
+        
+        # Fixed-size worker pool for generations; the semaphore bounds running + queued work
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-generation")
+        self._queue_slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._queued: List[str] = []
+        self._queue_lock = threading.Lock()
+        
+        # Single-flight: coalescable generations by question count, joinable until they start
+        self.coalesce = coalesce
+        self._inflight: Dict[int, InFlightGeneration] = {}
+        self._inflight_lock = threading.Lock()
+        self._coalesce_stats = {"leaders": 0, "followers": 0}
+        
+        # Process-wide pool of ready questions shared by all sessions
+        self._pool_size = pool_size
+        self._pool_refill_batch = pool_refill_batch
+        self._pool = deque(maxlen=pool_size or None)
+        self._pool_lock = threading.Lock()
+        self._pool_refilling = False
+        self._closed = False
+        self._pool_hits = 0
+        self._pool_misses = 0
+        # Optional hook called with every batch added to the pool
+        self.on_pool_refill: Optional[Callable[[List[QuizQuestion]], None]] = None
+    
+    def take_from_pool(self, count: int) -> Optional[List[QuizQuestion]]:
+        """
+        Take ready questions from the warm pool and trigger a background refill.
+        
+        Args:
+            count: Number of questions wanted
             
+        Returns:
+            List of `count` QuizQuestion objects, or None if the pool cannot cover the request
+        """
+        if not self._pool_size:
+            return None
+        
+        with self._pool_lock:
+            if len(self._pool) >= count:
+                questions = [self._pool.popleft() for _ in range(count)]
+                self._pool_hits += 1
+            else:
+                questions = None
+                self._pool_misses += 1
+        
+        self.refill_pool()
+        return questions
+    
+    def refill_pool(self) -> bool:
+        """
+        Start a background refill if the pool is below its capacity.
+        
+        Returns:
+            True if a refill was started, False otherwise
+        """
+        with self._pool_lock:
+            if self._closed or not self._pool_size or self._pool_refilling or len(self._pool) >= self._pool_size:
+                return False
+            self._pool_refilling = True
+        
+        threading.Thread(target=self._refill_pool_task, daemon=True).start()
+        return True
+    
+    def warm_pool(self) -> bool:
+        """
+        Fill the pool in the background, meant to be called when a worker boots.
+        
+        Returns:
+            True if a refill was started, False otherwise
+        """
+        logger.info(f"Warming question pool (capacity {self._pool_size})")
+        return self.refill_pool()
+    
+    def get_pool_stats(self) -> Dict:
+        """
+        Get the current size and the hit/miss counters of the warm pool
+        
+        Returns:
+            Dict with pool statistics
+        """
+        with self._pool_lock:
+            return {
+                "size": len(self._pool),
+                "capacity": self._pool_size,
+                "hits": self._pool_hits,
+                "misses": self._pool_misses,
+                "refilling": self._pool_refilling,
+            }
+    
+    def get_parse_stats(self) -> Dict:
+        """
+        Get counters of damaged responses, salvaged and dropped questions and top-up requests
+        
+        Returns:
+            Dict with parse statistics
+        """
+        with self._parse_stats_lock:
+            return dict(self._parse_stats)
+    
+    def _refill_pool_task(self):
+        """Generate batches until the pool is full or a generation fails"""
         try:
-            self.client = genai.Client(api_key=api_key)
-            logger.info("Gemini API client initialized successfully")
+            while True:
+                with self._pool_lock:
+                    if self._closed or len(self._pool) >= self._pool_size:
+                        break
+                
+                try:
+                    questions = self.submit_generation(
+                        count=self._pool_refill_batch,
+                        task_id=f"pool_refill_{uuid.uuid4()}"
+                    ).result()
+                except GenerationQueueFull:
+                    logger.warning("Generation queue full, postponing question pool refill")
+                    break
+                except RuntimeError as e:
+                    # The worker pool was shut down (shutdown() or interpreter exit)
+                    logger.info(f"Question pool refill stopped: {e}")
+                    break
+                if not questions:
+                    logger.warning("Question pool refill returned no questions")
+                    break
+                
+                if self.on_pool_refill:
+                    try:
+                        self.on_pool_refill(questions)
+                    except Exception as e:
+                        logger.error(f"Error in pool refill hook: {e}")
+                
+                with self._pool_lock:
+                    self._pool.extend(questions)
+                logger.info(f"Question pool refilled to {len(self._pool)}/{self._pool_size}")
         except Exception as e:
-            logger.error(f"Gemini API client initialization failed: {e}")
-            raise ValueError(f"Gemini API client initialization failed: {e}")
+            if self._closed:
+                logger.info(f"Question pool refill stopped: {e}")
+            else:
+                logger.error(f"Error refilling question pool: {e}")
+        finally:
+            with self._pool_lock:
+                self._pool_refilling = False
+    
+    def shutdown(self, wait: bool = True) -> None:
+        """
+        Stop refilling the warm pool and shut down the worker pools.
         
-        # Track generation tasks in progress to avoid duplicates
-        self._generation_tasks = {}
-        self._lock = threading.Lock()
+        Generations already running finish; queued ones are cancelled.
+        
+        Args:
+            wait: Block until the running generations have finished
+        """
+        with self._pool_lock:
+            self._closed = True
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+        if self._fanout_executor is not None:
+            self._fanout_executor.shutdown(wait=wait, cancel_futures=True)
         
     def is_generation_in_progress(self, task_id: str) -> bool:
         """
@@ -46,8 +360,211 @@ class GeminiQuestionController:
         Returns:
             True if the task is in progress, False otherwise
         """
-        with self._lock:
-            return task_id in self._generation_tasks
+        return task_id in self._generation_tasks
+    
+    def submit_generation(
+        self,
+        count: int,
+        task_id: Optional[str] = None,
+        callback: Optional[Callable[[Optional[List[QuizQuestion]]], None]] = None,
+        coalesce: bool = False
+    ) -> Future:
+        """
+        Queue a generation on the controller's worker pool.
+        
+        With `coalesce`, if another coalescable generation of the same size is
+        still queued, no new API call is made: `task_id` becomes a follower of
+        that generation, which then asks for `count` more questions. Each task
+        gets its own share of the batch in its status and callback, and the
+        shared future resolves to the whole batch.
+        
+        Args:
+            count: Number of questions to generate
+            task_id: Optional unique identifier for tracking this generation task
+            callback: Optional function called from the worker with the generated questions (or None)
+            coalesce: Allow joining an identical queued generation
+            
+        Returns:
+            Future resolving to the list of QuizQuestion objects or None
+            
+        Raises:
+            GenerationQueueFull: If all workers are busy and the queue is full
+        """
+        task_id = task_id or f"gen_{uuid.uuid4()}"
+        coalesce = coalesce and self.coalesce
+        
+        if not coalesce:
+            return self._submit_generation(count, task_id, callback)
+        
+        with self._inflight_lock:
+            flight = self._inflight.get(count)
+            if self._can_follow(flight):
+                return self._follow_generation(task_id, callback, flight)
+            flight = InFlightGeneration(task_id, count, callback)
+            flight.handle = self._submit_generation(count, task_id, callback, flight)
+            self._inflight[count] = flight
+            self._coalesce_stats["leaders"] += 1
+        flight.handle.add_done_callback(lambda _: self._finish_inflight(flight))
+        return flight.handle
+    
+    def _can_follow(self, flight: Optional[InFlightGeneration]) -> bool:
+        """Whether a new task can still join an in-flight generation (called with _inflight_lock held)"""
+        return flight is not None and not flight.started and len(flight.followers) < self.max_followers
+    
+    def _follow_generation(self, task_id: str, callback: Optional[Callable], flight: InFlightGeneration) -> Future:
+        """
+        Register `task_id` as a follower of a queued generation (called with _inflight_lock held).
+        
+        Returns:
+            The leader's future
+        """
+        if not self._register_follower(task_id, flight):
+            return flight.handle
+        self._coalesce_stats["followers"] += 1
+        share = len(flight.followers)
+        # The leader already ran this same callback (e.g. storing the batch) on the whole output
+        if callback and callback is not flight.callback:
+            flight.handle.add_done_callback(
+                lambda f: self._run_callback(task_id, callback, self._share_of(f.result(), share, flight.count))
+            )
+        return flight.handle
+    
+    def _register_follower(self, task_id: str, flight: InFlightGeneration) -> bool:
+        """
+        Register a follower task and give it the next share of the batch.
+        
+        Returns:
+            True if registered, False if the task already exists
+        """
+        registered = self._generation_tasks.create(task_id, **self._follower_fields(flight, len(flight.followers) + 1))
+        if not registered:
+            logger.info(f"Generation task {task_id} already in progress")
+            return False
+        flight.followers.append(task_id)
+        logger.info(f"Task {task_id} coalesced into queued generation {flight.task_id}")
+        return True
+    
+    @staticmethod
+    def _follower_fields(flight: InFlightGeneration, share: int) -> Dict:
+        """Registry fields of a task following `flight` with the given share of its batch"""
+        return {
+            "status": "queued",
+            "started_at": time.time(),
+            "progress": 0,
+            "message": "Joining a generation already in progress...",
+            "leader": flight.task_id,
+            "share": share,
+        }
+    
+    def _finish_inflight(self, flight: InFlightGeneration) -> None:
+        """Stop offering a finished generation to new followers"""
+        with self._inflight_lock:
+            if self._inflight.get(flight.count) is flight:
+                del self._inflight[flight.count]
+    
+    def _start_flight(self, flight: Optional[InFlightGeneration], count: int) -> int:
+        """
+        Close a coalescable generation to new followers as its worker picks it up.
+        
+        Returns:
+            Number of questions to generate for the leader and its followers
+        """
+        if flight is None:
+            return count
+        with self._inflight_lock:
+            flight.started = True
+            return flight.total
+    
+    @staticmethod
+    def _share_of(questions: Optional[List], share: int, size: int) -> Optional[List]:
+        """The `share`-th slice of `size` questions of a coalesced batch"""
+        if questions is None:
+            return None
+        return questions[share * size:(share + 1) * size]
+    
+    def get_coalescing_stats(self) -> Dict:
+        """
+        Get the number of coalescable generations started and the API calls saved by joining them
+        
+        Returns:
+            Dict with single-flight statistics
+        """
+        with self._inflight_lock:
+            stats = dict(self._coalesce_stats)
+            stats["in_flight"] = len(self._inflight)
+        stats["calls_saved"] = stats["followers"]
+        return stats
+    
+    def _run_callback(self, task_id: str, callback: Callable, questions: Optional[List[QuizQuestion]]) -> None:
+        """Call a generation callback, logging instead of raising on errors"""
+        try:
+            callback(questions)
+        except Exception as e:
+            logger.error(f"Error in generation callback for {task_id}: {e}", exc_info=True)
+    
+    def _submit_generation(
+        self,
+        count: int,
+        task_id: str,
+        callback: Optional[Callable[[Optional[List[QuizQuestion]]], None]],
+        flight: Optional[InFlightGeneration] = None
+    ) -> Future:
+        """Register a task and queue it on the worker pool (see submit_generation)"""
+        if not self._queue_slots.acquire(blocking=False):
+            logger.warning(f"Generation queue full, rejecting task {task_id}")
+            raise GenerationQueueFull("Too many question generations in progress, try again later")
+        
+        registered = self._generation_tasks.create(
+            task_id,
+            status="queued",
+            started_at=time.time(),
+            progress=0,
+            message="Waiting for a free generation worker...",
+            **self._share_fields(flight)
+        )
+        if not registered:
+            self._queue_slots.release()
+            logger.info(f"Generation task {task_id} already in progress")
+            future = Future()
+            future.set_result(None)
+            return future
+        
+        with self._queue_lock:
+            self._queued.append(task_id)
+        
+        def run():
+            with self._queue_lock:
+                self._queued.remove(task_id)
+            try:
+                questions = self._run_generation(self._start_flight(flight, count), task_id)
+            finally:
+                self._queue_slots.release()
+            if callback:
+                self._run_callback(task_id, callback, questions)
+            return questions
+        
+        return self._executor.submit(run)
+    
+    @staticmethod
+    def _share_fields(flight: Optional[InFlightGeneration]) -> Dict:
+        """Registry fields of a coalescable leader, whose own share is the first `count` questions"""
+        return {"share": 0, "share_size": flight.count} if flight is not None else {}
+    
+    def get_queue_position(self, task_id: str) -> int:
+        """
+        Get the position of a task in the generation queue
+        
+        Args:
+            task_id: Unique identifier for the generation task
+            
+        Returns:
+            1-based position in the queue, or 0 if the task is not waiting
+        """
+        with self._queue_lock:
+            try:
+                return self._queued.index(task_id) + 1
+            except ValueError:
+                return 0
             
     def get_generation_status(self, task_id: str) -> Dict:
         """
@@ -59,22 +576,80 @@ class GeminiQuestionController:
         Returns:
             Dict with status information
         """
-        with self._lock:
-            if task_id not in self._generation_tasks:
-                return {
-                    "status": "not_found",
-                    "message": "No generation task found with this ID"
-                }
+        task_id, task_info, share = self._resolve_task(task_id)
+        return self._build_status(task_id, task_info, share)
+    
+    def get_generation_version(self, task_id: str) -> int:
+        """
+        Get a counter that changes every time a generation task is updated
+        
+        Args:
+            task_id: Unique identifier for the generation task
+            
+        Returns:
+            Current version of the task, 0 if it does not exist
+        """
+        task_id, _, _ = self._resolve_task(task_id)
+        return self._generation_tasks.version(task_id)
+    
+    def wait_for_generation_update(self, task_id: str, version: int = 0, timeout: float = 15) -> Tuple[Dict, int]:
+        """
+        Wait until a generation task changes, for push-style progress updates
+        
+        Args:
+            task_id: Unique identifier for the generation task
+            version: Last version seen by the caller (0 returns immediately)
+            timeout: Maximum number of seconds to wait
+            
+        Returns:
+            Tuple of (status dict as returned by get_generation_status, current version)
+        """
+        task_id, _, share = self._resolve_task(task_id)
+        task_info, current = self._generation_tasks.wait_for_update(task_id, version, timeout)
+        return self._build_status(task_id, task_info, share), current
+    
+    def _resolve_task(self, task_id: str) -> Tuple[str, Optional[Dict], int]:
+        """
+        Follow a coalesced task to the generation it joined.
+        
+        Args:
+            task_id: Unique identifier for the generation task
             
-            task_info = self._generation_tasks[task_id]
+        Returns:
+            Tuple of (id of the task doing the work, its registry entry or None,
+            index of the caller's share of a coalesced batch)
+        """
+        task_info = self._generation_tasks.get(task_id)
+        if not task_info:
+            return task_id, task_info, 0
+        leader = task_info.get("leader")
+        if leader:
+            return leader, self._generation_tasks.get(leader), task_info.get("share", 0)
+        return task_id, task_info, task_info.get("share", 0)
+    
+    def _build_status(self, task_id: str, task_info: Optional[Dict], share: int = 0) -> Dict:
+        """Build the public status dict of a generation task (or of its share of a coalesced batch)"""
+        if task_info is None:
             return {
-                "status": task_info.get("status", "unknown"),
-                "started_at": task_info.get("started_at", 0),
-                "questions": task_info.get("questions", []),
-                "message": task_info.get("message", ""),
-                "progress": task_info.get("progress", 0)
+                "status": "not_found",
+                "message": "No generation task found with this ID"
             }
         
+        questions = task_info.get("questions", [])
+        if task_info.get("share_size"):
+            questions = self._share_of(questions, share, task_info["share_size"])
+        status = {
+            "status": task_info.get("status", "unknown"),
+            "started_at": task_info.get("started_at", 0),
+            "questions": questions,
+            "message": task_info.get("message", ""),
+            "progress": task_info.get("progress", 0),
+            "ready": len(questions)
+        }
+        if status["status"] == "queued":
+            status["queue_position"] = self.get_queue_position(task_id)
+        return status
+        
     def generate_questions(
         self, 
         count: int,
@@ -93,83 +668,599 @@ class GeminiQuestionController:
         # If no task_id provided, create one
         task_id = task_id or f"gen_{int(time.time())}"
         
-        # Check if this task is already in progress
-        with self._lock:
-            if task_id in self._generation_tasks:
-                logger.info(f"Generation task {task_id} already in progress")
-                return None
-            
-            # Register this task as in progress
-            self._generation_tasks[task_id] = {
-                "status": "in_progress",
-                "started_at": time.time(),
-                "progress": 0,
-                "message": "Initializing question generation..."
-            }
+        # Register this task as in progress, unless it already is
+        registered = self._generation_tasks.create(
+            task_id,
+            status="in_progress",
+            started_at=time.time(),
+            progress=0,
+            message="Initializing question generation..."
+        )
+        if not registered:
+            logger.info(f"Generation task {task_id} already in progress")
+            return None
+        
+        return self._run_generation(count, task_id)
+    
+    def _run_generation(self, count: int, task_id: str) -> Optional[List[QuizQuestion]]:
+        """
+        Run a registered generation task and record its progress.
         
+        Args:
+            count: Number of questions to generate
+            task_id: Identifier of a task already present in the registry
+            
+        Returns:
+            List of QuizQuestion objects or None if an error occurs
+        """
         try:
-            with self._lock:
-                self._generation_tasks[task_id]["message"] = "Sending request to Gemini API..."
-                self._generation_tasks[task_id]["progress"] = 10
+            if self.fanout:
+                return self._run_fanout_generation(count, task_id)
+            prompt, question_params = self._prepare_prompt(count, task_id)
+            if self.streaming:
+                questions = self._run_streaming_generation(count, task_id, prompt, question_params)
+            else:
+                with self._model_call("batch") as timing:
+                    response = self._send("batch", prompt, question_params)
+                questions = self._process_response(task_id, response)
+                self._record_usage("batch", question_params, response, timing, questions)
             
-            prompt = PromptTemplate.get_prompt_template(count=count)
-            logger.info(f"Sending request to Gemini API for {count} questions")
+            missing = self._missing_prompt(task_id, count, questions)
+            if missing:
+                missing_prompt, missing_params = missing
+                try:
+                    with self._model_call("topup") as timing:
+                        response = self._send("topup", missing_prompt, missing_params)
+                    merged = self._merge_missing(task_id, count, questions, response)
+                    self._record_usage("topup", missing_params, response, timing, merged[len(questions):])
+                    questions = merged
+                except Exception as e:
+                    logger.warning(f"Top-up request failed, keeping {len(questions)} questions: {e}")
             
-            with self._lock:
-                self._generation_tasks[task_id]["message"] = "Waiting for Gemini API response..."
-                self._generation_tasks[task_id]["progress"] = 30
+            return self._complete_generation(task_id, questions)
+        except Exception as e:
+            return self._fail_generation(task_id, e)
+    
+    def _run_fanout_generation(self, count: int, task_id: str) -> List[QuizQuestion]:
+        """
+        Generate each question with its own request and merge them as they complete.
+        
+        Failed items are retried individually up to `fanout_retries` times.
+        
+        Args:
+            count: Number of questions to generate
+            task_id: Identifier of a task already present in the registry
             
-            response = self.client.models.generate_content(
-                model="gemini-2.0-flash",
-                contents=prompt,
-            )
+        Returns:
+            List of QuizQuestion objects (may be shorter than `count` if items kept failing)
+        """
+        pending = PromptTemplate._generate_random_question_params(count)
+        questions: List[QuizQuestion] = []
+        self._generation_tasks.update(
+            task_id,
+            status="in_progress",
+            message=f"Sending {count} requests to Gemini API...",
+            progress=10
+        )
+        logger.info(f"Sending {count} fan-out requests to Gemini API")
+        
+        for attempt in range(self.fanout_retries + 1):
+            futures = {
+                self._fanout_executor.submit(self._generate_single_question, params): params
+                for params in pending
+            }
+            failed = []
+            for future in as_completed(futures):
+                question = None
+                try:
+                    question = future.result()
+                except Exception as e:
+                    logger.warning(f"Fan-out request failed: {e}")
+                if question is None:
+                    failed.append(futures[future])
+                    continue
+                questions.append(question)
+                self._publish_fanout_progress(task_id, count, questions)
             
-            with self._lock:
-                self._generation_tasks[task_id]["message"] = "Processing Gemini response..."
-                self._generation_tasks[task_id]["progress"] = 70
+            if not failed:
+                break
+            pending = failed
+            if attempt < self.fanout_retries:
+                logger.info(f"Retrying {len(failed)} failed fan-out requests")
+        else:
+            logger.warning(f"{len(pending)} fan-out requests failed after {self.fanout_retries} retries")
+        
+        return self._finish_fanout_generation(task_id, questions)
+    
+    def _generate_single_question(self, params: QuestionParameters) -> Optional[QuizQuestion]:
+        """
+        Request and parse a single question for the given parameters.
+        
+        Args:
+            params: Parameters of the question to generate
             
-            # Extract the text content from the response
-            if hasattr(response, 'text'):
-                response_text = response.text or ""
+        Returns:
+            The generated QuizQuestion or None if the response had no valid question
+        """
+        parsed = self.generate_for_params([params])
+        return parsed[0] if parsed else None
+    
+    def generate_for_params(self, question_params: List[QuestionParameters]) -> List[QuizQuestion]:
+        """
+        Request one batch of questions with explicit parameters and parse it.
+        
+        Runs on the calling thread and does not register a generation task,
+        so callers (e.g. bulk generation commands) control concurrency
+        themselves.
+        
+        Args:
+            question_params: Parameters of each question to generate
+            
+        Returns:
+            List of the valid QuizQuestion objects in the response (may be
+            shorter than `question_params`)
+            
+        Raises:
+            Exception: Errors from the Gemini API are propagated
+        """
+        with self.metrics.timer("prompt_build_seconds"):
+            prompt = PromptTemplate.get_question_prompt(
+                count=len(question_params),
+                question_params=question_params
+            )
+        with self._model_call("direct") as timing:
+            response = self._send("direct", prompt, question_params)
+        questions = self._parse_response(getattr(response, 'text', None) or "")
+        self._record_usage("direct", question_params, response, timing, questions)
+        return questions
+    
+    def _publish_fanout_progress(self, task_id: str, count: int, questions: List[QuizQuestion]) -> None:
+        """Publish the questions completed so far by a fan-out generation"""
+        self._generation_tasks.update(
+            task_id,
+            questions=[q.to_dict() for q in questions],
+            message=f"Generated {len(questions)} of {count} questions...",
+            progress=min(10 + 80 * len(questions) // max(count, 1), 90)
+        )
+    
+    def _finish_fanout_generation(self, task_id: str, questions: List[QuizQuestion]) -> List[QuizQuestion]:
+        """Mark a fan-out generation as completed, or failed if no item succeeded"""
+        if not questions:
+            raise ValueError("All fan-out requests failed")
+        logger.info(f"Generated {len(questions)} questions (fan-out)")
+        return self._complete_generation(task_id, questions)
+    
+    def _run_streaming_generation(
+        self,
+        count: int,
+        task_id: str,
+        prompt: str,
+        question_params: Optional[List[QuestionParameters]] = None
+    ) -> List[QuizQuestion]:
+        """
+        Stream the Gemini response and publish each question as soon as its object closes.
+        
+        Args:
+            count: Number of questions requested
+            task_id: Identifier of the generation task
+            prompt: Varying part of the prompt to send
+            question_params: Parameters of the questions in the prompt, for usage accounting
+            
+        Returns:
+            List of QuizQuestion objects
+        """
+        parser = IncrementalQuestionParser()
+        questions: List[QuizQuestion] = []
+        chunks: List[str] = []
+        # Usage metadata comes with the last chunks
+        usage_chunk = None
+        
+        with self._model_call("stream") as stream_timing:
+            for chunk in self.client.models.generate_content_stream(
+                model=GEMINI_MODEL,
+                **self._generation_request(prompt)
+            ):
+                with stream_timing.parsing():
+                    self._consume_stream_chunk(task_id, count, parser, chunk, chunks, questions)
+                if getattr(chunk, 'usage_metadata', None) is not None:
+                    usage_chunk = chunk
+        
+        questions = self._collect_streamed_questions(parser, chunks, questions, stream_timing.parse_seconds)
+        self._record_usage("stream", question_params, usage_chunk, stream_timing, questions)
+        return questions
+    
+    def _consume_stream_chunk(
+        self,
+        task_id: str,
+        count: int,
+        parser: IncrementalQuestionParser,
+        chunk,
+        chunks: List[str],
+        questions: List[QuizQuestion]
+    ) -> None:
+        """
+        Feed one streamed chunk to the parser and publish the questions it completes.
+        
+        Args:
+            task_id: Identifier of the generation task
+            count: Number of questions requested
+            parser: Incremental parser for this response
+            chunk: Streamed response chunk
+            chunks: Raw text received so far (appended to)
+            questions: Questions parsed so far (appended to)
+        """
+        text = getattr(chunk, 'text', None) or ""
+        chunks.append(text)
+        
+        new_questions = []
+        for item in parser.feed(text):
+            question = self._decoder.decode_item(item)
+            if question is not None:
+                new_questions.append(question)
             else:
-                response_text = str(response)
-                logger.warning(f"Response from Gemini API doesn't have text attribute")
-                
-            with self._lock:
-                self._generation_tasks[task_id]["message"] = "Parsing questions..."
-                self._generation_tasks[task_id]["progress"] = 90
-                
-            questions = self._parse_response(response_text)
-            logger.info(f"Generated {len(questions)} questions")
+                parser.dropped += 1
+        if not new_questions:
+            return
+        
+        questions.extend(new_questions)
+        self._generation_tasks.update(
+            task_id,
+            questions=[q.to_dict() for q in questions],
+            message=f"Generated {len(questions)} of {count} questions...",
+            progress=min(30 + 60 * len(questions) // max(count, 1), 90)
+        )
+    
+    def _collect_streamed_questions(
+        self,
+        parser: IncrementalQuestionParser,
+        chunks: List[str],
+        questions: List[QuizQuestion],
+        parse_seconds: float = 0.0
+    ) -> List[QuizQuestion]:
+        """
+        Gather the result of a finished stream.
+        
+        Falls back to parsing the full text when the incremental parser could
+        not find any question (e.g. a single bare object).
+        
+        Args:
+            parser: Incremental parser of the stream
+            chunks: Raw text received
+            questions: Questions parsed from the stream
+            parse_seconds: Time spent parsing chunks while streaming
+        
+        Returns:
+            List of QuizQuestion objects
+        """
+        if not questions:
+            return self._parse_response("".join(chunks))
+        
+        self.metrics.observe("parse_seconds", parse_seconds)
+        self.metrics.observe("questions_per_call", len(questions))
+        dropped = parser.dropped + int(parser.truncated)
+        self._record_parse(dropped, salvaged=bool(dropped))
+        logger.info(f"Generated {len(questions)} questions (streamed, {dropped} dropped)")
+        return questions
+    
+    @contextmanager
+    def _model_call(self, call: str):
+        """
+        Record the latency, and any error, of a model API call made in the block.
+        
+        Time spent parsing streamed chunks inside the block (see
+        CallTiming.parsing) is not counted as API latency.
+        
+        Args:
+            call: Kind of call, used as the `call` label ("batch", "stream", "topup", "direct")
+        """
+        timing = CallTiming()
+        started = time.perf_counter()
+        try:
+            yield timing
+        except Exception:
+            self.metrics.inc("api_errors_total", call=call)
+            raise
+        finally:
+            timing.api_seconds = time.perf_counter() - started - timing.parse_seconds
+            self.metrics.observe("api_seconds", timing.api_seconds, call=call)
+    
+    def _record_usage(
+        self,
+        call: str,
+        question_params: Optional[List[QuestionParameters]],
+        response,
+        timing: CallTiming,
+        questions: List[QuizQuestion],
+        requested: bool = True
+    ) -> None:
+        """
+        Count the tokens of a model call and attribute them to the questions it requested.
+        
+        Args:
+            call: Kind of call ("batch", "stream", "topup", "direct", "hedge_discarded")
+            question_params: Parameters of the questions in the prompt
+            response: Response (or last stream chunk) carrying the usage metadata
+            timing: Timing of the call, see _model_call
+            questions: Valid questions parsed from the response
+            requested: Count the questions as requested (see UsageRecorder.record)
+        """
+        usage = usage_from_response(response)
+        if usage is None:
+            return
+        self.metrics.inc("tokens_total", usage.input_tokens, kind="input", call=call)
+        self.metrics.inc("tokens_total", usage.cached_tokens, kind="cached", call=call)
+        self.metrics.inc("tokens_total", usage.output_tokens, kind="output", call=call)
+        if self.usage is not None and question_params:
+            self.usage.record(call, question_params, usage, timing.api_seconds, questions, requested)
+    
+    def _send(self, call: str, prompt: str, question_params: List[QuestionParameters]):
+        """
+        Send a prompt with generate_content, hedged when hedging is enabled.
+        
+        The tokens of a losing hedged request still count, under the
+        "hedge_discarded" call kind, without counting its questions again.
+        
+        Args:
+            call: Kind of call ("batch", "topup", "direct")
+            prompt: Varying part of the prompt
+            question_params: Parameters of the questions in the prompt
             
-            with self._lock:
-                self._generation_tasks[task_id]["status"] = "completed"
-                self._generation_tasks[task_id]["questions"] = [q.to_dict() for q in questions]
-                self._generation_tasks[task_id]["message"] = "Questions generated successfully"
-                self._generation_tasks[task_id]["progress"] = 100
+        Returns:
+            The generate_content response
+        """
+        request = self._generation_request(prompt)
+        
+        def send():
+            return self.client.models.generate_content(model=GEMINI_MODEL, **request)
+        
+        if self.hedger is None:
+            return send()
+        return self.hedger.call(
+            call,
+            send,
+            is_valid=self._has_text,
+            on_discard=lambda response: self._record_usage(
+                "hedge_discarded", question_params, response, CallTiming(), [], requested=False
+            ),
+        )
+    
+    @staticmethod
+    def _has_text(response) -> bool:
+        """Whether a response has text to parse; hedged calls prefer responses that do"""
+        return bool(getattr(response, 'text', None))
+    
+    def get_hedge_stats(self) -> Dict:
+        """Hedging state: remaining budget and current hedge delay per call kind"""
+        if self.hedger is None:
+            return {"enabled": False}
+        return {"enabled": True, **self.hedger.get_stats()}
+    
+    def _generation_request(self, prompt: str) -> Dict:
+        """
+        Build the generate_content arguments for a prompt.
+        
+        Args:
+            prompt: Varying part of the prompt
             
-            return questions
+        Returns:
+            Dict with the `contents` and `config` to send
+        """
+        return self._apply_generation_config(self.prompt_cache.request(prompt))
+    
+    def _apply_generation_config(self, request: Dict) -> Dict:
+        """Merge the structured output settings into the request config"""
+        if self._generation_config:
+            request["config"] = {**request.get("config", {}), **self._generation_config}
+        return request
+    
+    def _prepare_prompt(self, count: int, task_id: str) -> Tuple[str, List[QuestionParameters]]:
+        """
+        Build the prompt for a generation task and mark it as waiting for Gemini.
+        
+        Only the varying part is built here; the static prefix is added by
+        `prompt_cache` when the request is sent.
+        
+        Args:
+            count: Number of questions to generate
+            task_id: Identifier of a task already present in the registry
             
-        except Exception as e:
-            logger.error(f"Error during API call: {e}")
-            with self._lock:
-                self._generation_tasks[task_id]["status"] = "failed"
-                self._generation_tasks[task_id]["message"] = f"Error: {str(e)}"
+        Returns:
+            The per-request prompt string and the parameters of its questions
+        """
+        self._generation_tasks.update(
+            task_id,
+            status="in_progress",
+            message="Sending request to Gemini API...",
+            progress=10
+        )
+        
+        with self.metrics.timer("prompt_build_seconds"):
+            question_params = PromptTemplate._generate_random_question_params(count)
+            prompt = PromptTemplate.get_question_prompt(count=count, question_params=question_params)
+        logger.info(f"Sending request to Gemini API for {count} questions")
+        
+        self._generation_tasks.update(
+            task_id, message="Waiting for Gemini API response...", progress=30
+        )
+        return prompt, question_params
+    
+    def _process_response(self, task_id: str, response) -> List[QuizQuestion]:
+        """
+        Parse a Gemini response and record the progress of the generation task.
+        
+        Args:
+            task_id: Identifier of the generation task
+            response: Response returned by generate_content
+            
+        Returns:
+            List of QuizQuestion objects
+        """
+        self._generation_tasks.update(
+            task_id, message="Processing Gemini response...", progress=70
+        )
+        
+        # Extract the text content from the response
+        if hasattr(response, 'text'):
+            response_text = response.text or ""
+        else:
+            response_text = str(response)
+            logger.warning(f"Response from Gemini API doesn't have text attribute")
+            
+        self._generation_tasks.update(
+            task_id, message="Parsing questions...", progress=90
+        )
+            
+        questions = self._parse_response(response_text)
+        logger.info(f"Generated {len(questions)} questions")
+        return questions
+    
+    def _missing_prompt(
+        self, task_id: str, count: int, questions: List[QuizQuestion]
+    ) -> Optional[Tuple[str, List[QuestionParameters]]]:
+        """
+        Build the prompt for the questions a batch came short of.
+        
+        Args:
+            task_id: Identifier of the generation task
+            count: Number of questions requested
+            questions: Questions obtained so far
+            
+        Returns:
+            The prompt for the missing questions and their parameters, or None
+            if no top-up is needed
+        """
+        missing = count - len(questions)
+        if not self.topup_missing or missing <= 0:
             return None
-        finally:
-            # Keep the task info for status checks, but clean up after some time
-            def cleanup_task():
-                time.sleep(300)  # Keep task info for 5 minutes
-                with self._lock:
-                    if task_id in self._generation_tasks:
-                        del self._generation_tasks[task_id]
+        
+        logger.info(f"Requesting {missing} missing questions")
+        with self._parse_stats_lock:
+            self._parse_stats["topup_requests"] += 1
+        self._generation_tasks.update(
+            task_id,
+            questions=[q.to_dict() for q in questions],
+            message=f"Requesting {missing} missing questions...",
+        )
+        with self.metrics.timer("prompt_build_seconds"):
+            question_params = PromptTemplate._generate_random_question_params(missing)
+            return PromptTemplate.get_question_prompt(count=missing, question_params=question_params), question_params
+    
+    def _merge_missing(self, task_id: str, count: int, questions: List[QuizQuestion], response) -> List[QuizQuestion]:
+        """
+        Append the questions of a top-up response to a batch.
+        
+        Args:
+            task_id: Identifier of the generation task
+            count: Number of questions requested
+            questions: Questions obtained so far
+            response: Response to the prompt built by _missing_prompt
+            
+        Returns:
+            The combined list, at most `count` questions long
+        """
+        extra = self._parse_response(getattr(response, 'text', None) or "")[:count - len(questions)]
+        with self._parse_stats_lock:
+            self._parse_stats["topup_questions"] += len(extra)
+        logger.info(f"Top-up returned {len(extra)} questions")
+        return questions + extra
+    
+    def _complete_generation(self, task_id: str, questions: List[QuizQuestion]) -> List[QuizQuestion]:
+        """
+        Mark a generation task as completed.
+        
+        Args:
+            task_id: Identifier of the generation task
+            questions: Generated questions
             
-            threading.Thread(target=cleanup_task, daemon=True).start()
+        Returns:
+            The same list of QuizQuestion objects
+        """
+        self._generation_tasks.update(
+            task_id,
+            status="completed",
+            questions=[q.to_dict() for q in questions],
+            message="Questions generated successfully",
+            progress=100
+        )
+        self.metrics.inc("generations_total", status="completed")
+        
+        return questions
+    
+    def _fail_generation(self, task_id: str, error: Exception) -> None:
+        """
+        Mark a generation task as failed.
+        
+        Args:
+            task_id: Identifier of the generation task
+            error: Exception raised while generating
+        """
+        logger.error(f"Error during API call: {error}")
+        self.metrics.inc("generations_total", status="failed")
+        # The task info stays in the registry for status checks until its TTL expires
+        self._generation_tasks.update(
+            task_id, status="failed", message=f"Error: {str(error)}"
+        )
+        return None
     
     def _parse_response(self, response_text: str) -> List[QuizQuestion]:
         """
         Parse the response from the Gemini API and convert it into a list of QuizQuestion objects.
         
+        Structured output responses are a bare JSON array and go straight
+        through the validated decoder. If the text is not valid JSON (e.g.
+        truncated by the token limit or with a broken object) every
+        well-formed question is salvaged from it; anything else falls back to
+        the lenient parser.
+        
+        Args:
+            response_text: The text response from the Gemini API
+            
+        Returns:
+            List of QuizQuestion objects
+        """
+        with self.metrics.timer("parse_seconds"):
+            questions = self._decode_response(response_text)
+        self.metrics.observe("questions_per_call", len(questions))
+        return questions
+    
+    def _decode_response(self, response_text: str) -> List[QuizQuestion]:
+        """Strategies of _parse_response: validated decode, salvage, then the lenient parser"""
+        try:
+            questions, dropped = self._decoder.decode(response_text)
+            self._record_parse(dropped)
+            return questions
+        except ValueError:
+            pass
+        
+        questions, dropped = self._decoder.salvage(response_text)
+        if not questions:
+            # No question array (e.g. a single bare object) or nothing usable in it
+            loose = self._parse_loose_response(response_text)
+            if loose or not dropped:
+                return loose
+
+        if dropped:
+            logger.warning(f"Salvaged {len(questions)} questions from a damaged response ({dropped} dropped)")
+        self._record_parse(dropped, salvaged=bool(dropped))
+        return questions
+    
+    def _record_parse(self, dropped: int, salvaged: bool = False) -> None:
+        """Update the parse counters after a response has been parsed"""
+        with self._parse_stats_lock:
+            self._parse_stats["responses"] += 1
+            self._parse_stats["dropped_questions"] += dropped
+            if salvaged:
+                self._parse_stats["salvaged_responses"] += 1
+        if dropped:
+            self.metrics.inc("dropped_questions_total", dropped)
+        if salvaged:
+            self.metrics.inc("salvaged_responses_total")
+    
+    def _parse_loose_response(self, response_text: str) -> List[QuizQuestion]:
+        """
+        Parse a free-form response that may be wrapped in markdown or use a
+        different JSON shape (single object, or a `questions` key).
+        
         Args:
             response_text: The text response from the Gemini API
             
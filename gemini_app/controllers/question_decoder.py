@@ -0,0 +1,174 @@
+"""
+Validated decoder for structured question responses
+"""
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from ..models.quiz_question import QuizQuestion
+from ..models.response_schema import QUESTION_LIST_SCHEMA
+from .incremental_parser import IncrementalQuestionParser
+
+logger = logging.getLogger(__name__)
+
+Validator = Callable[[Any], None]
+
+
+class SchemaError(ValueError):
+    """Raised when a decoded value does not match the response schema"""
+
+
+def compile_schema(schema: Dict[str, Any], path: str = "$") -> Validator:
+    """
+    Compile a response schema into a validator function.
+
+    The schema is walked once; validating a value only runs the nested
+    checks, with no schema lookups.
+
+    Args:
+        schema: Schema dict as built by models.response_schema.schema_for
+        path: Location of the value, used in error messages
+
+    Returns:
+        Function that raises SchemaError if its argument does not match
+    """
+    kind = schema["type"]
+
+    if kind == "OBJECT":
+        properties = [
+            (name, compile_schema(sub, f"{path}.{name}"))
+            for name, sub in schema.get("properties", {}).items()
+        ]
+        required = tuple(schema.get("required", ()))
+
+        def check(value):
+            if not isinstance(value, dict):
+                raise SchemaError(f"{path}: expected an object")
+            for name in required:
+                if name not in value:
+                    raise SchemaError(f"{path}.{name}: missing required property")
+            for name, validate in properties:
+                if name in value:
+                    validate(value[name])
+
+    elif kind == "ARRAY":
+        validate_item = compile_schema(schema["items"], f"{path}[]")
+
+        def check(value):
+            if not isinstance(value, list):
+                raise SchemaError(f"{path}: expected an array")
+            for item in value:
+                validate_item(item)
+
+    elif kind == "STRING":
+        allowed = frozenset(schema["enum"]) if "enum" in schema else None
+
+        def check(value):
+            if not isinstance(value, str):
+                raise SchemaError(f"{path}: expected a string")
+            if allowed is not None and value not in allowed:
+                raise SchemaError(f"{path}: unexpected value {value!r}")
+
+    elif kind in ("INTEGER", "NUMBER", "BOOLEAN"):
+        expected = {"INTEGER": (int,), "NUMBER": (int, float), "BOOLEAN": (bool,)}[kind]
+
+        def check(value):
+            # bool is a subclass of int, so it is only accepted for BOOLEAN
+            if not isinstance(value, expected) or (kind != "BOOLEAN" and isinstance(value, bool)):
+                raise SchemaError(f"{path}: expected {kind.lower()}")
+
+    else:
+        raise TypeError(f"Unsupported schema type: {kind}")
+
+    if schema.get("nullable"):
+        validate_non_null = check
+
+        def check(value):
+            if value is not None:
+                validate_non_null(value)
+
+    return check
+
+
+class QuestionDecoder:
+    """
+    Decode a JSON array of questions and validate each one against the
+    response schema before building its QuizQuestion.
+
+    Invalid items are dropped one by one, so a single bad question does not
+    discard the rest of the response. Instances are stateless and can be
+    shared between threads.
+    """
+
+    def __init__(self, schema: Dict[str, Any] = QUESTION_LIST_SCHEMA):
+        """
+        Initialize the decoder.
+
+        Args:
+            schema: Schema of the response, an ARRAY of question objects
+        """
+        self._validate_item = compile_schema(schema["items"])
+        self._json = json.JSONDecoder()
+
+    def decode(self, text: str) -> Tuple[List[QuizQuestion], int]:
+        """
+        Decode a complete response.
+
+        Args:
+            text: Response text, expected to be a bare JSON array
+
+        Returns:
+            Tuple of (list of the valid questions, number of invalid items dropped)
+
+        Raises:
+            ValueError: If the text is not a JSON array
+        """
+        data = self._json.decode(text)
+        if not isinstance(data, list):
+            raise SchemaError("$: expected an array of questions")
+        return self._decode_items(data)
+
+    def salvage(self, text: str) -> Tuple[List[QuizQuestion], int]:
+        """
+        Recover every well-formed question from a damaged response.
+
+        The text is scanned with IncrementalQuestionParser, so markdown
+        fences, malformed objects and a response cut off in the middle of an
+        object only cost the affected questions.
+
+        Args:
+            text: Response text that failed to decode
+
+        Returns:
+            Tuple of (list of the valid questions, number of items dropped)
+        """
+        parser = IncrementalQuestionParser()
+        questions, invalid = self._decode_items(parser.feed(text))
+        return questions, invalid + parser.dropped + int(parser.truncated)
+
+    def _decode_items(self, items: List[Any]) -> Tuple[List[QuizQuestion], int]:
+        questions = []
+        for item in items:
+            question = self.decode_item(item)
+            if question is not None:
+                questions.append(question)
+        return questions, len(items) - len(questions)
+
+    def decode_item(self, item: Any) -> Optional[QuizQuestion]:
+        """
+        Validate one decoded question object.
+
+        Args:
+            item: Decoded JSON value of a single question
+
+        Returns:
+            The QuizQuestion, or None if the item is invalid
+        """
+        try:
+            self._validate_item(item)
+        except SchemaError as e:
+            logger.warning(f"Dropping invalid question: {e}")
+            return None
+        if not item["options"]:
+            logger.warning(f"Question missing options")
+            return None
+        return QuizQuestion.from_dict(item)
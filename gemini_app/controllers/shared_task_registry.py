@@ -0,0 +1,365 @@
+"""
+Generation task registries shared by all worker processes
+"""
+import abc
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, Dict, Optional, Tuple
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from ..models.generation_task import GenerationTask
+from .task_registry import TaskRegistry
+
+logger = logging.getLogger(__name__)
+
+Record = Dict[str, Any]
+
+
+class SharedTaskRegistry(abc.ABC):
+    """
+    Base class for task registries stored outside the process.
+
+    Exposes the same interface as TaskRegistry, so a status poll or an SSE
+    stream served by any gunicorn worker sees the tasks started by the others.
+    Each entry is stored as a record `{"fields": {...}, "version": n}`.
+
+    Creation is atomic in every backend, and after that a task is only
+    updated by the worker running it, so updates are plain read-modify-write.
+    There is no cross-process condition variable, so `wait_for_update` polls,
+    backing off from `poll_interval` to `max_poll_interval` while nothing changes.
+    """
+
+    poll_interval = 0.25
+    max_poll_interval = 2.0
+    # Every call does IO (cache, database or files), so async code runs it in a thread
+    blocking_io = True
+    # Whether the backend makes ORM calls, which Django refuses on an event loop
+    uses_orm = False
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1000, max_bytes: int = 10 * 1024 * 1024):
+        """
+        Initialize the registry.
+
+        Args:
+            ttl: Seconds an entry is kept after its last update
+            max_entries: Maximum number of tasks tracked at once (where the backend supports it)
+            max_bytes: Accepted for compatibility with TaskRegistry; shared backends bound entries by TTL and count
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+    def __contains__(self, task_id: str) -> bool:
+        return self._load(task_id) is not None
+
+    def create(self, task_id: str, **fields) -> bool:
+        """
+        Register a new task.
+
+        Returns:
+            True if the task was registered, False if it already exists
+        """
+        return self._add(task_id, {"fields": dict(fields), "version": 1})
+
+    def update(self, task_id: str, **fields) -> bool:
+        """
+        Update the information of a registered task and refresh its TTL.
+
+        Returns:
+            True if the task was updated, False if it is not registered
+        """
+        record = self._load(task_id)
+        if record is None:
+            return False
+        record["fields"].update(fields)
+        record["version"] += 1
+        self._store(task_id, record)
+        return True
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the information of a task, or None if it is not registered.
+        """
+        record = self._load(task_id)
+        return record["fields"] if record is not None else None
+
+    def version(self, task_id: str) -> int:
+        """
+        Get the current version of a task, 0 if it is not registered.
+        """
+        record = self._load(task_id)
+        return record["version"] if record is not None else 0
+
+    def wait_for_update(self, task_id: str, version: int, timeout: float) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Poll until a task changes past `version` or the timeout expires.
+
+        Returns:
+            Tuple of (task information or None if not registered, current version)
+        """
+        deadline = time.monotonic() + timeout
+        interval = self.poll_interval
+        while True:
+            record = self._load(task_id)
+            if record is None:
+                return None, 0
+            if record["version"] != version or time.monotonic() >= deadline:
+                return record["fields"], record["version"]
+            time.sleep(min(interval, max(deadline - time.monotonic(), 0)))
+            interval = min(interval * 2, self.max_poll_interval)
+
+    def remove(self, task_id: str) -> None:
+        """Forget a task immediately"""
+        self._delete(task_id)
+
+    @abc.abstractmethod
+    def _add(self, task_id: str, record: Record) -> bool:
+        """Store a new record; returns False if the task already exists"""
+
+    @abc.abstractmethod
+    def _load(self, task_id: str) -> Optional[Record]:
+        """Read a record, or None if the task is unknown or expired"""
+
+    @abc.abstractmethod
+    def _store(self, task_id: str, record: Record) -> None:
+        """Overwrite the record of an existing task"""
+
+    @abc.abstractmethod
+    def _delete(self, task_id: str) -> None:
+        """Remove a task's record if present"""
+
+
+class CacheTaskRegistry(SharedTaskRegistry):
+    """
+    Task registry on a Django cache.
+
+    The cache must be shared between processes (Redis, Memcached, database
+    or file cache); the default LocMemCache is per process. Entry count is
+    bounded by the cache's own culling.
+    """
+
+    def __init__(self, alias: str = "default", key_prefix: str = "quiz_task:", **kwargs):
+        """
+        Initialize the registry.
+
+        Args:
+            alias: Name of the cache in settings.CACHES
+            key_prefix: Prefix of the cache keys
+            **kwargs: Passed to SharedTaskRegistry
+        """
+        super().__init__(**kwargs)
+        self.cache = caches[alias]
+        self.key_prefix = key_prefix
+        self.uses_orm = isinstance(self.cache, DatabaseCache)
+
+    def _key(self, task_id: str) -> str:
+        # Hashed so any task id is a valid memcached key
+        return self.key_prefix + hashlib.sha1(task_id.encode("utf-8")).hexdigest()
+
+    def _add(self, task_id: str, record: Record) -> bool:
+        return self.cache.add(self._key(task_id), record, timeout=self.ttl)
+
+    def _load(self, task_id: str) -> Optional[Record]:
+        return self.cache.get(self._key(task_id))
+
+    def _store(self, task_id: str, record: Record) -> None:
+        self.cache.set(self._key(task_id), record, timeout=self.ttl)
+
+    def _delete(self, task_id: str) -> None:
+        self.cache.delete(self._key(task_id))
+
+
+class DatabaseTaskRegistry(SharedTaskRegistry):
+    """
+    Task registry on the GenerationTask model.
+
+    Expired rows are deleted, and the oldest rows beyond `max_entries`
+    dropped, whenever a task is created.
+    """
+
+    uses_orm = True
+
+    def _expires_at(self):
+        return timezone.now() + timedelta(seconds=self.ttl)
+
+    def _add(self, task_id: str, record: Record) -> bool:
+        self._purge()
+        try:
+            with transaction.atomic():
+                GenerationTask.objects.create(
+                    task_id=task_id,
+                    data=record["fields"],
+                    version=record["version"],
+                    expires_at=self._expires_at(),
+                )
+        except IntegrityError:
+            return False
+        return True
+
+    def _load(self, task_id: str) -> Optional[Record]:
+        row = (
+            GenerationTask.objects
+            .filter(task_id=task_id, expires_at__gt=timezone.now())
+            .values_list("data", "version")
+            .first()
+        )
+        return {"fields": row[0], "version": row[1]} if row else None
+
+    def _store(self, task_id: str, record: Record) -> None:
+        GenerationTask.objects.filter(task_id=task_id).update(
+            data=record["fields"],
+            version=record["version"],
+            expires_at=self._expires_at(),
+        )
+
+    def _delete(self, task_id: str) -> None:
+        GenerationTask.objects.filter(task_id=task_id).delete()
+
+    def _purge(self) -> None:
+        GenerationTask.objects.filter(expires_at__lte=timezone.now()).delete()
+        overflow = list(
+            GenerationTask.objects.order_by("-expires_at").values_list("pk", flat=True)[self.max_entries - 1:]
+        )
+        if overflow:
+            GenerationTask.objects.filter(pk__in=overflow).delete()
+
+
+class FileTaskRegistry(SharedTaskRegistry):
+    """
+    Task registry in a local directory, one JSON file per task.
+
+    A stand-in for the shared backends when all workers run on one host (and
+    for tests). Files are replaced atomically, and their mtime marks the last
+    update for TTL expiry.
+    """
+
+    def __init__(self, directory: Optional[str] = None, **kwargs):
+        """
+        Initialize the registry.
+
+        Args:
+            directory: Directory for the task files, created if missing
+            **kwargs: Passed to SharedTaskRegistry
+        """
+        super().__init__(**kwargs)
+        self.directory = directory or os.path.join(tempfile.gettempdir(), "cs_quiz_tasks")
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, task_id: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(task_id.encode("utf-8")).hexdigest() + ".json")
+
+    def _write_temp(self, record: Record) -> str:
+        temp_path = os.path.join(self.directory, f".{uuid.uuid4().hex}.tmp")
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(record, f, ensure_ascii=False)
+        return temp_path
+
+    def _add(self, task_id: str, record: Record) -> bool:
+        self._purge()
+        path = self._path(task_id)
+        temp_path = self._write_temp(record)
+        try:
+            # link() fails if the file exists, so creation is atomic
+            os.link(temp_path, path)
+            return True
+        except FileExistsError:
+            return False
+        finally:
+            os.remove(temp_path)
+
+    def _load(self, task_id: str) -> Optional[Record]:
+        path = self._path(task_id)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _store(self, task_id: str, record: Record) -> None:
+        os.replace(self._write_temp(record), self._path(task_id))
+
+    def _delete(self, task_id: str) -> None:
+        try:
+            os.remove(self._path(task_id))
+        except FileNotFoundError:
+            pass
+
+    def _purge(self) -> None:
+        now = time.time()
+        entries = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    mtime = entry.stat().st_mtime
+                except FileNotFoundError:
+                    continue
+                if mtime + self.ttl < now:
+                    self._remove_file(entry.path)
+                else:
+                    entries.append((mtime, entry.path))
+        if len(entries) >= self.max_entries:
+            entries.sort()
+            for _, path in entries[:len(entries) - self.max_entries + 1]:
+                self._remove_file(path)
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+TASK_REGISTRY_BACKENDS = {
+    "memory": TaskRegistry,
+    "cache": CacheTaskRegistry,
+    "database": DatabaseTaskRegistry,
+    "file": FileTaskRegistry,
+}
+
+
+def build_task_registry(
+    backend: str = "memory",
+    options: Optional[Dict[str, Any]] = None,
+    event_loop: bool = False,
+    **kwargs
+):
+    """
+    Create the task registry for a backend name.
+
+    Args:
+        backend: One of "memory", "cache", "database" or "file"
+        options: Backend specific arguments (e.g. `alias` for cache, `directory` for file)
+        event_loop: The registry is used from an event loop (async views), where
+            backends making ORM calls would raise SynchronousOnlyOperation
+        **kwargs: ttl, max_entries and max_bytes
+
+    Returns:
+        A TaskRegistry or SharedTaskRegistry instance
+
+    Raises:
+        ValueError: If the backend is unknown, or makes ORM calls and `event_loop` is set
+    """
+    try:
+        registry_class = TASK_REGISTRY_BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f"Unknown task registry backend: {backend}")
+    registry = registry_class(**kwargs, **(options or {}))
+    if event_loop and getattr(registry, "uses_orm", False):
+        raise ValueError(
+            f"Task registry backend '{backend}' makes database queries and cannot be used with async views; "
+            "use 'cache' with a non-database cache, 'file' or 'memory'"
+        )
+    return registry
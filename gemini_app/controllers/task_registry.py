@@ -0,0 +1,193 @@
+"""
+Bounded registry for tracking question generation tasks
+"""
+import itertools
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+
+class TaskRegistry:
+    """
+    In-memory registry of generation tasks with TTL expiry and size bounds.
+
+    Entries are kept in order of their last update, so expired entries are
+    always at the front and are evicted lazily on every access; no background
+    thread is needed. When the registry is over `max_entries` or `max_bytes`
+    the least recently updated entries are dropped first.
+
+    Every change bumps the entry's version, which lets callers block in
+    `wait_for_update` instead of polling.
+    """
+
+    # Calls only take an in-process lock, so async code may make them on the event loop
+    blocking_io = False
+
+    def __init__(self, ttl: float = 300, max_entries: int = 1000, max_bytes: int = 10 * 1024 * 1024):
+        """
+        Initialize the registry.
+
+        Args:
+            ttl: Seconds an entry is kept after its last update
+            max_entries: Maximum number of tasks tracked at once
+            max_bytes: Maximum approximate size of the stored question payloads
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._expires_at: Dict[str, float] = {}
+        self._sizes: Dict[str, int] = {}
+        self._total_bytes = 0
+        self._versions: Dict[str, int] = {}
+        self._version_counter = itertools.count(1)
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+
+    def __contains__(self, task_id: str) -> bool:
+        with self._lock:
+            self._evict_expired()
+            return task_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict_expired()
+            return len(self._entries)
+
+    @property
+    def total_bytes(self) -> int:
+        """Approximate size of the question payloads currently stored"""
+        return self._total_bytes
+
+    def create(self, task_id: str, **fields) -> bool:
+        """
+        Register a new task.
+
+        Args:
+            task_id: Unique identifier for the generation task
+            **fields: Initial task information
+
+        Returns:
+            True if the task was registered, False if it already exists
+        """
+        with self._lock:
+            self._evict_expired()
+            if task_id in self._entries:
+                return False
+            self._entries[task_id] = dict(fields)
+            self._sizes[task_id] = 0
+            self._touch(task_id)
+            self._enforce_bounds()
+            return True
+
+    def update(self, task_id: str, **fields) -> bool:
+        """
+        Update the information of a registered task and refresh its TTL.
+
+        Args:
+            task_id: Unique identifier for the generation task
+            **fields: Task information to overwrite
+
+        Returns:
+            True if the task was updated, False if it is not registered
+        """
+        with self._lock:
+            self._evict_expired()
+            entry = self._entries.get(task_id)
+            if entry is None:
+                return False
+            entry.update(fields)
+            if 'questions' in fields:
+                self._resize(task_id, self._estimate_size(fields['questions']))
+            self._touch(task_id)
+            self._enforce_bounds()
+            return True
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a shallow copy of a task's information.
+
+        Args:
+            task_id: Unique identifier for the generation task
+
+        Returns:
+            Dict with the task information or None if it is not registered
+        """
+        with self._lock:
+            self._evict_expired()
+            entry = self._entries.get(task_id)
+            return dict(entry) if entry is not None else None
+
+    def version(self, task_id: str) -> int:
+        """
+        Get the current version of a task, 0 if it is not registered.
+        """
+        with self._lock:
+            self._evict_expired()
+            return self._versions.get(task_id, 0)
+
+    def wait_for_update(self, task_id: str, version: int, timeout: float) -> Tuple[Optional[Dict[str, Any]], int]:
+        """
+        Block until a task changes past `version` or the timeout expires.
+
+        Args:
+            task_id: Unique identifier for the generation task
+            version: Last version seen by the caller (0 for none)
+            timeout: Maximum number of seconds to wait
+
+        Returns:
+            Tuple of (copy of the task information or None if not registered, current version)
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                self._evict_expired()
+                current = self._versions.get(task_id)
+                if current is None:
+                    return None, 0
+                remaining = deadline - time.monotonic()
+                if current != version or remaining <= 0:
+                    return dict(self._entries[task_id]), current
+                self._changed.wait(remaining)
+
+    def remove(self, task_id: str) -> None:
+        """Forget a task immediately"""
+        with self._lock:
+            self._drop(task_id)
+
+    def _touch(self, task_id: str) -> None:
+        self._expires_at[task_id] = time.monotonic() + self.ttl
+        self._entries.move_to_end(task_id)
+        self._versions[task_id] = next(self._version_counter)
+        self._changed.notify_all()
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        while self._entries:
+            oldest = next(iter(self._entries))
+            if self._expires_at[oldest] > now:
+                break
+            self._drop(oldest)
+
+    def _enforce_bounds(self) -> None:
+        while self._entries and (
+            len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes
+        ):
+            self._drop(next(iter(self._entries)))
+
+    def _resize(self, task_id: str, size: int) -> None:
+        self._total_bytes += size - self._sizes.get(task_id, 0)
+        self._sizes[task_id] = size
+
+    def _drop(self, task_id: str) -> None:
+        if self._entries.pop(task_id, None) is None:
+            return
+        self._expires_at.pop(task_id, None)
+        self._versions.pop(task_id, None)
+        self._total_bytes -= self._sizes.pop(task_id, 0)
+
+    @staticmethod
+    def _estimate_size(value: Any) -> int:
+        return len(json.dumps(value, ensure_ascii=False, separators=(',', ':')))
@@ -0,0 +1,201 @@
+"""
+Token usage accounting of model calls, attributed to the parameters of the questions they requested
+"""
+import atexit
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from ..models.generation_usage import GenerationUsage
+from ..models.prompt_template import QuestionParameters
+from ..models.quiz_question import QuizQuestion
+
+logger = logging.getLogger(__name__)
+
+KEY_FIELDS = ("date", "backend", "topic", "subtopic", "difficulty", "question_type", "call", "batch_size")
+VALUE_FIELDS = ("requested", "questions", "input_tokens", "cached_tokens", "output_tokens", "api_seconds")
+
+
+class CallUsage(NamedTuple):
+    """Tokens of one model call; `input_tokens` includes the cached ones"""
+    input_tokens: int
+    cached_tokens: int
+    output_tokens: int
+
+
+def usage_from_response(response) -> Optional[CallUsage]:
+    """
+    Read the token counts of a generate_content response (or last stream chunk).
+
+    Thinking tokens are billed as output and counted with it.
+
+    Args:
+        response: Response with a `usage_metadata` attribute
+
+    Returns:
+        CallUsage, or None if the response carries no usage metadata
+    """
+    metadata = getattr(response, "usage_metadata", None)
+    if metadata is None:
+        return None
+    return CallUsage(
+        input_tokens=getattr(metadata, "prompt_token_count", None) or 0,
+        cached_tokens=getattr(metadata, "cached_content_token_count", None) or 0,
+        output_tokens=(
+            (getattr(metadata, "candidates_token_count", None) or 0)
+            + (getattr(metadata, "thoughts_token_count", None) or 0)
+        ),
+    )
+
+
+def _split(total: float, parts: int) -> List[float]:
+    """Split an integer total in `parts` shares that add up to it (floats are split evenly)"""
+    if isinstance(total, float):
+        return [total / parts] * parts
+    base, extra = divmod(total, parts)
+    return [base + (i < extra) for i in range(parts)]
+
+
+def _delivered(params: List[QuestionParameters], questions: List[QuizQuestion]) -> List[int]:
+    """
+    Which requested questions were delivered, 1 or 0 per parameter set.
+
+    Questions are matched to the parameters with the same topic, subtopic
+    and difficulty; questions the model labelled differently fill the
+    remaining parameters in order.
+    """
+    delivered = [0] * len(params)
+    unmatched = 0
+    for question in questions:
+        key = (question.metadata.topic, question.metadata.subtopic, question.metadata.difficulty)
+        for i, p in enumerate(params):
+            if not delivered[i] and (p.topic, p.subtopic, p.difficulty) == key:
+                delivered[i] = 1
+                break
+        else:
+            unmatched += 1
+    for i in range(len(params)):
+        if unmatched and not delivered[i]:
+            delivered[i] = 1
+            unmatched -= 1
+    return delivered
+
+
+class UsageRecorder:
+    """
+    Accumulates the token usage of model calls per question parameters and
+    adds it to the GenerationUsage rows of the day.
+
+    Recording only updates memory; the totals are written by a background
+    thread at most every `flush_interval` seconds (and at exit), so model
+    calls never wait on the database and it can be used from async code.
+    Worker processes add to the same rows.
+    """
+
+    def __init__(self, backend: str, flush_interval: float = 10.0):
+        """
+        Initialize the recorder.
+
+        Args:
+            backend: Model backend the calls are made to, stored with the usage
+                so simulated calls are kept apart from billed ones
+            flush_interval: Seconds between writes to the database
+        """
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self._pending: Dict[Tuple, List[float]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_timer: Optional[threading.Timer] = None
+        atexit.register(self.flush)
+
+    def record(
+        self,
+        call: str,
+        question_params: List[QuestionParameters],
+        usage: CallUsage,
+        api_seconds: float,
+        questions: List[QuizQuestion],
+        requested: bool = True,
+    ) -> None:
+        """
+        Attribute the usage of one call to the questions it requested.
+
+        Args:
+            call: Kind of call ("batch", "stream", "topup", "direct", "hedge_discarded")
+            question_params: Parameters of the questions in the prompt
+            usage: Token counts of the call
+            api_seconds: Latency of the call
+            questions: Valid questions parsed from its response
+            requested: Count the questions as requested; False for calls whose questions
+                are already counted under another call (e.g. a discarded hedge)
+        """
+        if not question_params:
+            return
+        parts = len(question_params)
+        date = timezone.now().date()
+        shares = zip(
+            [int(requested)] * parts,
+            _delivered(question_params, questions),
+            _split(usage.input_tokens, parts),
+            _split(usage.cached_tokens, parts),
+            _split(usage.output_tokens, parts),
+            _split(float(api_seconds), parts),
+        )
+        with self._lock:
+            for p, values in zip(question_params, shares):
+                key = (date, self.backend, p.topic, p.subtopic, p.difficulty, p.question_type.value, call, parts)
+                totals = self._pending.setdefault(key, [0] * len(VALUE_FIELDS))
+                for i, value in enumerate(values):
+                    totals[i] += value
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self._flush_in_background)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+
+    def pending(self) -> int:
+        """Number of aggregate rows not written yet"""
+        with self._lock:
+            return len(self._pending)
+
+    def _flush_in_background(self) -> None:
+        try:
+            self.flush()
+        finally:
+            # The timer thread's connection is not reused
+            connection.close()
+
+    def flush(self) -> None:
+        """Add the accumulated usage to the database; kept for the next flush if it fails"""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._flush_timer = None
+            if not pending:
+                return
+            try:
+                close_old_connections()
+                with transaction.atomic():
+                    for key, values in pending.items():
+                        self._add_row(dict(zip(KEY_FIELDS, key)), dict(zip(VALUE_FIELDS, values)))
+            except Exception as e:
+                logger.warning(f"Could not write token usage of {len(pending)} rows, retrying later: {e}")
+                with self._lock:
+                    for key, values in pending.items():
+                        totals = self._pending.setdefault(key, [0] * len(VALUE_FIELDS))
+                        for i, value in enumerate(values):
+                            totals[i] += value
+
+    @staticmethod
+    def _add_row(key: Dict, values: Dict) -> None:
+        increments = {name: F(name) + value for name, value in values.items()}
+        if GenerationUsage.objects.filter(**key).update(**increments):
+            return
+        try:
+            with transaction.atomic():
+                GenerationUsage.objects.create(**key, **values)
+        except IntegrityError:
+            # Created by another worker in the meantime
+            GenerationUsage.objects.filter(**key).update(**increments)
@@ -0,0 +1,82 @@
+"""
+Benchmark batch generation latency of the single-prompt, hedged and fan-out modes
+"""
+import math
+import time
+import uuid
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from gemini_app.controllers.question_controller import GeminiQuestionController
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = "Measure p50/p99 batch latency of single-prompt, hedged single-prompt and fan-out question generation"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--modes', nargs='+', choices=['single', 'hedged', 'fanout'], default=['single', 'fanout'])
+        parser.add_argument('--runs', type=int, default=10, help="Batches generated per mode")
+        parser.add_argument('--warmup', type=int, default=0,
+                            help="Untimed batches per mode first (hedging needs 20 calls to learn latencies)")
+        parser.add_argument('--count', type=int, default=5, help="Questions per batch")
+        parser.add_argument('--fanout-concurrency', type=int, default=5)
+
+    def handle(self, *args, **options):
+        rows = []
+        for mode in options['modes']:
+            controller = GeminiQuestionController(
+                fanout=(mode == 'fanout'),
+                fanout_concurrency=options['fanout_concurrency'],
+                hedging=(mode == 'hedged'),
+                hedge_percentile=settings.QUIZ_HEDGE_PERCENTILE,
+                hedge_budget=settings.QUIZ_HEDGE_BUDGET,
+                hedge_min_delay=settings.QUIZ_HEDGE_MIN_DELAY,
+                model_backend=settings.QUIZ_MODEL_BACKEND,
+                model_backend_options=settings.QUIZ_MODEL_BACKEND_OPTIONS,
+            )
+            for run in range(options['warmup']):
+                controller.generate_questions(count=options['count'], task_id=f"warmup_{mode}_{uuid.uuid4()}")
+            calls_before = self._model_calls(controller)
+            latencies, produced, failures = [], 0, 0
+            for run in range(options['runs']):
+                started = time.perf_counter()
+                questions = controller.generate_questions(
+                    count=options['count'],
+                    task_id=f"bench_{mode}_{uuid.uuid4()}"
+                )
+                latencies.append(time.perf_counter() - started)
+                if questions:
+                    produced += len(questions)
+                else:
+                    failures += 1
+                self.stdout.write(f"{mode} run {run + 1}/{options['runs']}: {latencies[-1]:.2f}s", ending='\r')
+            self.stdout.write('')
+            calls = self._model_calls(controller)
+            calls = calls - calls_before if calls is not None else '-'
+            rows.append((mode, latencies, produced, failures, calls))
+
+        self.stdout.write(
+            f"{'mode':<8}{'runs':>6}{'p50 (s)':>10}{'p99 (s)':>10}{'mean (s)':>10}{'questions':>11}{'failed':>8}"
+            f"{'calls':>7}"
+        )
+        for mode, latencies, produced, failures, calls in rows:
+            self.stdout.write(
+                f"{mode:<8}{len(latencies):>6}"
+                f"{percentile(latencies, 50):>10.2f}{percentile(latencies, 99):>10.2f}"
+                f"{sum(latencies) / len(latencies):>10.2f}{produced:>11}{failures:>8}{calls:>7}"
+            )
+
+    @staticmethod
+    def _model_calls(controller):
+        """Calls answered by the model backend so far, if it counts them (the fake backend does)"""
+        client_stats = getattr(controller.client, 'get_stats', None)
+        return client_stats()['calls'] if client_stats else None
@@ -0,0 +1,217 @@
+"""
+Microbenchmarks of the per-batch CPU path (prompt build, parse, serialize) on recorded response corpora
+"""
+import copy
+import json
+import logging
+import platform
+import random
+import re
+import timeit
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+
+from gemini_app.constants import FULL_EXAMPLE
+from gemini_app.controllers.question_controller import GeminiQuestionController
+from gemini_app.models import PromptTemplate, QuizQuestion
+from gemini_app.views import Metrics
+
+BENCHMARK_DIR = Path(__file__).resolve().parents[2] / 'benchmarks'
+CORPUS_DIR = BENCHMARK_DIR / 'corpora'
+DEFAULT_BASELINE = BENCHMARK_DIR / 'baseline.json'
+
+
+def example_questions(count, text_scale=1):
+    """`count` distinct questions built from the prompt's full example, with strings repeated `text_scale` times"""
+    # The prompt example has trailing commas, which json does not accept, and
+    # is normalized to the response schema's shape
+    base = QuizQuestion.from_dict(json.loads(re.sub(r',(\s*[}\]])', r'\1', FULL_EXAMPLE))).to_dict()
+    questions = []
+    for i in range(count):
+        question = copy.deepcopy(base)
+        question['question'] = f"{i + 1}. " + " ".join([question['question']] * text_scale)
+        question['summary'] = " ".join([question['summary']] * text_scale)
+        question['clues'] = [" ".join([clue] * text_scale) for clue in question['clues']]
+        for option in question['options']:
+            option['label'] = f"{option['label']} ({i + 1})"
+        questions.append(question)
+    return questions
+
+
+def record_corpora():
+    """
+    Response corpora of different sizes and shapes, as the model returns them.
+
+    Returns:
+        Dict of corpus name to response text
+    """
+    def dump(data):
+        return json.dumps(data, ensure_ascii=False, indent=2)
+
+    invalid = example_questions(5)
+    invalid[1]['questionType'] = 'unknown'
+    del invalid[3]['options']
+    truncated = dump(example_questions(5))
+    return {
+        # Structured output: bare JSON arrays
+        'array_1': dump(example_questions(1)),
+        'array_5': dump(example_questions(5)),
+        'array_50': dump(example_questions(50)),
+        'array_5_long_text': dump(example_questions(5, text_scale=8)),
+        # Free-form output
+        'fenced_5': "Aquí están las preguntas:\n```json\n" + dump(example_questions(5)) + "\n```\n",
+        'single_object': dump(example_questions(1)[0]),
+        'questions_key_5': dump({'questions': example_questions(5)}),
+        # Damaged output
+        'invalid_items_5': dump(invalid),
+        'truncated_5': truncated[:int(len(truncated) * 0.8)],
+    }
+
+
+def load_corpora():
+    corpora = {path.stem: path.read_text(encoding='utf-8') for path in sorted(CORPUS_DIR.glob('*.txt'))}
+    if not corpora:
+        raise CommandError(f"No corpora in {CORPUS_DIR}; run with --record first")
+    return corpora
+
+
+def time_per_call(func, repeat):
+    """Best time in microseconds of one call, over `repeat` runs of at least ~0.2s"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+class Command(BaseCommand):
+    help = (
+        "Time prompt building, JSON extraction, response parsing and (de)serialization on recorded "
+        "corpora, and compare with a stored baseline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filter', help="Only run benchmarks whose name contains this text")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per benchmark (best is kept)")
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE), help="Baseline JSON file")
+        parser.add_argument('--save-baseline', action='store_true', help="Store these results as the baseline")
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Relative slowdown over the baseline reported as a regression")
+        parser.add_argument('--check', action='store_true', help="Exit with an error if any benchmark regressed")
+        parser.add_argument('--record', action='store_true', help="Rewrite the recorded corpora and exit")
+
+    def handle(self, *args, **options):
+        if options['record']:
+            CORPUS_DIR.mkdir(parents=True, exist_ok=True)
+            for name, text in record_corpora().items():
+                (CORPUS_DIR / f"{name}.txt").write_text(text, encoding='utf-8')
+            self.stdout.write(f"Recorded corpora in {CORPUS_DIR}")
+            return
+
+        corpora = load_corpora()
+        controller = GeminiQuestionController(max_workers=1, model_backend='fake', usage_accounting=False)
+        benchmarks = {
+            name: func for name, func in self._benchmarks(controller, corpora).items()
+            if not options['filter'] or options['filter'] in name
+        }
+        # Warnings for the damaged corpora would otherwise dominate the timings
+        logging.disable(logging.WARNING)
+        try:
+            counts = {name: len(controller._parse_response(text)) for name, text in corpora.items()}
+            results = {}
+            for name, func in benchmarks.items():
+                results[name] = time_per_call(func, options['repeat'])
+                self.stdout.write(f"{name}: {results[name]:.2f} us", ending='\r')
+        finally:
+            logging.disable(logging.NOTSET)
+        self.stdout.write('')
+
+        baseline = self._load_baseline(options['baseline'])
+        regressions = self._report(results, baseline.get('results', {}), options['tolerance'])
+        mismatches = self._check_counts(counts, baseline.get('questions', {}))
+
+        if options['save_baseline']:
+            merged = dict(baseline.get('results', {}), **results)
+            with open(options['baseline'], 'w', encoding='utf-8') as f:
+                json.dump(
+                    {'environment': self._environment(), 'questions': counts, 'results': merged},
+                    f, indent=2, sort_keys=True
+                )
+                f.write('\n')
+            self.stdout.write(f"Saved baseline to {options['baseline']}")
+        elif baseline and baseline.get('environment') != self._environment():
+            self.stdout.write(self.style.WARNING(
+                f"Baseline recorded on {baseline.get('environment')}; timings may not be comparable"
+            ))
+
+        # A different question count means the parser changed behaviour, not just speed
+        if mismatches and not options['save_baseline']:
+            raise CommandError(f"Question counts differ from the baseline for: {', '.join(mismatches)}")
+        if regressions and options['check']:
+            raise CommandError(f"{len(regressions)} benchmarks regressed: {', '.join(regressions)}")
+
+    def _benchmarks(self, controller, corpora):
+        """Benchmark name to a zero-argument callable"""
+        # Random question parameters are drawn the same way on every run
+        random.seed(0)
+        question_dicts = json.loads(corpora['array_5']) if 'array_5' in corpora else example_questions(5)
+        questions = [QuizQuestion.from_dict(data) for data in question_dicts]
+        metrics = Metrics(total_answered=37, correct_answers=25, current_streak=4, max_streak=9)
+
+        benchmarks = {
+            'prompt.random_params[5]': lambda: PromptTemplate._generate_random_question_params(5),
+            'prompt.get_prompt_template[5]': lambda: PromptTemplate.get_prompt_template(count=5),
+        }
+        for name, text in corpora.items():
+            benchmarks[f'extract_json[{name}]'] = lambda text=text: controller._extract_json_from_text(text)
+        for name, text in corpora.items():
+            benchmarks[f'parse_response[{name}]'] = lambda text=text: controller._parse_response(text)
+        benchmarks.update({
+            'question.from_dict[x5]': lambda: [QuizQuestion.from_dict(data) for data in question_dicts],
+            'question.to_dict[x5]': lambda: [question.to_dict() for question in questions],
+            'metrics.to_dict': metrics.to_dict,
+        })
+        return benchmarks
+
+    @staticmethod
+    def _environment():
+        return {'python': platform.python_version(), 'implementation': platform.python_implementation(),
+                'machine': platform.machine()}
+
+    @staticmethod
+    def _load_baseline(path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def _check_counts(self, counts, baseline):
+        """Print the questions parsed from each corpus that differ from the baseline and return their corpora"""
+        mismatches = []
+        for name, count in counts.items():
+            expected = baseline.get(name)
+            if expected is not None and count != expected:
+                mismatches.append(name)
+                self.stdout.write(self.style.ERROR(
+                    f"{name}: parsed {count} questions, baseline expects {expected}"
+                ))
+        return mismatches
+
+    def _report(self, results, baseline, tolerance):
+        """Print the results against the baseline and return the names of the regressions"""
+        regressions = []
+        width = max(len(name) for name in results) + 2
+        self.stdout.write(f"{'benchmark':<{width}}{'time (us)':>12}{'baseline':>12}{'change':>9}")
+        for name, value in results.items():
+            reference = baseline.get(name)
+            if reference is None:
+                self.stdout.write(f"{name:<{width}}{value:>12.2f}{'-':>12}{'new':>9}")
+                continue
+            change = value / reference - 1
+            line = f"{name:<{width}}{value:>12.2f}{reference:>12.2f}{change:>+9.0%}"
+            if change > tolerance:
+                regressions.append(name)
+                line = self.style.ERROR(line + "  REGRESSION")
+            elif change < -tolerance:
+                line = self.style.SUCCESS(line + "  faster")
+            self.stdout.write(line)
+        return regressions
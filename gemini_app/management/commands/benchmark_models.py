@@ -0,0 +1,97 @@
+"""
+Microbenchmark of QuizQuestion serialization against the asdict-based implementation
+"""
+import json
+import re
+import timeit
+import tracemalloc
+from dataclasses import asdict
+from django.core.management.base import BaseCommand
+
+from gemini_app.constants import FULL_EXAMPLE
+from gemini_app.models import AnswerType, Option, QuestionMetadata, QuestionType, QuizQuestion, Reference
+
+
+def asdict_to_dict(question):
+    """Previous QuizQuestion.to_dict: sub-objects converted with dataclasses.asdict"""
+    return {
+        'question': question.question,
+        'clues': question.clues,
+        'questionType': question.questionType.value,
+        'answerType': question.answerType.value,
+        'options': [asdict(opt) for opt in question.options],
+        'metadata': asdict(question.metadata),
+        'summary': question.summary,
+        'references': [asdict(ref) for ref in question.references]
+    }
+
+
+def keyword_from_dict(data):
+    """Previous QuizQuestion.from_dict: keyword construction and Enum calls"""
+    metadata = QuestionMetadata(
+        topic=data.get('metadata', {}).get('topic', 'General'),
+        subtopic=data.get('metadata', {}).get('subtopic', 'General'),
+        difficulty=data.get('metadata', {}).get('difficulty', 3),
+        tags=data.get('metadata', {}).get('tags', [])
+    )
+    options = [Option(label=opt.get('label', ''), answer=opt.get('answer', False))
+               for opt in data.get('options', [])]
+    references = [
+        Reference(type=ref.get('type', 'book'), title=ref.get('title', ''), authors=ref.get('authors', ''))
+        for ref in data.get('references', [])
+    ]
+    return QuizQuestion(
+        question=data.get('question', ''),
+        clues=data.get('clues', []),
+        questionType=QuestionType(data.get('questionType', 'conceptual')),
+        answerType=AnswerType(data.get('answerType', 'respuesta_unica')),
+        options=options,
+        metadata=metadata,
+        summary=data.get('summary', None),
+        references=references
+    )
+
+
+def peak_bytes(func, *args):
+    """Peak traced memory allocated while running func once"""
+    tracemalloc.reset_peak()
+    before = tracemalloc.get_traced_memory()[0]
+    func(*args)
+    return tracemalloc.get_traced_memory()[1] - before
+
+
+class Command(BaseCommand):
+    help = "Compare per-question time and peak allocation of QuizQuestion to_dict/from_dict round trips"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', type=int, default=20000, help="Iterations per measurement")
+
+    def handle(self, *args, **options):
+        number = options['number']
+        # The prompt example has trailing commas, which json does not accept
+        data = json.loads(re.sub(r',(\s*[}\]])', r'\1', FULL_EXAMPLE))
+        question = QuizQuestion.from_dict(data)
+        if asdict_to_dict(question) != question.to_dict():
+            raise AssertionError("to_dict output differs from the asdict implementation")
+
+        implementations = [
+            ('asdict', asdict_to_dict, keyword_from_dict),
+            ('current', QuizQuestion.to_dict, QuizQuestion.from_dict),
+        ]
+
+        self.stdout.write(f"{'impl':<10}{'to_dict (us)':>14}{'from_dict (us)':>16}{'round trip (us)':>17}{'peak (B)':>10}")
+        tracemalloc.start()
+        try:
+            for name, to_dict, from_dict in implementations:
+                round_trip = lambda: from_dict(to_dict(question))
+                # Peak allocation is measured first, so timing runs are not traced twice
+                peak = min(peak_bytes(round_trip) for _ in range(5))
+                tracemalloc.stop()
+                times = [
+                    min(timeit.repeat(stmt, number=number, repeat=3)) / number * 1e6
+                    for stmt in (lambda: to_dict(question), lambda: from_dict(data), round_trip)
+                ]
+                tracemalloc.start()
+                self.stdout.write(f"{name:<10}{times[0]:>14.2f}{times[1]:>16.2f}{times[2]:>17.2f}{peak:>10}")
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,125 @@
+"""
+Startup time of a worker and of management commands, measured in fresh interpreters
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+
+from gemini_app.management.commands.benchmark_generation import percentile
+
+PROJECT_DIR = Path(__file__).resolve().parents[3]
+# Modules whose presence after a scenario means the model SDK was imported
+SDK_MODULES = ('google.genai',)
+
+# Each scenario runs in a new interpreter and prints a JSON line with the
+# seconds spent in its timed part
+SCENARIO_PREAMBLE = """
+import json, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+"""
+SCENARIO_EPILOGUE = """
+print(json.dumps({'seconds': time.perf_counter() - started,
+                  'sdk_loaded': any(name in sys.modules for name in %r)}))
+""" % (SDK_MODULES,)
+SCENARIOS = {
+    # Django setup only, the floor of every other scenario
+    'django_setup': "",
+    # What a gunicorn worker does before serving: load the WSGI application and the URLconf
+    'worker_boot': (
+        "from cs_quiz_project.wsgi import application\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver().url_patterns\n"
+    ),
+    # Worker boot plus gunicorn's post_worker_init hook, which must neither block nor need credentials
+    'worker_hook': (
+        "from cs_quiz_project.wsgi import application\n"
+        "import runpy\n"
+        "runpy.run_path('gunicorn.conf.py')['post_worker_init'](None)\n"
+    ),
+    # System checks, run by migrate, runserver and most commands
+    'manage_check': (
+        "from django.core.management import call_command\n"
+        "call_command('check', verbosity=0)\n"
+    ),
+    # Worker boot plus the controller creation done on the first request
+    'first_controller': (
+        "from cs_quiz_project.wsgi import application\n"
+        "from gemini_app.views import get_controller\n"
+        "get_controller()\n"
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Time worker boot, system checks and the first controller creation in fresh interpreters, "
+        "without GOOGLE_API_KEY, and report whether the model SDK was imported"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5, help="Fresh interpreters per scenario")
+        parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+        parser.add_argument('--with-credentials', action='store_true',
+                            help="Keep GOOGLE_API_KEY in the environment of the scenarios (by default only "
+                                 "first_controller gets a placeholder key)")
+        parser.add_argument('--check', action='store_true',
+                            help="Exit with an error if a scenario fails or imports the SDK before the first "
+                                 "controller is created")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get(
+            'DJANGO_SETTINGS_MODULE', 'cs_quiz_project.settings'))
+        if not options['with_credentials']:
+            env.pop('GOOGLE_API_KEY', None)
+
+        self.stdout.write(
+            f"{'scenario':<18}{'process p50 (ms)':>18}{'in-process p50 (ms)':>21}{'min (ms)':>10}{'sdk':>6}"
+        )
+        problems = []
+        for name in options['scenarios']:
+            scenario_env = env
+            if name == 'first_controller' and 'GOOGLE_API_KEY' not in env:
+                # Creating the client does not call the API, so any key will do
+                scenario_env = dict(env, GOOGLE_API_KEY='benchmark-placeholder')
+            runs = [self._run(name, scenario_env) for _ in range(options['repeat'])]
+            failed = [run for run in runs if 'error' in run]
+            if failed:
+                problems.append(f"{name} failed: {failed[0]['error']}")
+                self.stdout.write(self.style.ERROR(f"{name:<18}{'failed':>18}"))
+                continue
+            process = [run['process_seconds'] * 1000 for run in runs]
+            timed = [run['seconds'] * 1000 for run in runs]
+            sdk_loaded = any(run['sdk_loaded'] for run in runs)
+            if sdk_loaded and name != 'first_controller':
+                problems.append(f"{name} imported the model SDK")
+            self.stdout.write(
+                f"{name:<18}{percentile(process, 50):>18.0f}{percentile(timed, 50):>21.0f}"
+                f"{min(timed):>10.0f}{'yes' if sdk_loaded else 'no':>6}"
+            )
+
+        for problem in problems:
+            self.stdout.write(self.style.WARNING(problem))
+        if problems and options['check']:
+            raise CommandError(f"{len(problems)} startup problems")
+
+    @staticmethod
+    def _run(name, env):
+        """Run one scenario in a new interpreter; returns its timings or an `error`"""
+        code = SCENARIO_PREAMBLE + SCENARIOS[name] + SCENARIO_EPILOGUE
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', code], cwd=PROJECT_DIR, env=env, capture_output=True, text=True
+        )
+        process_seconds = time.perf_counter() - started
+        if result.returncode != 0:
+            lines = result.stderr.strip().splitlines()
+            return {'error': lines[-1] if lines else f"exit status {result.returncode}"}
+        data = json.loads(result.stdout.strip().splitlines()[-1])
+        data['process_seconds'] = process_seconds
+        return data
@@ -0,0 +1,33 @@
+"""
+Export the question bank to a (optionally gzipped) JSONL file
+"""
+import time
+from django.core.management.base import BaseCommand
+
+from gemini_app.controllers.question_corpus import export_questions, open_corpus
+from gemini_app.models import StoredQuestion
+
+
+class Command(BaseCommand):
+    help = "Write stored questions as JSONL, gzipped if the path ends in .gz ('-' for stdout)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--topic')
+        parser.add_argument('--subtopic')
+        parser.add_argument('--difficulty', type=int)
+        parser.add_argument('--chunk-size', type=int, default=2000, help="Rows fetched from the database at a time")
+
+    def handle(self, *args, **options):
+        queryset = StoredQuestion.objects.all()
+        for field in ('topic', 'subtopic', 'difficulty'):
+            if options[field] is not None:
+                queryset = queryset.filter(**{field: options[field]})
+
+        started = time.perf_counter()
+        with open_corpus(options['path'], 'w') as stream:
+            written = export_questions(stream, queryset, chunk_size=options['chunk_size'])
+        elapsed = time.perf_counter() - started
+        # Keep stdout clean when the corpus itself is written there
+        out = self.stderr if options['path'] == '-' else self.stdout
+        out.write(f"Exported {written} questions in {elapsed:.2f}s")
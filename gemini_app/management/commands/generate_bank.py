@@ -0,0 +1,347 @@
+"""
+Bulk generation of questions into the question bank across the whole syllabus
+"""
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from gemini_app.constants import SYLLABUS
+from gemini_app.controllers.question_bank import QuestionBank
+from gemini_app.controllers.question_controller import GeminiQuestionController
+from gemini_app.management.commands.loadtest import throwaway_database
+from gemini_app.models import AnswerType, QuestionType, StoredQuestion
+from gemini_app.models.prompt_template import QuestionParameters
+
+
+def cell_key(topic, subtopic, difficulty):
+    """Checkpoint key of a topic x subtopic x difficulty cell"""
+    return f"{topic}|{subtopic}|{difficulty}"
+
+
+class RateLimiter:
+    """Spaces out calls to at most `rate` per second (no limit if rate is 0)"""
+
+    def __init__(self, rate):
+        self.interval = 1 / rate if rate > 0 else 0
+        self._next = time.monotonic()
+
+    def acquire(self):
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + self.interval
+
+
+class Checkpoint:
+    """
+    Questions stored per cell and request counters, saved to a JSON file
+    after every batch so an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.cells = {}
+        # Questions the cells already held when the job started
+        self.baseline = 0
+        self.requests = 0
+        self.failed_requests = 0
+        self.resumed = False
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        with open(self.path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.cells = data.get('cells', {})
+        self.baseline = data.get('baseline', 0)
+        self.requests = data.get('requests', 0)
+        self.failed_requests = data.get('failed_requests', 0)
+        self.resumed = True
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({
+                'cells': self.cells,
+                'baseline': self.baseline,
+                'requests': self.requests,
+                'failed_requests': self.failed_requests,
+            }, f, ensure_ascii=False, indent=1)
+        # Replaced atomically, so an interruption never leaves a partial file
+        os.replace(temp_path, self.path)
+
+    @property
+    def resume_hint(self):
+        if not self.path:
+            return "no checkpoint was kept"
+        return f"run again to resume from {self.path}"
+
+    @property
+    def stored(self):
+        return sum(self.cells.values())
+
+    @property
+    def generated(self):
+        return self.stored - self.baseline
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate questions for every topic x subtopic x difficulty cell of the syllabus "
+        "and store them in the question bank, resuming from a checkpoint file"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--total', type=int, help="Questions to add to the bank, spread evenly over the cells")
+        parser.add_argument('--per-cell', type=int, help="Target number of questions per cell")
+        parser.add_argument('--topics', nargs='+', help="Only generate for these syllabus topics")
+        parser.add_argument('--difficulties', nargs='+', type=int, default=[1, 2, 3, 4, 5])
+        parser.add_argument('--batch-size', type=int, default=5, help="Questions per request")
+        parser.add_argument('--concurrency', type=int, default=4, help="Requests in flight at once")
+        parser.add_argument('--rate', type=float, default=1.0, help="Maximum requests per second (0 for no limit)")
+        parser.add_argument('--max-failures', type=int, default=20,
+                            help="Stop after this many failed or empty requests")
+        parser.add_argument('--max-empty-rounds', type=int, default=3,
+                            help="Give up on a cell after this many requests in a row added nothing new to it")
+        parser.add_argument('--checkpoint', default='generate_bank.checkpoint.json',
+                            help="Progress file; an existing one is resumed")
+        parser.add_argument('--reset', action='store_true', help="Ignore an existing checkpoint")
+        parser.add_argument('--backend', choices=['gemini', 'fake'],
+                            help="Model backend, defaults to QUIZ_MODEL_BACKEND")
+        parser.add_argument('--fake', action='store_const', const='fake', dest='backend',
+                            help="Shortcut for --backend fake")
+        parser.add_argument('--fake-latency', type=float, default=0.0, help="Seconds per fake request")
+        parser.add_argument('--fake-failure-rate', type=float, default=0.0, help="Fraction of fake requests that fail")
+        parser.add_argument('--seed', type=int, help="Seed for the cell order and question types")
+        parser.add_argument('--use-real-db', action='store_true',
+                            help="Store fake questions in the configured question bank (by default a fake run "
+                                 "uses a throwaway test database and no checkpoint)")
+
+    def handle(self, *args, **options):
+        if not options['total'] and not options['per_cell']:
+            raise CommandError("Give --total, --per-cell or both")
+        if options['batch_size'] < 1 or options['concurrency'] < 1:
+            raise CommandError("--batch-size and --concurrency must be at least 1")
+        backend = options['backend'] or settings.QUIZ_MODEL_BACKEND
+        if backend != 'fake' or options['use_real_db']:
+            self._generate(options)
+            return
+        # Fake questions must never be served to players
+        self.stdout.write("Fake backend: generating into a throwaway test database")
+        with throwaway_database():
+            self._generate(dict(options, checkpoint=None))
+
+    def _generate(self, options):
+        self.random = random.Random(options['seed'])
+
+        cells = self._cells(options['topics'], options['difficulties'])
+        checkpoint = Checkpoint(options['checkpoint'])
+        if not options['reset']:
+            checkpoint.load()
+        if checkpoint.resumed:
+            self.stdout.write(f"Resuming from {checkpoint.path}: {checkpoint.stored} questions stored")
+        else:
+            # A fresh run counts what the bank already holds towards the cell targets
+            checkpoint.cells = self._bank_counts(cells)
+            checkpoint.baseline = checkpoint.stored
+
+        per_cell = options['per_cell']
+        total = options['total']
+        if per_cell is None:
+            per_cell = math.ceil((total + checkpoint.baseline) / len(cells))
+        deficits = {key: max(per_cell - checkpoint.cells.get(key, 0), 0) for key in cells}
+        remaining = sum(deficits.values())
+        if total is not None:
+            remaining = min(remaining, max(total - checkpoint.generated, 0))
+        self.stdout.write(f"{len(cells)} cells, target {per_cell} per cell, {remaining} questions to generate")
+        if remaining == 0:
+            return
+
+        controller = GeminiQuestionController(
+            max_workers=1,
+            context_cache=settings.QUIZ_CONTEXT_CACHE,
+            context_cache_ttl=settings.QUIZ_CONTEXT_CACHE_TTL,
+            structured_output=settings.QUIZ_STRUCTURED_OUTPUT,
+            usage_accounting=settings.QUIZ_USAGE_ACCOUNTING,
+            usage_flush_interval=settings.QUIZ_USAGE_FLUSH_INTERVAL,
+            **self._backend(options),
+        )
+        bank = QuestionBank(controller, cache_size=0)
+        try:
+            self._run(controller, bank, cells, deficits, remaining, checkpoint, options)
+        finally:
+            if controller.usage is not None:
+                controller.usage.flush()
+
+    def _backend(self, options):
+        """Model backend arguments of the controller"""
+        backend = options['backend'] or settings.QUIZ_MODEL_BACKEND
+        if backend != 'fake':
+            return {'model_backend': backend}
+        return {
+            'model_backend': 'fake',
+            'model_backend_options': {
+                'latency': options['fake_latency'],
+                'failure_rate': options['fake_failure_rate'],
+                'seed': options['seed'],
+            },
+        }
+
+    def _cells(self, topics, difficulties):
+        """All (topic, subtopic, difficulty) cells to fill, by checkpoint key"""
+        if topics:
+            unknown = set(topics) - set(SYLLABUS)
+            if unknown:
+                raise CommandError(f"Unknown topics: {', '.join(sorted(unknown))}")
+        cells = {}
+        for topic, subtopics in SYLLABUS.items():
+            if topics and topic not in topics:
+                continue
+            for subtopic in subtopics or ["General"]:
+                for difficulty in difficulties:
+                    cells[cell_key(topic, subtopic, difficulty)] = (topic, subtopic, difficulty)
+        return cells
+
+    def _bank_counts(self, cells):
+        rows = StoredQuestion.objects.values('topic', 'subtopic', 'difficulty').annotate(n=Count('pk'))
+        counts = {cell_key(r['topic'], r['subtopic'], r['difficulty']): r['n'] for r in rows}
+        return {key: counts[key] for key in cells if key in counts}
+
+    def _next_batch(self, order, deficits, in_flight, budget, batch_size):
+        """Pick the next cell round-robin and the size of its batch, or None when done"""
+        for _ in range(len(order)):
+            key = order[0]
+            order.rotate(-1)
+            size = min(batch_size, deficits[key] - in_flight.get(key, 0), budget)
+            if size > 0:
+                return key, size
+        return None
+
+    def _params(self, cell, size):
+        topic, subtopic, difficulty = cell
+        return [
+            QuestionParameters(
+                topic=topic,
+                subtopic=subtopic,
+                difficulty=difficulty,
+                question_type=self.random.choice(list(QuestionType)),
+                response_type=AnswerType.UNIQUE_ANSWER,
+            )
+            for _ in range(size)
+        ]
+
+    @staticmethod
+    def _store(bank, questions):
+        """
+        Store questions in the bank.
+
+        Returns:
+            Dict mapping cell keys to the number of questions that were not in the bank
+            already, credited to the cell in each question's own metadata
+        """
+        rows = {row.fingerprint: row for row in map(StoredQuestion.from_question, questions)}
+        existing = StoredQuestion.objects.filter(fingerprint__in=list(rows))
+        before = set(existing.values_list('fingerprint', flat=True))
+        bank.store(questions)
+        added = {}
+        for fingerprint in set(existing.values_list('fingerprint', flat=True)) - before:
+            row = rows[fingerprint]
+            key = cell_key(row.topic, row.subtopic, row.difficulty)
+            added[key] = added.get(key, 0) + 1
+        return added
+
+    def _run(self, controller, bank, cells, deficits, remaining, checkpoint, options):
+        keys = list(cells)
+        self.random.shuffle(keys)
+        order = deque(keys)
+        in_flight = {}
+        futures = {}
+        failures = 0
+        # Requests in a row that added nothing to the cell they were made for
+        empty_rounds = {}
+        abandoned = []
+        limiter = RateLimiter(options['rate'])
+        started = time.monotonic()
+        executor = ThreadPoolExecutor(max_workers=options['concurrency'], thread_name_prefix="generate-bank")
+        try:
+            while True:
+                # Keep `concurrency` requests in flight while there is work left
+                while len(futures) < options['concurrency'] and failures < options['max_failures']:
+                    budget = remaining - sum(in_flight.values())
+                    batch = self._next_batch(order, deficits, in_flight, budget, options['batch_size'])
+                    if batch is None:
+                        break
+                    key, size = batch
+                    limiter.acquire()
+                    in_flight[key] = in_flight.get(key, 0) + size
+                    futures[executor.submit(controller.generate_for_params, self._params(cells[key], size))] = (key, size)
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, size = futures.pop(future)
+                    in_flight[key] -= size
+                    checkpoint.requests += 1
+                    try:
+                        questions = future.result()[:size]
+                    except Exception as e:
+                        questions = []
+                        self.stderr.write(f"Request for {key} failed: {e}")
+                    added = self._store(bank, questions)
+                    credited = 0
+                    for added_key, count in added.items():
+                        # Questions landing outside the job's cells are kept but not counted
+                        if added_key not in cells:
+                            continue
+                        checkpoint.cells[added_key] = checkpoint.cells.get(added_key, 0) + count
+                        count = min(count, deficits[added_key])
+                        deficits[added_key] -= count
+                        credited += count
+                    remaining -= min(credited, remaining)
+                    if not added:
+                        # Failed, or nothing new (e.g. every question was a duplicate)
+                        failures += 1
+                        checkpoint.failed_requests += 1
+                    empty_rounds[key] = 0 if added.get(key) else empty_rounds.get(key, 0) + 1
+                    if empty_rounds[key] >= options['max_empty_rounds'] and deficits[key]:
+                        self.stderr.write(f"Giving up on {key} after {empty_rounds[key]} requests with nothing new")
+                        deficits[key] = 0
+                        remaining = min(remaining, sum(deficits.values()))
+                        abandoned.append(key)
+                    checkpoint.save()
+                    elapsed = time.monotonic() - started
+                    self.stdout.write(
+                        f"{checkpoint.stored} stored, {remaining} left, "
+                        f"{checkpoint.requests / max(elapsed, 1e-9):.2f} req/s",
+                        ending='\r'
+                    )
+        except KeyboardInterrupt:
+            executor.shutdown(wait=False, cancel_futures=True)
+            self.stdout.write('')
+            self.stdout.write(f"Interrupted; {checkpoint.resume_hint}")
+            return
+        executor.shutdown()
+        self.stdout.write('')
+
+        if failures >= options['max_failures'] and remaining:
+            raise CommandError(
+                f"Stopped after {failures} failed requests with {remaining} questions left; "
+                f"{checkpoint.resume_hint}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {checkpoint.stored} questions in {len(cells)} cells, "
+            f"{checkpoint.requests} requests ({checkpoint.failed_requests} failed)"
+            + (f", gave up on {len(abandoned)} cells" if abandoned else "")
+        ))
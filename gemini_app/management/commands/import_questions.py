@@ -0,0 +1,34 @@
+"""
+Import questions from (optionally gzipped) JSONL files into the question bank
+"""
+import time
+from django.core.management.base import BaseCommand
+
+from gemini_app.controllers.question_corpus import import_questions, open_corpus
+
+
+class Command(BaseCommand):
+    help = "Load JSONL question files (plain or gzipped, '-' for stdin), skipping questions already in the bank"
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+')
+        parser.add_argument('--batch-size', type=int, default=1000, help="Questions inserted per transaction")
+
+    def handle(self, *args, **options):
+        totals = {"read": 0, "inserted": 0, "duplicate": 0, "invalid": 0}
+        started = time.perf_counter()
+        for path in options['paths']:
+            with open_corpus(path, 'r') as stream:
+                stats = import_questions(stream, batch_size=options['batch_size'])
+            self.stdout.write(
+                f"{path}: {stats['inserted']} inserted, {stats['duplicate']} duplicates, "
+                f"{stats['invalid']} invalid of {stats['read']} read"
+            )
+            for key, value in stats.items():
+                totals[key] += value
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {totals['inserted']} of {totals['read']} questions in {elapsed:.2f}s "
+            f"({totals['read'] / max(elapsed, 1e-9):.0f} lines/s)"
+        ))
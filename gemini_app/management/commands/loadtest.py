@@ -0,0 +1,276 @@
+"""
+Load test of the quiz endpoints with many concurrent sessions
+"""
+import http.cookiejar
+import json
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+
+from gemini_app.management.commands.benchmark_generation import percentile
+
+ENDPOINTS = ('index', 'check_generation_status', 'submit_answer', 'next_question')
+TOKEN_PATTERN = re.compile(r"const questionToken = '([^']+)'")
+
+
+@contextmanager
+def throwaway_database():
+    """
+    Run the block against a new, migrated test database of the default
+    connection, destroyed afterwards, so simulated players and fake
+    questions never reach the real sessions or question bank.
+
+    SQLite test databases are created as a temporary file instead of in
+    memory, so the threads of a load test share them.
+    """
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    original_test_name = test_settings.get('NAME')
+    temp_dir = None
+    if connection.vendor == 'sqlite' and not original_test_name:
+        temp_dir = tempfile.TemporaryDirectory()
+        test_settings['NAME'] = os.path.join(temp_dir.name, 'throwaway.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = original_test_name
+        if temp_dir is not None:
+            temp_dir.cleanup()
+
+
+class InProcessTransport:
+    """Requests through Django's test client, in this process"""
+
+    def __init__(self):
+        host = next((h for h in settings.ALLOWED_HOSTS if h and '*' not in h and not h.startswith('.')), 'localhost')
+        self.client = Client(HTTP_HOST=host, raise_request_exception=False)
+
+    def get(self, path):
+        response = self.client.get(path)
+        return response.status_code, response.content.decode('utf-8')
+
+    def post_json(self, path, data):
+        response = self.client.post(path, data=json.dumps(data), content_type='application/json')
+        return response.status_code, response.content.decode('utf-8')
+
+
+class HttpTransport:
+    """Requests over HTTP to a running server, with a cookie jar per session"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def _open(self, request):
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                return response.status, response.read().decode('utf-8')
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode('utf-8', 'replace')
+
+    def get(self, path):
+        return self._open(urllib.request.Request(self.base_url + path))
+
+    def post_json(self, path, data):
+        csrf = next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(data).encode('utf-8'),
+            headers={'Content-Type': 'application/json', 'X-CSRFToken': csrf, 'Referer': self.base_url + '/'},
+        )
+        return self._open(request)
+
+
+class Recorder:
+    """Latencies and errors per endpoint, shared by all sessions"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint, elapsed, ok):
+        with self._lock:
+            self.latencies[endpoint].append(elapsed)
+            if not ok:
+                self.errors[endpoint] += 1
+
+
+class Session:
+    """
+    A simulated player following the browser's flow: load the page, poll
+    the generation status while questions are being prepared, then answer
+    and move to the next question.
+    """
+
+    def __init__(self, transport, recorder, rng, options):
+        self.transport = transport
+        self.recorder = recorder
+        self.rng = rng
+        self.options = options
+        self.answered = 0
+
+    def _call(self, endpoint, method, path, data=None):
+        started = time.perf_counter()
+        try:
+            if method == 'GET':
+                status, body = self.transport.get(path)
+            else:
+                status, body = self.transport.post_json(path, data)
+        except Exception:
+            status, body = 0, ''
+        self.recorder.record(endpoint, time.perf_counter() - started, status == 200)
+        return status, body
+
+    def _load_question(self):
+        """Load the page until it shows a question; returns its token or None on timeout"""
+        deadline = time.monotonic() + self.options['timeout']
+        while time.monotonic() < deadline:
+            status, body = self._call('index', 'GET', '/')
+            match = TOKEN_PATTERN.search(body) if status == 200 else None
+            if match:
+                return match.group(1)
+            # Poll like the loading page until a question is ready
+            while time.monotonic() < deadline:
+                time.sleep(self.options['poll_interval'])
+                status, body = self._call('check_generation_status', 'GET', '/check_generation_status/')
+                try:
+                    data = json.loads(body)
+                except ValueError:
+                    data = {}
+                if data.get('status') in ('completed', 'failed', 'not_found') or data.get('ready', 0) > 0:
+                    break
+        return None
+
+    def run(self):
+        for _ in range(self.options['questions']):
+            token = self._load_question()
+            if token is None:
+                return False
+            time.sleep(self.options['think_time'])
+            self._call('submit_answer', 'POST', '/submit_answer/', {
+                'selected_option': 0,
+                'is_correct': self.rng.random() < 0.5,
+                'token': token,
+            })
+            self._call('next_question', 'GET', f'/next_question/?token={token}')
+            self.answered += 1
+        return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Drive concurrent quiz sessions through index, check_generation_status, submit_answer "
+        "and next_question, and report throughput and latency percentiles per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sessions', type=int, default=20, help="Concurrent sessions")
+        parser.add_argument('--questions', type=int, default=10, help="Questions answered per session")
+        parser.add_argument('--url', help="Base URL of a running server (default: in-process test client)")
+        parser.add_argument('--think-time', type=float, default=0.0, help="Seconds before answering each question")
+        parser.add_argument('--poll-interval', type=float, default=0.2, help="Seconds between status polls")
+        parser.add_argument('--ramp-up', type=float, default=0.0, help="Seconds over which sessions are started")
+        parser.add_argument('--timeout', type=float, default=60.0, help="Seconds a session waits for a question")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--allow-gemini', action='store_true',
+                            help="Allow an in-process run against the real Gemini backend")
+        parser.add_argument('--use-real-db', action='store_true',
+                            help="Run in-process sessions against the configured database instead of a "
+                                 "throwaway test database (their sessions and questions are kept)")
+
+    def handle(self, *args, **options):
+        in_process = not options['url']
+        if in_process and settings.QUIZ_MODEL_BACKEND != 'fake' and not options['allow_gemini']:
+            raise CommandError(
+                "In-process load tests send every generation to the model backend; "
+                "set QUIZ_MODEL_BACKEND=fake (or pass --allow-gemini)"
+            )
+        if not in_process or options['use_real_db']:
+            self._run(options, in_process)
+            return
+        with throwaway_database():
+            self._run(options, in_process)
+
+    def _run(self, options, in_process):
+        recorder = Recorder()
+        sessions = [
+            Session(
+                InProcessTransport() if in_process else HttpTransport(options['url'], options['timeout']),
+                recorder,
+                random.Random(options['seed'] + i),
+                options,
+            )
+            for i in range(options['sessions'])
+        ]
+        delay = options['ramp_up'] / max(len(sessions), 1)
+
+        def run(index):
+            time.sleep(index * delay)
+            return sessions[index].run()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(sessions), thread_name_prefix="loadtest") as executor:
+            completed = list(executor.map(run, range(len(sessions))))
+        elapsed = time.perf_counter() - started
+
+        self._report(recorder, elapsed)
+        answered = sum(session.answered for session in sessions)
+        self.stdout.write(
+            f"{completed.count(True)}/{len(sessions)} sessions completed, {answered} questions answered "
+            f"in {elapsed:.2f}s ({answered / elapsed:.1f} questions/s)"
+        )
+        if in_process:
+            from gemini_app import views
+
+            self._report_backend()
+            # Pending warm pool refills would otherwise hit the worker pool as it is shut down at exit,
+            # and the usage recorded so far is written before the test database is dropped
+            controller = views.get_controller()
+            controller.shutdown()
+            if controller.usage is not None:
+                controller.usage.flush()
+
+    def _report(self, recorder, elapsed):
+        self.stdout.write(
+            f"{'endpoint':<26}{'requests':>9}{'errors':>8}{'req/s':>9}"
+            f"{'p50 (ms)':>10}{'p95 (ms)':>10}{'p99 (ms)':>10}{'max (ms)':>10}"
+        )
+        rows = [(endpoint, recorder.latencies[endpoint]) for endpoint in ENDPOINTS]
+        rows.append(('total', [t for endpoint in ENDPOINTS for t in recorder.latencies[endpoint]]))
+        for endpoint, latencies in rows:
+            errors = sum(recorder.errors.values()) if endpoint == 'total' else recorder.errors[endpoint]
+            if not latencies:
+                self.stdout.write(f"{endpoint:<26}{0:>9}{errors:>8}")
+                continue
+            self.stdout.write(
+                f"{endpoint:<26}{len(latencies):>9}{errors:>8}{len(latencies) / elapsed:>9.1f}"
+                f"{percentile(latencies, 50) * 1000:>10.1f}{percentile(latencies, 95) * 1000:>10.1f}"
+                f"{percentile(latencies, 99) * 1000:>10.1f}{max(latencies) * 1000:>10.1f}"
+            )
+
+    def _report_backend(self):
+        from gemini_app import views
+
+        controller = views.get_controller()
+        client_stats = getattr(controller.client, 'get_stats', None)
+        if client_stats:
+            stats = client_stats()
+            self.stdout.write(f"Model backend: {stats['calls']} calls, {stats['failures']} simulated failures")
+        stats = controller.get_coalescing_stats()
+        self.stdout.write(f"Coalescing: {stats}")
@@ -0,0 +1,87 @@
+"""
+Report of token usage and estimated cost per topic, difficulty, question type, call kind or batch size
+"""
+import datetime
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Sum
+from django.utils import timezone
+
+from gemini_app.models import GenerationUsage
+
+GROUP_FIELDS = ('date', 'topic', 'subtopic', 'difficulty', 'question_type', 'call', 'batch_size')
+SUM_FIELDS = ('requested', 'questions', 'input_tokens', 'cached_tokens', 'output_tokens', 'api_seconds')
+SORT_KEYS = {
+    'cost': lambda row: row['cost'],
+    'tokens': lambda row: row['input_tokens'] + row['output_tokens'],
+    'requested': lambda row: row['requested'],
+    'output': lambda row: row['output_tokens'] / max(row['requested'], 1),
+    'cost_per_question': lambda row: row['cost'] / max(row['questions'], 1),
+}
+
+
+def estimate_cost(input_tokens, cached_tokens, output_tokens):
+    """Cost in USD at the QUIZ_PRICE_* settings; cached tokens are part of the input tokens"""
+    return (
+        (input_tokens - cached_tokens) * settings.QUIZ_PRICE_INPUT_PER_MTOK
+        + cached_tokens * settings.QUIZ_PRICE_CACHED_PER_MTOK
+        + output_tokens * settings.QUIZ_PRICE_OUTPUT_PER_MTOK
+    ) / 1e6
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarize recorded token usage, latency and estimated cost of question generation, grouped by "
+        "topic, subtopic, difficulty, question type, call kind, batch size or day"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--by', nargs='+', choices=GROUP_FIELDS, default=['topic'], help="Columns to group by")
+        parser.add_argument('--days', type=int, default=30, help="Days of usage to include (0 for all)")
+        parser.add_argument('--backend', default='gemini', help="Model backend whose usage is reported")
+        parser.add_argument('--sort', choices=sorted(SORT_KEYS), default='cost', help="Order of the rows (descending)")
+        parser.add_argument('--limit', type=int, default=0, help="Only show the first rows (0 for all)")
+
+    def handle(self, *args, **options):
+        usage = GenerationUsage.objects.filter(backend=options['backend'])
+        if options['days']:
+            usage = usage.filter(date__gt=timezone.now().date() - datetime.timedelta(days=options['days']))
+
+        by = options['by']
+        rows = list(usage.values(*by).annotate(**{field: Sum(field) for field in SUM_FIELDS}))
+        if not rows:
+            self.stdout.write(f"No token usage recorded for backend '{options['backend']}'")
+            return
+        for row in rows:
+            row['cost'] = estimate_cost(row['input_tokens'], row['cached_tokens'], row['output_tokens'])
+        rows.sort(key=SORT_KEYS[options['sort']], reverse=True)
+
+        total = {field: sum(row[field] for row in rows) for field in SUM_FIELDS + ('cost',)}
+        total.update({field: '' for field in by})
+        total[by[0]] = 'total'
+
+        widths = {field: max(len(field), *(len(str(row[field])) for row in rows)) + 2 for field in by}
+        widths[by[0]] = max(widths[by[0]], len('total') + 2)
+        self.stdout.write(
+            ''.join(f"{field:<{widths[field]}}" for field in by)
+            + f"{'requested':>10}{'delivered':>10}{'in/q':>9}{'cached/q':>9}{'out/q':>9}"
+            f"{'s/q':>7}{'cost ($)':>11}{'$/1k q':>9}"
+        )
+        shown = rows[:options['limit']] if options['limit'] else rows
+        for row in shown + [total]:
+            self.stdout.write(self._format(row, by, widths))
+
+    @staticmethod
+    def _format(row, by, widths):
+        """
+        One report line; per-question columns are divided by the questions
+        requested, cost per 1000 questions by the questions delivered
+        """
+        requested = max(row['requested'], 1)
+        return (
+            ''.join(f"{str(row[field]):<{widths[field]}}" for field in by)
+            + f"{row['requested']:>10}{row['questions'] / requested:>10.0%}"
+            f"{row['input_tokens'] / requested:>9.0f}{row['cached_tokens'] / requested:>9.0f}"
+            f"{row['output_tokens'] / requested:>9.0f}{row['api_seconds'] / requested:>7.2f}"
+            f"{row['cost']:>11.4f}{row['cost'] / max(row['questions'], 1) * 1000:>9.3f}"
+        )
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 12:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredQuestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=255)),
+                ('subtopic', models.CharField(max_length=255)),
+                ('difficulty', models.PositiveSmallIntegerField()),
+                ('fingerprint', models.CharField(max_length=64, unique=True)),
+                ('payload', models.JSONField()),
+                ('times_served', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['topic', 'subtopic', 'difficulty'], name='gemini_app__topic_862433_idx'), models.Index(fields=['difficulty'], name='gemini_app__difficu_930be5_idx')],
+            },
+        ),
+    ]
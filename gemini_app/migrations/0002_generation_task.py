@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 13:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gemini_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationTask',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task_id', models.CharField(max_length=255, unique=True)),
+                ('data', models.JSONField(default=dict)),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gemini_app', '0002_generation_task'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GenerationUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('backend', models.CharField(max_length=20)),
+                ('topic', models.CharField(max_length=255)),
+                ('subtopic', models.CharField(max_length=255)),
+                ('difficulty', models.PositiveSmallIntegerField()),
+                ('question_type', models.CharField(max_length=50)),
+                ('call', models.CharField(max_length=20)),
+                ('batch_size', models.PositiveSmallIntegerField()),
+                ('requested', models.PositiveIntegerField(default=0)),
+                ('questions', models.PositiveIntegerField(default=0)),
+                ('input_tokens', models.PositiveBigIntegerField(default=0)),
+                ('cached_tokens', models.PositiveBigIntegerField(default=0)),
+                ('output_tokens', models.PositiveBigIntegerField(default=0)),
+                ('api_seconds', models.FloatField(default=0)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'backend', 'topic', 'subtopic', 'difficulty', 'question_type', 'call', 'batch_size'), name='unique_generation_usage')],
+            },
+        ),
+    ]
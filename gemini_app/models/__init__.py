@@ -8,4 +8,7 @@ from .reference import Reference
 from .metadata import QuestionMetadata
 from .summary import Summary
 from .quiz_question import QuizQuestion 
-from .prompt_template import PromptTemplate
\ No newline at end of file
+from .prompt_template import PromptTemplate
+from .question_bank import StoredQuestion
+from .generation_task import GenerationTask
+from .generation_usage import GenerationUsage
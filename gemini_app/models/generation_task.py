@@ -0,0 +1,15 @@
+"""
+GenerationTask model for the database-backed task registry
+"""
+from django.db import models
+
+
+class GenerationTask(models.Model):
+    """State of a question generation task shared by all worker processes"""
+    task_id = models.CharField(max_length=255, unique=True)
+    data = models.JSONField(default=dict)
+    version = models.PositiveIntegerField(default=1)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.task_id} ({self.data.get('status', 'unknown')})"
@@ -0,0 +1,41 @@
+"""
+GenerationUsage model: token usage and latency of generation calls, aggregated per day and question parameters
+"""
+from django.db import models
+
+
+class GenerationUsage(models.Model):
+    """
+    Token usage of the model calls made to one backend for one kind of
+    question on one day.
+
+    The usage of a call is split evenly between the questions it requested,
+    so each row holds the share of every question with the same topic,
+    subtopic, difficulty and type, requested by the same kind of call with
+    the same batch size.
+    """
+    date = models.DateField()
+    backend = models.CharField(max_length=20)
+    topic = models.CharField(max_length=255)
+    subtopic = models.CharField(max_length=255)
+    difficulty = models.PositiveSmallIntegerField()
+    question_type = models.CharField(max_length=50)
+    call = models.CharField(max_length=20)
+    batch_size = models.PositiveSmallIntegerField()
+    requested = models.PositiveIntegerField(default=0)
+    questions = models.PositiveIntegerField(default=0)
+    input_tokens = models.PositiveBigIntegerField(default=0)
+    cached_tokens = models.PositiveBigIntegerField(default=0)
+    output_tokens = models.PositiveBigIntegerField(default=0)
+    api_seconds = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['date', 'backend', 'topic', 'subtopic', 'difficulty', 'question_type', 'call', 'batch_size'],
+                name='unique_generation_usage',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.topic} > {self.subtopic} (Level: {self.difficulty}/5, {self.call} x{self.batch_size})"
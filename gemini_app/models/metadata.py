@@ -1,10 +1,10 @@
 """
 Metadata class for quiz questions
 """
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from typing import List, Dict, Any
 
-@dataclass
+@dataclass(slots=True)
 class QuestionMetadata:
     """Metadata information for quiz questions"""
     topic: str
@@ -17,4 +17,19 @@ class QuestionMetadata:
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization"""
-        return asdict(self)
\ No newline at end of file
+        return {
+            'topic': self.topic,
+            'subtopic': self.subtopic,
+            'difficulty': self.difficulty,
+            'tags': list(self.tags),
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'QuestionMetadata':
+        """Create a QuestionMetadata from a dictionary"""
+        return cls(
+            data.get('topic', 'General'),
+            data.get('subtopic', 'General'),
+            data.get('difficulty', 3),
+            list(data.get('tags', [])),
+        )
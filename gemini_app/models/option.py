@@ -1,10 +1,10 @@
 """
 Option class for quiz questions
 """
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from typing import Dict, Any
 
-@dataclass
+@dataclass(slots=True)
 class Option:
     """Represents an answer option for a question"""
     label: str
@@ -15,4 +15,9 @@ class Option:
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization"""
-        return asdict(self)
\ No newline at end of file
+        return {'label': self.label, 'answer': self.answer}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Option':
+        """Create an Option from a dictionary"""
+        return cls(data.get('label', ''), data.get('answer', False))
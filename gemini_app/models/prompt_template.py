@@ -44,6 +44,9 @@ class PromptTemplate:
         Returns the base prompt template for generating quiz questions.
         This template is used to create structured prompts for the Gemini API.
         
+        The prompt is the static prefix (see get_static_prefix) followed by the
+        per-request question specifications (see get_question_prompt).
+        
         Args:
             count: Number of questions to generate
             question_params: Optional list of QuestionParameters. If None, random parameters will be generated
@@ -51,28 +54,24 @@ class PromptTemplate:
         Returns:
             A formatted prompt string for the Gemini API
         """
+        return PromptTemplate.get_static_prefix() + PromptTemplate.get_question_prompt(count, question_params)
+    
+    @staticmethod
+    def get_static_prefix() -> str:
+        """
+        Returns the part of the prompt that is identical for every request:
+        instructions, JSON example and additional requirements. It can be
+        registered once as cached context.
         
-        # Generate random question parameters if none provided
-        if question_params is None:
-            question_params = PromptTemplate._generate_random_question_params(count)
-        
-        # Building the prompt
+        Returns:
+            The static prompt prefix
+        """
         prompt = f"Genera preguntas de admisión para un posgrado (POSCOMP, GeorgiaTech, Harvard, MIT) de computer science con las siguientes características:\n"
-        prompt += f"- Número de preguntas: {count}\n"
         prompt += f"- Cantidad de opciones: {5}\n"
         prompt += f"- Cantidad de respuestas correctas: {1}\n"
         prompt += f"- Cantidad de pistas: {5}\n"
         prompt += f"- Formato de respuesta: JSON\n"
         
-        
-        # Add question specifications
-        for i, params in enumerate(question_params):
-            prompt += f"Pregunta {i+1}:\n"
-            prompt += f"- Tema: {params.topic}\n"
-            prompt += f"- Subtema: {params.subtopic}\n"
-            prompt += f"- Dificultad: {params.difficulty} (escala 1-5)\n"
-            prompt += f"- Tipo de pregunta: {params.question_type.value}\n"
-        
         # Add format instructions
         prompt += (
             "\nCada pregunta debe seguir el siguiente formato JSON:\n"
@@ -86,11 +85,41 @@ class PromptTemplate:
             "- Asegúrate de que cada pregunta tenga una explicación detallada en la sección \"summary\"\n"
             "- Incluye al menos 2 referencias relevantes para cada pregunta\n"
             "- El formato JSON debe cumplir estrictamente con el esquema proporcionado\n\n"
-            "Responde solamente con el JSON de las preguntas generadas.\n"
         )
         
         return prompt
     
+    @staticmethod
+    def get_question_prompt(count: int = 5, question_params: Optional[List[QuestionParameters]] = None) -> str:
+        """
+        Returns the part of the prompt that changes on every request: the
+        number of questions and the parameters of each one.
+        
+        Args:
+            count: Number of questions to generate
+            question_params: Optional list of QuestionParameters. If None, random parameters will be generated
+            
+        Returns:
+            The per-request prompt suffix
+        """
+        # Generate random question parameters if none provided
+        if question_params is None:
+            question_params = PromptTemplate._generate_random_question_params(count)
+        
+        prompt = f"Número de preguntas: {count}\n"
+        
+        # Add question specifications
+        for i, params in enumerate(question_params):
+            prompt += f"Pregunta {i+1}:\n"
+            prompt += f"- Tema: {params.topic}\n"
+            prompt += f"- Subtema: {params.subtopic}\n"
+            prompt += f"- Dificultad: {params.difficulty} (escala 1-5)\n"
+            prompt += f"- Tipo de pregunta: {params.question_type.value}\n"
+        
+        prompt += "\nResponde solamente con el JSON de las preguntas generadas.\n"
+        
+        return prompt
+    
     @staticmethod
     def _generate_random_question_params(count: int) -> List[QuestionParameters]:
         """
@@ -0,0 +1,59 @@
+"""
+StoredQuestion model for the persistent question bank
+"""
+import hashlib
+import json
+from typing import Dict, Any
+from django.db import models
+from .quiz_question import QuizQuestion
+
+
+class StoredQuestion(models.Model):
+    """A generated QuizQuestion persisted in the question bank"""
+    topic = models.CharField(max_length=255)
+    subtopic = models.CharField(max_length=255)
+    difficulty = models.PositiveSmallIntegerField()
+    fingerprint = models.CharField(max_length=64, unique=True)
+    payload = models.JSONField()
+    times_served = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['topic', 'subtopic', 'difficulty']),
+            models.Index(fields=['difficulty']),
+        ]
+
+    def __str__(self):
+        return f"#{self.pk} {self.topic} > {self.subtopic} (Level: {self.difficulty}/5)"
+
+    @staticmethod
+    def fingerprint_for(data: Dict[str, Any]) -> str:
+        """Stable hash of the question text and its options, used to deduplicate"""
+        key = json.dumps(
+            [data.get('question', ''), [opt.get('label', '') for opt in data.get('options', [])]],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def from_question(cls, question: QuizQuestion) -> 'StoredQuestion':
+        """Build an unsaved StoredQuestion from a QuizQuestion"""
+        payload = question.to_dict()
+        return cls(
+            topic=question.metadata.topic,
+            subtopic=question.metadata.subtopic,
+            difficulty=question.metadata.difficulty,
+            fingerprint=cls.fingerprint_for(payload),
+            payload=payload,
+        )
+
+    def to_question(self) -> QuizQuestion:
+        """Rebuild the QuizQuestion stored in this row"""
+        return QuizQuestion.from_dict(self.payload)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Question payload plus the bank id, ready for the session or a JSON response"""
+        result = dict(self.payload)
+        result['id'] = self.pk
+        return result
@@ -1,14 +1,18 @@
 """
 QuizQuestion class for complete question structure
 """
-from dataclasses import dataclass, asdict, field
+from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
 from .option import Option
 from .reference import Reference
 from .metadata import QuestionMetadata
 from .enums import AnswerType, QuestionType
 
-@dataclass
+# Direct value lookups, much cheaper than calling the Enum class
+_QUESTION_TYPES = {member.value: member for member in QuestionType}
+_ANSWER_TYPES = {member.value: member for member in AnswerType}
+
+@dataclass(slots=True)
 class QuizQuestion:
     """Complete quiz question structure that matches the JSON schema"""
     question: str
@@ -24,7 +28,7 @@ class QuizQuestion:
         """Convert the dataclass to a dictionary for JSON serialization"""
         result = {
             'question': self.question,
-            'clues': self.clues,
+            'clues': list(self.clues),
             'questionType': self.questionType.value,
             'answerType': self.answerType.value,
             'options': [opt.to_dict() for opt in self.options],
@@ -37,35 +41,15 @@ class QuizQuestion:
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'QuizQuestion':
         """Create a QuizQuestion instance from a dictionary (JSON response)"""
-        # Process metadata
-        metadata = QuestionMetadata(
-            topic=data.get('metadata', {}).get('topic', 'General'),
-            subtopic=data.get('metadata', {}).get('subtopic', 'General'),
-            difficulty=data.get('metadata', {}).get('difficulty', 3),
-            tags=data.get('metadata', {}).get('tags', [])
-        )
-        
-        # Process options
-        options = [Option(label=opt.get('label', ''), answer=opt.get('answer', False)) 
-                   for opt in data.get('options', [])]
-        
-        # Process references
-        references = []
-        for ref in data.get('references', []):
-            references.append(Reference(
-                type=ref.get('type', 'book'),
-                title=ref.get('title', ''),
-                authors=ref.get('authors', ''),
-            ))
         return cls(
             question=data.get('question', ''),
-            clues=data.get('clues', []),
-            questionType=QuestionType(data.get('questionType', 'conceptual')),
-            answerType=AnswerType(data.get('answerType', 'respuesta_unica')),
-            options=options,
-            metadata=metadata,
+            clues=list(data.get('clues', [])),
+            questionType=_QUESTION_TYPES.get(data.get('questionType', 'conceptual')) or QuestionType(data['questionType']),
+            answerType=_ANSWER_TYPES.get(data.get('answerType', 'respuesta_unica')) or AnswerType(data['answerType']),
+            options=[Option.from_dict(opt) for opt in data.get('options', [])],
+            metadata=QuestionMetadata.from_dict(data.get('metadata', {})),
             summary=data.get('summary', None),
-            references=references
+            references=[Reference.from_dict(ref) for ref in data.get('references', [])]
         )
     
     def __str__(self):
@@ -1,10 +1,10 @@
 """
 Reference class for academic citations
 """
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass
 from typing import Optional, Dict, Any
 
-@dataclass
+@dataclass(slots=True)
 class Reference:
     """Academic reference information"""
     type: Optional[str] = None
@@ -16,4 +16,9 @@ class Reference:
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization"""
-        return asdict(self)
\ No newline at end of file
+        return {'type': self.type, 'title': self.title, 'authors': self.authors}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Reference':
+        """Create a Reference from a dictionary"""
+        return cls(data.get('type', 'book'), data.get('title', ''), data.get('authors', ''))
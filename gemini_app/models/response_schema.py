@@ -0,0 +1,62 @@
+"""
+Response schema for structured output, derived from the question dataclasses
+"""
+import dataclasses
+import typing
+from enum import Enum
+from typing import Any, Dict, List
+from .quiz_question import QuizQuestion
+
+_SCALAR_TYPES = {str: "STRING", int: "INTEGER", float: "NUMBER", bool: "BOOLEAN"}
+
+
+def schema_for(annotation: Any) -> Dict[str, Any]:
+    """
+    Build a Gemini response schema (OpenAPI subset) for a type annotation.
+
+    Supports str, int, float, bool, enums, List[...], Optional[...] and
+    dataclasses. Dataclass fields without a default are required, and
+    properties are ordered as declared.
+
+    Args:
+        annotation: Type to describe
+
+    Returns:
+        Schema dict accepted as `response_schema` by the genai client
+    """
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is typing.Union:
+        non_null = [arg for arg in args if arg is not type(None)]
+        if len(non_null) != 1:
+            raise TypeError(f"Unsupported union in response schema: {annotation}")
+        return dict(schema_for(non_null[0]), nullable=True)
+
+    if origin in (list, List):
+        return {"type": "ARRAY", "items": schema_for(args[0])}
+
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return {"type": "STRING", "enum": [member.value for member in annotation]}
+
+    if dataclasses.is_dataclass(annotation):
+        hints = typing.get_type_hints(annotation)
+        fields = dataclasses.fields(annotation)
+        return {
+            "type": "OBJECT",
+            "properties": {f.name: schema_for(hints[f.name]) for f in fields},
+            "required": [
+                f.name for f in fields
+                if f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING
+            ],
+            "property_ordering": [f.name for f in fields],
+        }
+
+    if annotation in _SCALAR_TYPES:
+        return {"type": _SCALAR_TYPES[annotation]}
+
+    raise TypeError(f"Unsupported type in response schema: {annotation}")
+
+
+# Generations are always asked for a bare JSON array of questions
+QUESTION_LIST_SCHEMA = schema_for(List[QuizQuestion])
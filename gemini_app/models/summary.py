@@ -1,11 +1,11 @@
 """
 Summary class for quiz question explanations
 """
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field
 from typing import List, Dict, Any
 from .reference import Reference
 
-@dataclass
+@dataclass(slots=True)
 class Summary:
     """Explanatory summary with references"""
     summary: str
@@ -19,9 +19,4 @@ class Summary:
     
     def to_dict(self) -> Dict[str, Any]:
         """Convert to dictionary for JSON serialization"""
-        result = {'summary': self.summary, 'references': []}
-        
-        for ref in self.references:
-            result['references'].append(ref.to_dict())
-        
-        return result
\ No newline at end of file
+        return {'summary': self.summary, 'references': [ref.to_dict() for ref in self.references]}
\ No newline at end of file
@@ -1,3 +1,1006 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import runpy
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import RequestFactory, TestCase, override_settings
+
+from . import views
+from .constants import SYLLABUS
+from .controllers.async_question_controller import AsyncGeminiQuestionController
+from .controllers.fake_gemini import FakeGeminiClient
+from .controllers.hedging import Hedger
+from .controllers.incremental_parser import IncrementalQuestionParser
+from .controllers.metrics import generation_metrics
+from .controllers import prompt_cache
+from .controllers.question_controller import GeminiQuestionController, GenerationQueueFull
+from .controllers.question_bank import QuestionBank
+from .controllers import question_corpus
+from .controllers.question_corpus import export_questions, import_questions, open_corpus
+from .controllers.question_decoder import QuestionDecoder, SchemaError, compile_schema
+from .controllers.shared_task_registry import DatabaseTaskRegistry, SharedTaskRegistry, build_task_registry
+from .controllers import task_registry
+from .controllers.task_registry import TaskRegistry
+from .controllers.usage_accounting import CallUsage, UsageRecorder
+from .management.commands import generate_bank
+from .management.commands.benchmark_hotpath import CORPUS_DIR, DEFAULT_BASELINE, load_corpora
+from .models import (
+    AnswerType, GenerationUsage, Option, QuestionMetadata, QuestionType, QuizQuestion, Reference, Summary,
+)
+from .models.prompt_template import QuestionParameters
+from .models.question_bank import StoredQuestion
+from .models.response_schema import QUESTION_LIST_SCHEMA
+
+
+def _async_controller(**kwargs):
+    return AsyncGeminiQuestionController(
+        client=FakeGeminiClient(seed=1),
+        model_backend='fake',
+        pool_size=0,
+        usage_accounting=False,
+        async_views=True,
+        **kwargs
+    )
+
+
+class AsyncTaskRegistryTests(TestCase):
+    """Task registry backends used from the event loop of the async views"""
+
+    def test_database_backend_refused_with_async_views(self):
+        with self.assertRaisesMessage(ValueError, "async views"):
+            _async_controller(task_backend='database')
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'quiz_test_cache',
+    }})
+    def test_database_cache_refused_with_async_views(self):
+        with self.assertRaises(ValueError):
+            build_task_registry('cache', event_loop=True)
+
+    def test_database_backend_allowed_with_sync_views(self):
+        registry = build_task_registry('database')
+        self.assertIsInstance(registry, DatabaseTaskRegistry)
+        self.assertTrue(registry.create('task', status='queued'))
+        self.assertFalse(registry.create('task', status='queued'))
+        registry.update('task', status='completed')
+        self.assertEqual(registry.get('task')['status'], 'completed')
+
+    def test_async_generation_with_shared_backend(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        controller = _async_controller(
+            task_backend='file', task_backend_options={'directory': directory.name}, streaming=True
+        )
+
+        async def generate():
+            return await (await controller.start_generation(count=3, task_id='async-file-task'))
+
+        questions = asyncio.run(generate())
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(controller.get_generation_status('async-file-task')['status'], 'completed')
+
+
+    def test_shared_registry_io_runs_off_the_event_loop(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        controller = _async_controller(
+            task_backend='file', task_backend_options={'directory': directory.name}, streaming=True
+        )
+        registry = controller._generation_tasks
+        threads = set()
+        for name in ('_add', '_load', '_store'):
+            method = getattr(registry, name)
+            def record(*args, method=method):
+                threads.add(threading.current_thread())
+                return method(*args)
+            setattr(registry, name, record)
+
+        async def generate():
+            task = await controller.start_generation(count=3, task_id='offloaded-task', coalesce=True)
+            await task
+            await controller.aget_generation_status('offloaded-task')
+            return threading.current_thread()
+
+        loop_thread = asyncio.run(generate())
+        self.assertTrue(threads)
+        self.assertNotIn(loop_thread, threads)
+
+    def test_shared_registry_requires_the_storage_methods(self):
+        with self.assertRaises(TypeError):
+            SharedTaskRegistry()
+
+        class Incomplete(SharedTaskRegistry):
+            def _load(self, task_id):
+                return None
+
+        with self.assertRaises(TypeError):
+            Incomplete()
+
+
+class ResponseParsingTests(TestCase):
+    """Decoding of the response shapes recorded in the benchmark corpora"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.controller = GeminiQuestionController(
+            client=FakeGeminiClient(), model_backend='fake', pool_size=0, usage_accounting=False
+        )
+
+    @staticmethod
+    def corpus(name):
+        return (CORPUS_DIR / f'{name}.txt').read_text(encoding='utf-8')
+
+    def test_question_counts_match_benchmark_baseline(self):
+        expected = json.loads(DEFAULT_BASELINE.read_text(encoding='utf-8'))['questions']
+        with self.assertLogs('gemini_app', 'WARNING'):
+            counts = {
+                name: len(self.controller._parse_response(text)) for name, text in load_corpora().items()
+            }
+        self.assertEqual(counts, expected)
+
+    def test_single_object(self):
+        questions = self.controller._parse_response(self.corpus('single_object'))
+        self.assertEqual(len(questions), 1)
+        self.assertEqual(len(questions[0].options), 5)
+
+    def test_parser_ignores_arrays_inside_a_bare_object(self):
+        parser = IncrementalQuestionParser()
+        self.assertEqual(parser.feed(self.corpus('single_object')), [])
+        self.assertEqual((parser.parsed, parser.dropped, parser.truncated), (0, 0, False))
+
+    def test_questions_key(self):
+        text = '{"note": "questions", "questions": ' + self.corpus('array_5') + '}'
+        self.assertEqual(len(self.controller._parse_response(text)), 5)
+        self.assertEqual(len(self.controller._parse_response(self.corpus('questions_key_5'))), 5)
+
+    def test_fenced(self):
+        self.assertEqual(len(self.controller._parse_response(self.corpus('fenced_5'))), 5)
+
+    def test_truncated(self):
+        # Cut between two questions, and inside the last one
+        questions, dropped = QuestionDecoder().salvage(self.corpus('truncated_5'))
+        self.assertEqual((len(questions), dropped), (4, 0))
+        questions, dropped = QuestionDecoder().salvage(self.corpus('array_5')[:-200])
+        self.assertEqual((len(questions), dropped), (4, 1))
+        self.assertEqual(len(self.controller._parse_response(self.corpus('truncated_5'))), 4)
+
+    def test_invalid_items(self):
+        with self.assertLogs('gemini_app.controllers.question_decoder', 'WARNING'):
+            questions, dropped = QuestionDecoder().decode(self.corpus('invalid_items_5'))
+        self.assertEqual((len(questions), dropped), (3, 2))
+
+    def test_streamed_in_small_chunks(self):
+        text = self.corpus('array_5')
+        parser = IncrementalQuestionParser()
+        items = []
+        for start in range(0, len(text), 7):
+            items.extend(parser.feed(text[start:start + 7]))
+        self.assertEqual(len(items), 5)
+        self.assertFalse(parser.truncated)
+
+
+class GenerationMetricsTests(TestCase):
+    """Counters of finished generations"""
+
+    def test_fanout_generation_counted_as_completed(self):
+        controller = GeminiQuestionController(
+            client=FakeGeminiClient(), model_backend='fake', pool_size=0, usage_accounting=False, fanout=True
+        )
+        questions = controller.generate_questions(3, task_id='fanout-task')
+        self.assertEqual(len(questions), 3)
+        counters = controller.metrics.snapshot()['counters']['generations_total']
+        self.assertEqual(counters, {'status="completed"': 1})
+
+
+class HedgerTests(TestCase):
+    """Hedged sync calls"""
+
+    def hedger(self, **kwargs):
+        return Hedger(generation_metrics(), min_samples=3, min_delay=0.05, **kwargs)
+
+    def test_unhedgeable_call_runs_on_caller_thread(self):
+        hedger = self.hedger()
+        result = hedger.call('batch', lambda: threading.current_thread())
+        self.assertIs(result, threading.current_thread())
+
+    def test_slow_call_is_hedged(self):
+        hedger = self.hedger()
+        for _ in range(3):
+            hedger.call('batch', lambda: 'fast')
+        latencies = iter([1.0, 0.0])
+        discarded = []
+
+        def send():
+            time.sleep(next(latencies))
+            return threading.current_thread().name
+
+        started = time.perf_counter()
+        winner = hedger.call('batch', send, on_discard=discarded.append)
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertTrue(winner.startswith('gemini-hedge'))
+        counters = hedger.metrics.snapshot()['counters']['hedges_total']
+        self.assertEqual(counters, {'call="batch",winner="hedge"': 1})
+
+
+    def test_discarded_hedge_counts_only_its_tokens(self):
+        controller = GeminiQuestionController(
+            client=FakeGeminiClient(seed=1), model_backend='fake', pool_size=0,
+            hedging=True, hedge_budget=1, hedge_min_delay=0.05, usage_flush_interval=60,
+        )
+        controller.hedger.min_samples = 3
+        params = [QuestionParameters(topic='Álgebra Lineal', subtopic='Espacios Vectoriales, Subespacios',
+                                     difficulty=1, question_type=QuestionType.CONCEPTUAL,
+                                     response_type=AnswerType.UNIQUE_ANSWER)]
+        for _ in range(3):
+            controller.generate_for_params(params)
+
+        generate_content = controller.client.models.generate_content
+        latencies = iter([1.0, 0.0])
+
+        def slow_then_fast(**kwargs):
+            time.sleep(next(latencies))
+            return generate_content(**kwargs)
+
+        with mock.patch.object(controller.client.models, 'generate_content', side_effect=slow_then_fast):
+            self.assertEqual(len(controller.generate_for_params(params)), 1)
+            # The losing request is recorded when it returns
+            time.sleep(1.2)
+        controller.usage.flush()
+
+        rows = {row.call: row for row in GenerationUsage.objects.all()}
+        self.assertEqual(set(rows), {'direct', 'hedge_discarded'})
+        self.assertEqual((rows['direct'].requested, rows['direct'].questions), (4, 4))
+        self.assertEqual((rows['hedge_discarded'].requested, rows['hedge_discarded'].questions), (0, 0))
+        self.assertGreater(rows['hedge_discarded'].output_tokens, 0)
+
+
+class QuestionCorpusTests(TestCase):
+    """JSONL export and import of the question bank"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'questions.jsonl.gz')
+        questions = QuestionDecoder().decode(CORPUS_DIR.joinpath('array_5.txt').read_text(encoding='utf-8'))[0]
+        for question in questions:
+            StoredQuestion.from_question(question).save()
+
+    def test_gzip_round_trip(self):
+        with open_corpus(self.path, 'w') as stream:
+            self.assertEqual(export_questions(stream), 5)
+        with open_corpus(self.path, 'r') as stream:
+            self.assertEqual(import_questions(stream)['duplicate'], 5)
+
+        StoredQuestion.objects.filter(pk__in=StoredQuestion.objects.order_by('pk').values('pk')[:2]).delete()
+        with open_corpus(self.path, 'r') as stream:
+            stats = import_questions(stream)
+        self.assertEqual((stats['inserted'], stats['duplicate']), (2, 3))
+        self.assertEqual(StoredQuestion.objects.count(), 5)
+
+    def test_each_batch_is_a_transaction(self):
+        with open_corpus(self.path, 'w') as stream:
+            export_questions(stream)
+        StoredQuestion.objects.filter(pk__in=StoredQuestion.objects.order_by('pk').values('pk')[:3]).delete()
+        with mock.patch.object(question_corpus.transaction, 'atomic', wraps=question_corpus.transaction.atomic) as atomic:
+            with open_corpus(self.path, 'r') as stream:
+                stats = import_questions(stream, batch_size=2)
+        # bulk_create opens its own atomic blocks with arguments
+        self.assertEqual(atomic.call_args_list.count(mock.call()), 3)
+        self.assertEqual((stats['inserted'], stats['duplicate']), (3, 2))
+
+
+class WorkerBootTests(TestCase):
+    """Pool warm-up started by gunicorn's post_worker_init hook"""
+
+    @override_settings(QUIZ_MODEL_BACKEND='gemini', QUIZ_WARM_POOL=True, QUIZ_POOL_SIZE=20)
+    def test_no_warm_up_without_credentials(self):
+        with mock.patch.dict(os.environ):
+            os.environ.pop('GOOGLE_API_KEY', None)
+            with mock.patch.object(views, 'get_controller') as get_controller:
+                self.assertFalse(views.warm_pool_in_background())
+                runpy.run_path(str(settings.BASE_DIR / 'gunicorn.conf.py'))['post_worker_init'](None)
+        get_controller.assert_not_called()
+
+    @override_settings(QUIZ_MODEL_BACKEND='fake', QUIZ_WARM_POOL=True, QUIZ_POOL_SIZE=20)
+    def test_warm_up_failure_is_logged(self):
+        with mock.patch.object(views, 'get_controller', side_effect=ValueError("boom")):
+            with self.assertLogs('gemini_app.views', 'WARNING'):
+                self.assertTrue(views.warm_pool_in_background())
+                for thread in threading.enumerate():
+                    if thread.name == 'quiz-warm-pool':
+                        thread.join()
+
+
+class GenerationEventsTests(TestCase):
+    """Status stream of a generation under WSGI"""
+
+    @override_settings(QUIZ_SSE_WSGI_MAX_DURATION=1, QUIZ_SSE_MAX_DURATION=60)
+    def test_sync_stream_is_a_bounded_long_poll(self):
+        controller = _async_controller()
+        task_id = f"sse-{time.monotonic_ns()}"
+        controller._generation_tasks.create(task_id, status="generating", progress=0)
+        session = self.client.session
+        session['generation_task_id'] = task_id
+        session.save()
+
+        started = time.monotonic()
+        with mock.patch.object(views, 'get_controller', return_value=controller):
+            response = self.client.get('/generation_events/')
+            body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertLess(time.monotonic() - started, 3)
+        self.assertIn('event: progress', body)
+
+    def test_shared_registry_backs_off_while_waiting(self):
+        with tempfile.TemporaryDirectory() as directory:
+            registry = build_task_registry('file', {'directory': directory})
+            registry.create('task', status="generating")
+            with mock.patch.object(registry, '_load', wraps=registry._load) as load:
+                registry.wait_for_update('task', 1, timeout=1.5)
+        # 0.25 + 0.5 + 0.75 s of sleeps instead of six polls of 0.25 s
+        self.assertLessEqual(load.call_count, 4)
+
+
+class AnswerIdempotencyTests(TestCase):
+    """submit_answer and next_question each apply once per question token"""
+
+    def setUp(self):
+        controller = _async_controller()
+        bank = QuestionBank(controller)
+        questions = controller.generate_questions(8, task_id=f"idempotency-{time.monotonic_ns()}")
+        self.ids = [row.pk for row in bank.store(questions)]
+        for target, value in (('get_controller', controller), ('get_question_bank', bank)):
+            patcher = mock.patch.object(views, target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        session = self.client.session
+        session.update({
+            'question_ids': self.ids,
+            'current_question_index': 0,
+            'question_step': 0,
+            'metrics': views.Metrics().to_dict(),
+        })
+        session.save()
+
+    def token(self, step):
+        return f"{step}:{self.ids[step]}"
+
+    def submit(self, token):
+        return self.client.post(
+            '/submit_answer/', data=json.dumps({'is_correct': True, 'token': token}),
+            content_type='application/json',
+        )
+
+    def next(self, token):
+        return self.client.get('/next_question/', {'token': token})
+
+    def answered(self):
+        return self.client.session['metrics']['total_answered']
+
+    def test_duplicate_submit_counts_once(self):
+        self.submit(self.token(0))
+        self.submit(self.token(0))
+        self.assertEqual(self.answered(), 1)
+        self.assertEqual(self.client.session['current_question_index'], 0)
+
+    def test_duplicate_next_advances_once(self):
+        self.next(self.token(0))
+        response = self.next(self.token(0))
+        self.assertEqual(self.client.session['current_question_index'], 1)
+        self.assertEqual(response.json()['question_token'], self.token(1))
+
+    def test_answer_arriving_after_next_is_counted(self):
+        self.next(self.token(0))
+        self.submit(self.token(0))
+        self.submit(self.token(0))
+        self.assertEqual(self.answered(), 1)
+        self.assertEqual(self.client.session['current_question_index'], 1)
+        # Two steps back is stale
+        self.next(self.token(1))
+        self.next(self.token(2))
+        self.submit(self.token(0))
+        self.assertEqual(self.answered(), 1)
+
+    def test_missing_token_is_rejected(self):
+        self.assertEqual(self.submit(None).status_code, 400)
+        self.assertEqual(self.client.get('/next_question/').status_code, 400)
+        self.assertEqual(self.answered(), 0)
+        self.assertEqual(self.client.session['current_question_index'], 0)
+
+    def test_repeated_requests_do_not_write_the_session(self):
+        self.submit(self.token(0))
+        self.next(self.token(0))
+        with mock.patch.object(SessionStore, 'save') as save:
+            self.submit(self.token(0))
+            self.next(self.token(0))
+            self.submit(self.token(1))
+        # Only the first answer to the new question is written
+        self.assertEqual(save.call_count, 1)
+
+
+class GenerateBankTests(TestCase):
+    """Cell accounting of the generate_bank command"""
+
+    def test_duplicate_batches_give_up_and_credit_their_own_cell(self):
+        topic = 'Álgebra Lineal'
+        subtopic = SYLLABUS[topic][0]
+        params = [
+            QuestionParameters(topic=topic, subtopic=subtopic, difficulty=1,
+                               question_type=QuestionType.CONCEPTUAL, response_type=AnswerType.UNIQUE_ANSWER)
+            for _ in range(3)
+        ]
+        questions = _async_controller().generate_for_params(params)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoint.json')
+            # Every request returns the same questions, whatever cell it asked for
+            with mock.patch.object(GeminiQuestionController, 'generate_for_params', return_value=questions):
+                call_command(
+                    'generate_bank', per_cell=1, topics=[topic], difficulties=[1, 2], rate=0,
+                    concurrency=1, max_failures=100, max_empty_rounds=2, backend='fake',
+                    use_real_db=True, checkpoint=path, stdout=io.StringIO(), stderr=io.StringIO(),
+                )
+            with open(path, encoding='utf-8') as f:
+                checkpoint = json.load(f)
+        self.assertEqual(checkpoint['cells'], {generate_bank.cell_key(topic, subtopic, 1): 1})
+        self.assertEqual(checkpoint['failed_requests'], checkpoint['requests'] - 1)
+
+
+class CoalescingTests(TestCase):
+    """Sessions joining a queued generation each get their own questions"""
+
+    def assertDisjointShares(self, controller, task_ids, count):
+        shares = [
+            [json.dumps(q, sort_keys=True) for q in controller.get_generation_status(task_id)['questions']]
+            for task_id in task_ids
+        ]
+        for share in shares:
+            self.assertEqual(len(share), count)
+        self.assertEqual(len(set().union(*shares)), count * len(task_ids))
+
+    def test_sync_followers_get_disjoint_questions(self):
+        controller = GeminiQuestionController(
+            client=FakeGeminiClient(seed=1, latency=0.2), model_backend='fake',
+            pool_size=0, usage_accounting=False, max_workers=1,
+        )
+        self.addCleanup(controller.shutdown)
+        # Keep the only worker busy so the coalesced generation stays queued
+        controller.submit_generation(2)
+        received = {}
+        futures = [
+            controller.submit_generation(
+                3, task_id=f"coalesced-{i}", coalesce=True,
+                callback=lambda questions, i=i: received.setdefault(i, questions),
+            )
+            for i in range(3)
+        ]
+        self.assertIs(futures[1], futures[0])
+        self.assertEqual(len(futures[0].result(timeout=10)), 9)
+        self.assertDisjointShares(controller, [f"coalesced-{i}" for i in range(3)], 3)
+        # Follower callbacks run once the shared future is done
+        deadline = time.monotonic() + 5
+        while len(received) < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        # The leader's callback gets the whole batch (e.g. to store it), followers their share
+        self.assertEqual([len(received[i]) for i in range(3)], [9, 3, 3])
+        self.assertEqual(controller.get_coalescing_stats()['followers'], 2)
+
+    def test_async_followers_get_disjoint_questions(self):
+        controller = _async_controller()
+
+        async def generate():
+            # Both requests arrive before the leader's task gets to run
+            tasks = await asyncio.gather(*(
+                controller.start_generation(3, task_id=f"acoalesced-{i}", coalesce=True) for i in range(2)
+            ))
+            await asyncio.gather(*tasks)
+
+        asyncio.run(generate())
+        self.assertDisjointShares(controller, ["acoalesced-0", "acoalesced-1"], 3)
+        self.assertEqual(controller.get_coalescing_stats()['followers'], 1)
+
+
+class QuestionBankTests(TestCase):
+    """Random sampling and stock checks of the persistent question bank"""
+
+    def setUp(self):
+        self.controller = _async_controller()
+        self.bank = QuestionBank(self.controller)
+
+    def fill(self, count):
+        questions = self.controller.generate_questions(count, task_id=f"bank-{time.monotonic_ns()}")
+        return [row.pk for row in self.bank.store(questions)]
+
+    def test_take_samples_rows_individually(self):
+        self.assertEqual(self.bank.take(5), [])
+        ids = sorted(set(self.fill(30)))
+        excluded = ids[:10]
+        contiguous = 0
+        for _ in range(20):
+            picked = sorted(q.pk for q in self.bank.take(5, exclude_ids=excluded))
+            self.assertEqual(len(set(picked)), 5)
+            self.assertFalse(set(picked) & set(excluded))
+            positions = [ids.index(pk) for pk in picked]
+            contiguous += positions == list(range(positions[0], positions[0] + 5))
+        # A range scan from a random start always returns consecutive ids
+        self.assertLess(contiguous, 20)
+
+    def test_take_falls_back_when_sampling_misses(self):
+        ids = self.fill(6)
+        self.bank.sample_rounds = 0
+        self.assertEqual(len(self.bank.take(10, exclude_ids=ids[:1])), len(set(ids)) - 1)
+
+    def test_stocked_bank_is_not_counted_on_every_load(self):
+        with mock.patch.object(self.bank, 'count', return_value=self.bank.min_size) as count:
+            self.bank.ensure_stocked()
+            self.bank.ensure_stocked()
+        self.assertEqual(count.call_count, 1)
+
+
+class ServedIdsTests(TestCase):
+    """Ids already shown to a session are kept out of the session"""
+
+    def test_served_ids_live_in_the_cache(self):
+        controller = _async_controller()
+        bank = QuestionBank(controller, min_size=0)
+        questions = controller.generate_questions(12, task_id=f"served-{time.monotonic_ns()}")
+        bank.store(questions)
+        for target, value in (('get_controller', controller), ('get_question_bank', bank)):
+            patcher = mock.patch.object(views, target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.client.get('/')
+        session = self.client.session
+        served = caches[settings.QUIZ_SERVED_IDS_CACHE_ALIAS].get(f"quiz_served:{session.session_key}")
+        self.assertEqual(served, session['question_ids'])
+        self.assertNotIn('served_question_ids', session)
+        self.assertLess(len(json.dumps(dict(session.items()))), 500)
+
+
+class ModelSerializationTests(TestCase):
+    """to_dict / from_dict of the question dataclasses"""
+
+    def setUp(self):
+        self.data = json.loads(CORPUS_DIR.joinpath('array_5.txt').read_text(encoding='utf-8'))[0]
+
+    def test_quiz_question_round_trip(self):
+        question = QuizQuestion.from_dict(self.data)
+        self.assertEqual(question.to_dict(), self.data)
+        self.assertEqual(QuizQuestion.from_dict(question.to_dict()), question)
+
+    def test_quiz_question_dicts_do_not_share_state(self):
+        question = QuizQuestion.from_dict(self.data)
+        self.data['clues'].append("changed input")
+        result = question.to_dict()
+        result['clues'].append("changed output")
+        result['metadata']['tags'].append("changed output")
+        result['options'][0]['label'] = "changed output"
+        self.assertEqual(QuizQuestion.from_dict(question.to_dict()), question)
+        self.assertNotIn("changed input", question.clues)
+
+    def test_part_round_trips(self):
+        for cls, data in (
+            (QuestionMetadata, self.data['metadata']),
+            (Option, self.data['options'][0]),
+            (Reference, self.data['references'][0]),
+        ):
+            with self.subTest(cls=cls.__name__):
+                instance = cls.from_dict(data)
+                self.assertEqual(instance.to_dict(), data)
+                self.assertEqual(cls.from_dict(instance.to_dict()), instance)
+
+    def test_to_dict_only_output(self):
+        summary = Summary("s", [Reference.from_dict(self.data['references'][0])])
+        self.assertEqual(summary.to_dict(), {'summary': "s", 'references': [self.data['references'][0]]})
+        params = QuestionParameters(topic='t', subtopic='s', difficulty=2, question_type=QuestionType.CONCEPTUAL,
+                                    response_type=AnswerType.UNIQUE_ANSWER)
+        self.assertEqual(json.loads(json.dumps(params.to_dict()))['question_type'], 'conceptual')
+
+
+@override_settings(QUIZ_PREFETCH_THRESHOLD=2)
+class PrefetchTests(TestCase):
+    """The next batch is requested while the user still has questions left"""
+
+    def setUp(self):
+        self.controller = _async_controller()
+        self.bank = QuestionBank(self.controller, min_size=0)
+        for target, value in (('get_controller', self.controller), ('get_question_bank', self.bank)):
+            patcher = mock.patch.object(views, target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def request(self, question_ids, index):
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        request.session.update({'question_ids': question_ids, 'current_question_index': index})
+        return request
+
+    def test_generation_starts_at_the_threshold(self):
+        start = mock.Mock()
+        views._init_quiz(self.request([1, 2, 3, 4, 5], 2), start_generation=start)
+        start.assert_not_called()
+        views._init_quiz(self.request([1, 2, 3, 4, 5], 3), start_generation=start)
+        start.assert_called_once()
+
+    def test_prefetched_batch_follows_the_unseen_questions(self):
+        questions = self.controller.generate_questions(8, task_id=f"prefetch-{time.monotonic_ns()}")
+        self.bank.store(questions)
+        request = self.request([101, 102, 103, 104, 105], 3)
+        start = mock.Mock()
+        views._init_quiz(request, start_generation=start)
+        start.assert_not_called()
+        self.assertEqual(request.session['current_question_index'], 0)
+        self.assertEqual(request.session['question_ids'][:2], [104, 105])
+        self.assertEqual(len(request.session['question_ids']), 2 + views.DEFAULT_BATCH_SIZE)
+
+
+class WarmPoolTests(TestCase):
+    """Ready questions shared by all sessions of the process"""
+
+    def test_pool_hits_and_misses(self):
+        controller = GeminiQuestionController(
+            client=FakeGeminiClient(seed=1), model_backend='fake', pool_size=10, pool_refill_batch=5,
+            usage_accounting=False,
+        )
+        self.addCleanup(controller.shutdown)
+        self.assertIsNone(controller.take_from_pool(5))
+        deadline = time.monotonic() + 5
+        while controller.get_pool_stats()['refilling'] and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(controller.get_pool_stats()['size'], 10)
+
+        first = controller.take_from_pool(5)
+        second = controller.take_from_pool(5)
+        self.assertEqual(len(first), 5)
+        self.assertFalse({q.question for q in first} & {q.question for q in second})
+        stats = controller.get_pool_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_disabled_pool_is_not_counted(self):
+        controller = GeminiQuestionController(
+            client=FakeGeminiClient(seed=1), model_backend='fake', usage_accounting=False,
+        )
+        self.addCleanup(controller.shutdown)
+        self.assertIsNone(controller.take_from_pool(5))
+        self.assertFalse(controller.refill_pool())
+        self.assertEqual(controller.get_pool_stats()['misses'], 0)
+
+
+class TaskRegistryTests(TestCase):
+    """Expiry and size bounds of the in-memory task registry"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(task_registry, 'time')
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def test_entries_expire_after_their_last_update(self):
+        registry = TaskRegistry(ttl=10)
+        registry.create('old', status='queued')
+        registry.create('fresh', status='queued')
+        self.now += 6
+        registry.update('fresh', status='generating')
+        self.now += 6
+        self.assertNotIn('old', registry)
+        self.assertEqual(registry.get('fresh')['status'], 'generating')
+        self.assertEqual(registry.version('old'), 0)
+        self.now += 10
+        self.assertEqual(len(registry), 0)
+
+    def test_least_recently_updated_entry_is_evicted_past_max_entries(self):
+        registry = TaskRegistry(max_entries=2)
+        registry.create('a')
+        registry.create('b')
+        registry.update('a', status='generating')
+        registry.create('c')
+        self.assertEqual([task for task in 'abc' if task in registry], ['a', 'c'])
+
+    def test_question_payloads_are_bounded_by_size(self):
+        questions = [{'question': 'x' * 100}]
+        size = len(json.dumps(questions, separators=(',', ':')))
+        registry = TaskRegistry(max_bytes=2 * size)
+        for task_id in ('a', 'b', 'c'):
+            registry.create(task_id)
+            registry.update(task_id, questions=questions)
+        self.assertNotIn('a', registry)
+        self.assertEqual(registry.total_bytes, 2 * size)
+        registry.update('b', questions=[])
+        registry.remove('c')
+        self.assertEqual(registry.total_bytes, len('[]'))
+
+
+class GenerationQueueTests(TestCase):
+    """Backpressure of the bounded generation worker pool"""
+
+    def setUp(self):
+        self.controller = GeminiQuestionController(
+            client=FakeGeminiClient(seed=1), model_backend='fake', max_workers=1, max_queue=1,
+            usage_accounting=False,
+        )
+        self.addCleanup(self.controller.shutdown)
+        self.gate = threading.Event()
+        self.addCleanup(self.gate.set)
+        patcher = mock.patch.object(
+            self.controller, '_run_generation', side_effect=lambda count, task_id: self.gate.wait(5) and []
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_full_queue_rejects_new_generations(self):
+        running = self.controller.submit_generation(3, task_id='running')
+        queued = self.controller.submit_generation(3, task_id='queued')
+        with self.assertRaises(GenerationQueueFull):
+            self.controller.submit_generation(3, task_id='rejected')
+        self.assertEqual(self.controller.get_generation_status('rejected')['status'], 'not_found')
+        self.assertEqual(self.controller.get_queue_position('queued'), 1)
+
+        self.gate.set()
+        running.result(timeout=5)
+        queued.result(timeout=5)
+        self.controller.submit_generation(3, task_id='accepted').result(timeout=5)
+
+    def test_rejection_is_reported_when_the_session_has_no_questions(self):
+        self.controller.submit_generation(3, task_id='running')
+        self.controller.submit_generation(3, task_id='queued')
+        request = RequestFactory().get('/')
+        request.session = SessionStore()
+        with mock.patch.object(views, 'get_controller', return_value=self.controller):
+            views._start_question_generation(request)
+        self.assertIn('generation_error', request.session)
+        self.assertNotIn('generation_task_id', request.session)
+
+
+class AsyncGenerationTests(TestCase):
+    """Generations run as tasks on the event loop with the async client"""
+
+    def test_generation_uses_the_async_client(self):
+        controller = _async_controller()
+        received = []
+
+        async def callback(questions):
+            received.append(questions)
+
+        async def generate():
+            task = await controller.start_generation(count=3, task_id='async-task', callback=callback)
+            duplicate = await controller.start_generation(count=3, task_id='async-task')
+            return await task, duplicate
+
+        with mock.patch.object(controller.client.models, 'generate_content', side_effect=AssertionError):
+            questions, duplicate = asyncio.run(generate())
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(received, [questions])
+        self.assertIsNone(duplicate)
+        self.assertEqual(controller.get_generation_status('async-task')['status'], 'completed')
+
+    def test_pending_generations_are_bounded(self):
+        controller = _async_controller(max_async_generations=1)
+
+        async def generate():
+            task = await controller.start_generation(count=3, task_id='async-first')
+            with self.assertRaises(GenerationQueueFull):
+                await controller.start_generation(count=3, task_id='async-second')
+            await task
+            await (await controller.start_generation(count=3, task_id='async-third'))
+
+        asyncio.run(generate())
+        self.assertEqual(controller.get_generation_status('async-second')['status'], 'not_found')
+        self.assertEqual(controller.get_generation_status('async-third')['status'], 'completed')
+
+
+class StreamingGenerationTests(TestCase):
+    """Streamed responses publish each question as soon as it is parsed"""
+
+    def test_questions_are_published_before_the_stream_ends(self):
+        controller = GeminiQuestionController(
+            client=FakeGeminiClient(chunk_size=64), model_backend='fake', streaming=True, usage_accounting=False,
+        )
+        self.addCleanup(controller.shutdown)
+        stream = controller.client.models.generate_content_stream
+        seen = []
+
+        def observed_stream(*args, **kwargs):
+            for chunk in stream(*args, **kwargs):
+                status = controller.get_generation_status('streamed-task')
+                seen.append((status['status'], len(status.get('questions') or [])))
+                yield chunk
+
+        with mock.patch.object(controller.client.models, 'generate_content_stream', observed_stream):
+            questions = controller.submit_generation(3, task_id='streamed-task').result(timeout=5)
+        self.assertEqual(len(questions), 3)
+        published = [count for state, count in seen if state not in views.FINAL_GENERATION_STATES]
+        self.assertEqual(published, sorted(published))
+        self.assertTrue(any(0 < count < 3 for count in published))
+        status = controller.get_generation_status('streamed-task')
+        self.assertEqual((status['status'], len(status['questions'])), ('completed', 3))
+
+
+class FanoutGenerationTests(TestCase):
+    """Fan-out generations send one request per question and retry failed items"""
+
+    def controller(self, **kwargs):
+        controller = GeminiQuestionController(
+            client=FakeGeminiClient(seed=1), model_backend='fake', fanout=True, usage_accounting=False, **kwargs
+        )
+        self.addCleanup(controller.shutdown)
+        return controller
+
+    def fail_first(self, controller, failures):
+        """Make the first `failures` single-question requests return nothing"""
+        generate = controller._generate_single_question
+        lock = threading.Lock()
+        calls = []
+
+        def flaky(params):
+            with lock:
+                calls.append(params)
+                failed = len(calls) <= failures
+            return None if failed else generate(params)
+
+        return mock.patch.object(controller, '_generate_single_question', side_effect=flaky), calls
+
+    def test_one_request_per_question(self):
+        controller = self.controller()
+        questions = controller.generate_questions(4, task_id='fanout-requests')
+        self.assertEqual(len(questions), 4)
+        self.assertEqual(controller.client.calls, 4)
+        self.assertEqual(len({q.question for q in questions}), 4)
+
+    def test_failed_items_are_retried(self):
+        controller = self.controller(fanout_retries=1)
+        patcher, calls = self.fail_first(controller, 1)
+        with patcher:
+            questions = controller.generate_questions(3, task_id='fanout-retry')
+        self.assertEqual(len(questions), 3)
+        self.assertEqual(len(calls), 4)
+
+    def test_items_failing_every_retry_are_left_out(self):
+        controller = self.controller(fanout_retries=0)
+        patcher, calls = self.fail_first(controller, 1)
+        with patcher, self.assertLogs('gemini_app.controllers.question_controller', 'WARNING'):
+            questions = controller.generate_questions(3, task_id='fanout-partial')
+        self.assertEqual(len(questions), 2)
+        self.assertEqual(len(calls), 3)
+
+
+class PromptCacheTests(TestCase):
+    """The static prompt prefix is sent as Gemini cached content"""
+
+    def setUp(self):
+        self.now = 1000.0
+        patcher = mock.patch.object(prompt_cache, 'time')
+        patcher.start().monotonic.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+        self.client = FakeGeminiClient()
+
+    def test_prefix_is_cached_and_refreshed_before_it_expires(self):
+        cache = prompt_cache.GeminiPromptCache(self.client, 'model', ttl=100, prefix='PREFIX ')
+        with mock.patch.object(self.client.caches, 'create', wraps=self.client.caches.create) as create:
+            first = cache.request('prompt')
+            self.now += 80
+            second = cache.request('prompt')
+            self.now += 15
+            third = cache.request('prompt')
+        self.assertEqual(first['contents'], 'prompt')
+        self.assertEqual(first['config'], second['config'])
+        self.assertNotEqual(second['config'], third['config'])
+        self.assertEqual(create.call_count, 2)
+        self.assertEqual(cache.get_stats()['cached_requests'], 3)
+
+    def test_prefix_is_sent_inline_when_caching_fails(self):
+        cache = prompt_cache.GeminiPromptCache(self.client, 'model', ttl=100, prefix='PREFIX ')
+        with mock.patch.object(self.client.caches, 'create', side_effect=ValueError("too small")) as create:
+            with self.assertLogs('gemini_app.controllers.prompt_cache', 'WARNING'):
+                request = cache.request('prompt')
+            cache.request('prompt')
+        self.assertEqual(request, {'contents': 'PREFIX prompt'})
+        self.assertEqual(create.call_count, 1)
+        self.now += 100
+        cache.request('prompt')
+        stats = cache.get_stats()
+        self.assertEqual((stats['inline_requests'], stats['cached_requests']), (2, 1))
+        self.assertTrue(stats['cache'].startswith('cachedContents/'))
+
+
+class ResponseSchemaTests(TestCase):
+    """Structured output schema and its validator"""
+
+    def test_schema_follows_the_dataclasses(self):
+        schema = QUESTION_LIST_SCHEMA['items']
+        self.assertEqual(schema['property_ordering'][:2], ['question', 'clues'])
+        self.assertIn('options', schema['required'])
+        self.assertEqual(schema['properties']['questionType']['enum'], [t.value for t in QuestionType])
+        self.assertEqual(schema['properties']['options']['items']['properties']['answer'], {'type': 'BOOLEAN'})
+
+    def test_validator_checks_types_enums_and_required_properties(self):
+        validate = compile_schema({
+            'type': 'OBJECT',
+            'properties': {
+                'kind': {'type': 'STRING', 'enum': ['a', 'b']},
+                'size': {'type': 'INTEGER'},
+                'note': {'type': 'STRING', 'nullable': True},
+            },
+            'required': ['kind'],
+        })
+        validate({'kind': 'a', 'size': 3, 'note': None})
+        for value in ({}, {'kind': 'c'}, {'kind': 'a', 'size': True}, {'kind': 'a', 'size': '3'}, []):
+            with self.subTest(value=value), self.assertRaises(SchemaError):
+                validate(value)
+
+    def test_decoder_requires_an_array(self):
+        item = json.loads(CORPUS_DIR.joinpath('array_5.txt').read_text(encoding='utf-8'))[0]
+        with self.assertRaises(SchemaError):
+            QuestionDecoder().decode(json.dumps(item))
+        with self.assertLogs('gemini_app.controllers.question_decoder', 'WARNING'):
+            questions, dropped = QuestionDecoder().decode(json.dumps([item, dict(item, options='none')]))
+        self.assertEqual((len(questions), dropped), (1, 1))
+
+    def test_schema_is_sent_with_the_cached_prefix(self):
+        controller = GeminiQuestionController(
+            client=FakeGeminiClient(), model_backend='fake', context_cache=True, usage_accounting=False,
+        )
+        self.addCleanup(controller.shutdown)
+        config = controller._generation_request('prompt')['config']
+        self.assertEqual(config['response_schema'], QUESTION_LIST_SCHEMA)
+        self.assertEqual(config['response_mime_type'], 'application/json')
+        self.assertIn('cached_content', config)
+
+
+class UsageAccountingTests(TestCase):
+    """Token usage split across the questions of a call and flushed to the database"""
+
+    def setUp(self):
+        self.params = [
+            QuestionParameters(topic=topic, subtopic=subtopic, difficulty=2, question_type=QuestionType.CONCEPTUAL,
+                               response_type=AnswerType.UNIQUE_ANSWER)
+            for topic, subtopic in (('A', 'a1'), ('A', 'a2'), ('B', 'b1'))
+        ]
+        self.recorder = UsageRecorder('fake', flush_interval=3600)
+
+    def question(self, params):
+        item = json.loads(CORPUS_DIR.joinpath('array_5.txt').read_text(encoding='utf-8'))[0]
+        item['metadata'].update(topic=params.topic, subtopic=params.subtopic, difficulty=params.difficulty)
+        return QuizQuestion.from_dict(item)
+
+    def rows(self):
+        return {row.subtopic: row for row in GenerationUsage.objects.order_by('subtopic')}
+
+    def test_usage_is_split_across_the_requested_questions(self):
+        self.recorder.record('batch', self.params, CallUsage(100, 40, 11), 0.3, [self.question(self.params[2])])
+        self.assertEqual(self.recorder.pending(), 3)
+        self.recorder.flush()
+        rows = self.rows()
+        self.assertEqual(sum(row.input_tokens for row in rows.values()), 100)
+        self.assertEqual(sum(row.cached_tokens for row in rows.values()), 40)
+        self.assertEqual([rows[s].output_tokens for s in ('a1', 'a2', 'b1')], [4, 4, 3])
+        self.assertAlmostEqual(sum(row.api_seconds for row in rows.values()), 0.3)
+        self.assertEqual([rows[s].questions for s in ('a1', 'a2', 'b1')], [0, 0, 1])
+        self.assertEqual({(row.requested, row.batch_size, row.call) for row in rows.values()}, {(1, 3, 'batch')})
+
+    def test_flushes_add_to_the_rows_of_the_day(self):
+        for _ in range(2):
+            self.recorder.record('direct', self.params[:1], CallUsage(10, 0, 5), 0.1, [self.question(self.params[0])])
+            self.recorder.flush()
+        self.assertEqual(self.recorder.pending(), 0)
+        row = GenerationUsage.objects.get()
+        self.assertEqual((row.requested, row.questions, row.input_tokens, row.output_tokens), (2, 2, 20, 10))
+
+    def test_failed_flush_keeps_the_usage(self):
+        self.recorder.record('direct', self.params[:1], CallUsage(10, 0, 5), 0.1, [])
+        with mock.patch.object(UsageRecorder, '_add_row', side_effect=DatabaseError("locked")), \
+                self.assertLogs('gemini_app.controllers.usage_accounting', 'WARNING'):
+            self.recorder.flush()
+        self.assertEqual(self.recorder.pending(), 1)
+        self.recorder.flush()
+        self.assertEqual(GenerationUsage.objects.get().input_tokens, 10)
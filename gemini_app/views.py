@@ -1,15 +1,22 @@
 # gemini_app/views.py
 from django.shortcuts import render, redirect
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import ensure_csrf_cookie
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
 import logging
 import json
-import uuid
+import os
 import threading
+import time
+import uuid
 from dataclasses import dataclass, asdict
 
-from .controllers.question_controller import GeminiQuestionController
+from .controllers.question_controller import GenerationQueueFull
+from .controllers.async_question_controller import AsyncGeminiQuestionController
+from .controllers.question_bank import QuestionBank
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
@@ -51,8 +58,118 @@ class Metrics:
         )
 
 
-controller = GeminiQuestionController()
+_controller = None
+_question_bank = None
+_controller_lock = threading.Lock()
+
+
+def get_controller():
+    """
+    Devuelve el controlador de generación del proceso, creándolo en el primer uso.
+
+    Se crea de forma perezosa para que importar las vistas (al arrancar un
+    worker o ejecutar `manage.py migrate`/`collectstatic`) no cree el
+    cliente del modelo ni necesite GOOGLE_API_KEY.
+    """
+    global _controller, _question_bank
+    if _controller is not None:
+        return _controller
+    with _controller_lock:
+        if _controller is not None:
+            return _controller
+        new_controller = AsyncGeminiQuestionController(
+            pool_size=settings.QUIZ_POOL_SIZE,
+            pool_refill_batch=settings.QUIZ_POOL_REFILL_BATCH,
+            task_ttl=settings.QUIZ_TASK_TTL,
+            max_tasks=settings.QUIZ_TASK_MAX_ENTRIES,
+            max_task_bytes=settings.QUIZ_TASK_MAX_BYTES,
+            task_backend=settings.QUIZ_TASK_BACKEND,
+            task_backend_options=settings.QUIZ_TASK_BACKEND_OPTIONS,
+            max_workers=settings.QUIZ_GENERATION_WORKERS,
+            max_queue=settings.QUIZ_GENERATION_QUEUE_SIZE,
+            max_async_generations=settings.QUIZ_ASYNC_MAX_GENERATIONS,
+            max_async_concurrency=settings.QUIZ_ASYNC_CONCURRENCY,
+            streaming=settings.QUIZ_STREAMING_GENERATION,
+            fanout=settings.QUIZ_FANOUT_GENERATION,
+            fanout_concurrency=settings.QUIZ_FANOUT_CONCURRENCY,
+            fanout_retries=settings.QUIZ_FANOUT_RETRIES,
+            context_cache=settings.QUIZ_CONTEXT_CACHE,
+            context_cache_ttl=settings.QUIZ_CONTEXT_CACHE_TTL,
+            structured_output=settings.QUIZ_STRUCTURED_OUTPUT,
+            topup_missing=settings.QUIZ_TOPUP_MISSING,
+            coalesce=settings.QUIZ_COALESCE_GENERATIONS,
+            model_backend=settings.QUIZ_MODEL_BACKEND,
+            model_backend_options=settings.QUIZ_MODEL_BACKEND_OPTIONS,
+            metrics_dir=settings.QUIZ_METRICS_DIR,
+            usage_accounting=settings.QUIZ_USAGE_ACCOUNTING,
+            usage_flush_interval=settings.QUIZ_USAGE_FLUSH_INTERVAL,
+            hedging=settings.QUIZ_HEDGE_REQUESTS,
+            hedge_percentile=settings.QUIZ_HEDGE_PERCENTILE,
+            hedge_budget=settings.QUIZ_HEDGE_BUDGET,
+            hedge_min_delay=settings.QUIZ_HEDGE_MIN_DELAY,
+            async_views=settings.QUIZ_ASYNC_VIEWS,
+        )
+        _question_bank = QuestionBank(
+            new_controller,
+            min_size=settings.QUIZ_BANK_MIN_SIZE,
+            refill_batch=settings.QUIZ_BANK_REFILL_BATCH,
+            cache_size=settings.QUIZ_QUESTION_CACHE_SIZE,
+            check_interval=settings.QUIZ_BANK_CHECK_INTERVAL,
+        )
+        new_controller.on_pool_refill = _store_pool_questions
+        _controller = new_controller
+        return _controller
+
+
+def warm_pool_in_background():
+    """
+    Calienta el pool de preguntas del proceso en un hilo aparte.
+    
+    Pensado para el arranque de un worker: no lo retrasa, no hace nada si
+    QUIZ_WARM_POOL está desactivado o el backend Gemini no tiene
+    GOOGLE_API_KEY, y los errores solo se registran.
+    
+    Returns:
+        bool: True si se inició el calentamiento
+    """
+    if not settings.QUIZ_WARM_POOL or not settings.QUIZ_POOL_SIZE:
+        return False
+    if settings.QUIZ_MODEL_BACKEND == 'gemini' and not os.getenv('GOOGLE_API_KEY'):
+        logger.info("GOOGLE_API_KEY no configurada, no se calienta el pool de preguntas")
+        return False
+
+    def warm():
+        try:
+            get_controller().warm_pool()
+        except Exception as e:
+            logger.warning(f"No se pudo calentar el pool de preguntas: {e}")
+        finally:
+            close_old_connections()
+
+    threading.Thread(target=warm, name="quiz-warm-pool", daemon=True).start()
+    return True
+
+
+def get_question_bank():
+    """Devuelve el banco de preguntas del proceso, creado junto con el controlador."""
+    get_controller()
+    return _question_bank
+
+
+def _store_pool_questions(questions):
+    """Guarda en el banco las preguntas generadas para el pool del proceso."""
+    try:
+        get_question_bank().store(questions)
+    finally:
+        close_old_connections()
+
+
 DEFAULT_BATCH_SIZE = 5
+# Ids ya mostrados que se recuerdan por sesión. Se guardan en la caché
+# QUIZ_SERVED_IDS_CACHE_ALIAS y no en la sesión, que así ocupa unos cientos de bytes
+MAX_SERVED_IDS = 200
+SSE_KEEPALIVE_SECONDS = 15
+FINAL_GENERATION_STATES = ('completed', 'failed', 'not_found')
 
 
 # Métodos auxiliares para manejar la generación y gestión de preguntas
@@ -65,44 +182,82 @@ def _ensure_metrics_initialized(request):
     """
     if 'metrics' not in request.session:
         request.session['metrics'] = Metrics().to_dict()
-        request.session.modified = True
 
 
 def _get_current_question(request):
     """
     Obtiene la pregunta actual basada en el índice de la sesión.
     
+    La sesión guarda los ids del batch, no su contenido, que se lee del
+    banco a través de su caché en memoria. Además de los ids y el cursor, la
+    sesión guarda las métricas, las acciones ya aplicadas a las dos últimas
+    preguntas y los datos de la generación en curso. Los ids ya mostrados se
+    guardan aparte, en la caché (ver _served_ids).
+    
     Args:
         request: HttpRequest de Django con la sesión activa
         
     Returns:
         dict: La pregunta actual o None si no hay preguntas disponibles
     """
-    questions = request.session.get('questions', [])
+    question_ids = request.session.get('question_ids', [])
     idx = request.session.get('current_question_index', 0)
     
-    if questions and 0 <= idx < len(questions):
-        return questions[idx]
+    if 0 <= idx < len(question_ids):
+        return get_question_bank().get_payload(question_ids[idx])
     return None
 
 
+def _question_token(request):
+    """
+    Token de idempotencia de la pregunta actual.
+    
+    Combina el número de paso del quiz con el id de la pregunta, así que cambia
+    en cuanto el usuario avanza. El cliente lo envía con submit_answer y
+    next_question; una petición repetida lleva un token antiguo y se ignora.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        str: Token de la pregunta actual
+    """
+    question_ids = request.session.get('question_ids', [])
+    idx = request.session.get('current_question_index', 0)
+    question_id = question_ids[idx] if 0 <= idx < len(question_ids) else None
+    return f"{request.session.get('question_step', 0)}:{question_id}"
+
+
+def _remaining_questions(request):
+    """
+    Cuenta las preguntas del batch que el usuario aún no ha visto.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        int: Número de preguntas restantes, incluida la actual
+    """
+    question_ids = request.session.get('question_ids', [])
+    idx = request.session.get('current_question_index', 0)
+    return max(len(question_ids) - idx, 0)
+
+
 def _needs_new_batch(request):
     """
     Determina si se necesita generar un nuevo batch de preguntas.
     
+    El batch siguiente se pide por adelantado cuando quedan
+    QUIZ_PREFETCH_THRESHOLD preguntas o menos, para que el usuario
+    no vea la pantalla de carga al terminar el batch actual.
+    
     Args:
         request: HttpRequest de Django con la sesión activa
         
     Returns:
         bool: True si se necesita un nuevo batch, False en caso contrario
     """
-    questions = request.session.get('questions', [])
-    idx = request.session.get('current_question_index', 0)
-    
-    # Necesitamos un nuevo batch si:
-    # 1. No hay preguntas
-    # 2. El índice está fuera de rango
-    return not questions or idx >= len(questions)
+    return _remaining_questions(request) <= settings.QUIZ_PREFETCH_THRESHOLD
 
 
 def _is_generation_in_progress(request):
@@ -118,7 +273,7 @@ def _is_generation_in_progress(request):
     task_id = request.session.get('generation_task_id')
     return (request.session.get('generation_in_progress', False) and 
             task_id and 
-            controller.is_generation_in_progress(task_id))
+            get_controller().is_generation_in_progress(task_id))
 
 
 def _get_generation_status(request):
@@ -137,7 +292,7 @@ def _get_generation_status(request):
             'status': 'unknown',
             'message': 'No generation task in progress'
         }
-    return controller.get_generation_status(task_id)
+    return get_controller().get_generation_status(task_id)
 
 
 def _reset_batch(request):
@@ -147,62 +302,262 @@ def _reset_batch(request):
     Args:
         request: HttpRequest de Django con la sesión activa
     """
-    request.session['questions'] = []
+    request.session['question_ids'] = []
     request.session['current_question_index'] = 0
-    request.session.modified = True
     logger.info("Reset batch and prepared for new generation")
 
 
+def _append_questions(request, new_question_ids):
+    """
+    Añade preguntas nuevas al final del batch actual.
+    
+    Las preguntas ya respondidas se descartan para que la sesión no crezca
+    indefinidamente; la pregunta actual pasa a ser la primera del batch.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        new_question_ids: Lista de ids del banco de las preguntas a añadir
+    """
+    question_ids = request.session.get('question_ids', [])
+    idx = request.session.get('current_question_index', 0)
+    request.session['question_ids'] = question_ids[idx:] + list(new_question_ids)
+    request.session['current_question_index'] = 0
+
+
+def _collect_generated_questions(request):
+    """
+    Incorpora a la sesión el resultado de la generación en segundo plano.
+    
+    Con generación en streaming, las preguntas se añaden a medida que llegan,
+    así que la primera puede mostrarse antes de que termine el batch.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        dict: Estado de la tarea de generación, o None si no hay ninguna pendiente
+    """
+    task_id = request.session.get('generation_task_id')
+    if not task_id or not request.session.get('generation_in_progress', False):
+        return None
+    
+    status = get_controller().get_generation_status(task_id)
+    generated = status.get('questions') or []
+    collected = request.session.get('generation_collected', 0)
+    if len(generated) > collected:
+        # Se guardan en el banco ya, sin esperar al callback de la generación,
+        # porque la sesión solo puede referenciarlas por id
+        question_ids = get_question_bank().resolve_ids(generated[collected:])
+        _append_questions(request, question_ids)
+        _remember_served(request, question_ids)
+        request.session['generation_collected'] = len(generated)
+        logger.info(f"Appended {len(question_ids)} generated questions to the session batch")
+    
+    if status.get('status') == 'failed':
+        # Si el usuario aún tiene preguntas, un prefetch fallido no debe interrumpirle
+        if _remaining_questions(request) == 0:
+            request.session['generation_error'] = status.get('message', 'Unknown error')
+        logger.warning(f"Question generation {task_id} failed: {status.get('message')}")
+    elif status.get('status') not in FINAL_GENERATION_STATES:
+        # La generación sigue en curso
+        return status
+    
+    request.session['generation_in_progress'] = False
+    request.session.pop('generation_task_id', None)
+    request.session.pop('generation_collected', None)
+    return status
+
+
+def _served_ids_key(request):
+    """
+    Clave de caché de los ids ya mostrados a la sesión.
+    
+    Una sesión nueva se guarda antes para tener clave.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        str: Clave en la caché QUIZ_SERVED_IDS_CACHE_ALIAS
+    """
+    if request.session.session_key is None:
+        request.session.save()
+    return f"quiz_served:{request.session.session_key}"
+
+
+def _served_ids(request):
+    """
+    Obtiene los ids del banco ya mostrados a la sesión (hasta MAX_SERVED_IDS).
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        list: Ids del banco, del más antiguo al más reciente
+    """
+    return caches[settings.QUIZ_SERVED_IDS_CACHE_ALIAS].get(_served_ids_key(request), [])
+
+
+def _remember_served(request, question_ids):
+    """
+    Registra los ids del banco ya mostrados para no repetirlos.
+    
+    Se guardan en la caché con la misma duración que la cookie de sesión.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        question_ids: Lista de ids del banco
+    """
+    served = (_served_ids(request) + list(question_ids))[-MAX_SERVED_IDS:]
+    caches[settings.QUIZ_SERVED_IDS_CACHE_ALIAS].set(
+        _served_ids_key(request), served, timeout=settings.SESSION_COOKIE_AGE
+    )
+
+
+def _load_batch_from_pool(request):
+    """
+    Intenta cargar un batch completo desde el pool de preguntas del proceso.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        bool: True si el batch se cargó desde el pool, False en caso contrario
+    """
+    pooled = get_controller().take_from_pool(DEFAULT_BATCH_SIZE)
+    if not pooled:
+        return False
+    
+    question_ids = get_question_bank().resolve_ids([q.to_dict() for q in pooled])
+    _append_questions(request, question_ids)
+    _remember_served(request, question_ids)
+    logger.info(f"Served batch of {len(question_ids)} questions from the warm pool")
+    return True
+
+
+def _load_batch_from_bank(request):
+    """
+    Intenta cargar un batch completo de preguntas desde el banco persistente.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        bool: True si el batch se cargó desde el banco, False si el banco no tiene suficientes preguntas
+    """
+    stored = get_question_bank().take(
+        DEFAULT_BATCH_SIZE,
+        exclude_ids=_served_ids(request),
+    )
+    # Mantener el banco lleno aunque esta vez hayamos podido servir desde él
+    # (el tamaño del banco solo se consulta cada QUIZ_BANK_CHECK_INTERVAL)
+    get_question_bank().ensure_stocked()
+    if len(stored) < DEFAULT_BATCH_SIZE:
+        return False
+    
+    question_ids = [row.pk for row in stored]
+    _append_questions(request, question_ids)
+    _remember_served(request, question_ids)
+    logger.info(f"Served batch of {len(question_ids)} questions from the question bank")
+    return True
+
+
+def _store_generated_questions(new_questions):
+    """
+    Guarda en el banco un batch generado para una sesión (se ejecuta en el worker del controlador).
+    
+    Args:
+        new_questions: Lista de QuizQuestion generadas, o None si la generación falló
+    """
+    try:
+        if new_questions:
+            # Guardar en el banco para que otras sesiones puedan reutilizarlas
+            get_question_bank().store(new_questions)
+            logger.info(f"Generated batch of {len(new_questions)} questions successfully")
+        else:
+            logger.error("Failed to generate questions")
+    finally:
+        close_old_connections()
+
+
 def _start_question_generation(request):
     """
-    Inicia la generación de preguntas en un thread separado.
+    Encola la generación de preguntas en el pool de workers del controlador.
+    
+    El resultado se incorpora a la sesión en _collect_generated_questions,
+    ya que esta request habrá terminado cuando la generación acabe. Si la
+    cola está llena y el usuario no tiene preguntas, se registra un error.
     
     Args:
         request: HttpRequest de Django con la sesión activa
     """
-    # Generar un nuevo ID de tarea y almacenarlo en la sesión
+    # Generar un nuevo ID de tarea
     task_id = str(uuid.uuid4())
+    try:
+        get_controller().submit_generation(
+            count=DEFAULT_BATCH_SIZE,
+            task_id=task_id,
+            callback=_store_generated_questions,
+            coalesce=True,
+        )
+    except GenerationQueueFull as e:
+        _reject_generation(request, e)
+        return
+    
+    _register_generation(request, task_id)
+
+
+def _register_generation(request, task_id):
+    """
+    Almacena en la sesión el ID de la tarea de generación encolada.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        task_id: ID de la tarea en el controlador
+    """
     request.session['generation_task_id'] = task_id
     request.session['generation_in_progress'] = True
-    request.session.modified = True
-    
-    # Iniciar la generación de preguntas en un hilo en segundo plano
-    def generate_questions_task():
-        try:
-            new_questions = controller.generate_questions(count=DEFAULT_BATCH_SIZE, task_id=task_id)
-            if new_questions:
-                # Actualizar la sesión con nuevas preguntas
-                request.session['questions'] = [q.to_dict() for q in new_questions]
-                request.session['current_question_index'] = 0
-                request.session['generation_in_progress'] = False
-                request.session.modified = True
-                logger.info(f"Generated batch of {len(new_questions)} questions successfully")
-            else:
-                logger.error("Failed to generate questions")
-                request.session['generation_error'] = "Failed to generate questions"
-                request.session['generation_in_progress'] = False
-                request.session.modified = True
-        except Exception as e:
-            logger.error(f"Error in question generation thread: {e}", exc_info=True)
-            request.session['generation_error'] = str(e)
-            request.session['generation_in_progress'] = False
-            request.session.modified = True
+    request.session['generation_collected'] = 0
+    logger.info(f"Queued question generation with task_id: {task_id}")
+
+
+def _reject_generation(request, error):
+    """
+    Registra que la generación fue rechazada porque la cola del controlador está llena.
     
-    # Iniciar un nuevo hilo solo si vamos a generar preguntas
-    threading.Thread(target=generate_questions_task, daemon=True).start()
-    logger.info(f"Started question generation with task_id: {task_id}")
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        error: Excepción GenerationQueueFull recibida
+    """
+    logger.warning(f"Question generation rejected: {error}")
+    if _remaining_questions(request) == 0:
+        request.session['generation_error'] = (
+            "El servidor está generando demasiadas preguntas en este momento. "
+            "Inténtalo de nuevo en unos segundos."
+        )
 
 
-def _init_quiz(request):
+def _init_quiz(request, start_generation=None):
     """
     Inicializa o actualiza el estado del quiz según sea necesario.
     
     Args:
         request: HttpRequest de Django con la sesión activa
+        start_generation: Función que inicia la generación si hace falta
+            (por defecto _start_question_generation)
     """
     # Inicializar métricas si es necesario
     _ensure_metrics_initialized(request)
     
+    # Las sesiones antiguas guardaban las preguntas completas; ahora solo sus ids
+    if request.session.pop('questions', None) is not None:
+        request.session['current_question_index'] = 0
+    # Los ids ya mostrados se guardaban en la sesión; ahora en la caché
+    request.session.pop('served_question_ids', None)
+    
+    # Incorporar las preguntas generadas en segundo plano, si ya están listas
+    _collect_generated_questions(request)
+    
     # Verificar si necesitamos generar nuevas preguntas
     if not _needs_new_batch(request):
         return
@@ -212,13 +567,17 @@ def _init_quiz(request):
         return
     
     # Resetear el batch si tenemos preguntas pero el índice está fuera de rango
-    questions = request.session.get('questions', [])
+    question_ids = request.session.get('question_ids', [])
     idx = request.session.get('current_question_index', 0)
-    if questions and idx >= len(questions):
+    if question_ids and idx >= len(question_ids):
         _reset_batch(request)
     
+    # Servir desde el pool en memoria o, si no alcanza, desde el banco persistente
+    if _load_batch_from_pool(request) or _load_batch_from_bank(request):
+        return
+    
     # Iniciar la generación de nuevas preguntas
-    _start_question_generation(request)
+    (start_generation or _start_question_generation)(request)
 
 
 @ensure_csrf_cookie
@@ -233,44 +592,7 @@ def index(request):
             
         # Inicializar el estado del quiz
         _init_quiz(request)
-        
-        # Resetear banderas para esta carga de página
-        request.session['increment_pending'] = False
-        request.session['answer_recorded'] = False
-        request.session.modified = True
-        
-        # Verificar si aún estamos generando preguntas
-        if _is_generation_in_progress(request):
-            status = _get_generation_status(request)
-            # Renderizar una página de carga con información de estado
-            return render(request, 'quiz.html', {
-                'loading': True,
-                'status': status,
-                'metrics': request.session.get('metrics', {}),
-            })
-                
-        # Verificar si hubo un error durante la generación
-        if 'generation_error' in request.session:
-            error = request.session.pop('generation_error')
-            return render(request, 'error.html', {'error': error})
-            
-        # Si tenemos preguntas, renderizar la página del quiz
-        current_question = _get_current_question(request)
-        if current_question:
-            metrics = request.session.get('metrics', {})
-            return render(request, 'quiz.html', {
-                'question': current_question,
-                'metrics': metrics,
-                'question_number': request.session.get('current_question_index', 0),
-                'total_questions': len(request.session.get('questions', []))
-            })
-            
-        # Si llegamos aquí, aún estamos esperando preguntas
-        return render(request, 'quiz.html', {
-            'loading': True,
-            'message': 'Preparing your quiz questions...',
-            'metrics': request.session.get('metrics', {})
-        })
+        return _render_index(request)
             
     except Exception as e:
         logger.error(f"Error rendering quiz: {e}", exc_info=True)
@@ -278,36 +600,194 @@ def index(request):
         return render(request, 'error.html', {'error': str(e)})
 
 
+def _render_index(request):
+    """
+    Renderiza la página del quiz según el estado actual de la sesión.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        HttpResponse con la pregunta actual, la página de carga o el error de generación
+    """
+    # Si tenemos preguntas, renderizar la página del quiz aunque haya
+    # un prefetch del siguiente batch en curso
+    current_question = _get_current_question(request)
+    if current_question:
+        metrics = request.session.get('metrics', {})
+        return render(request, 'quiz.html', {
+            'question': current_question,
+            'metrics': metrics,
+            'question_number': request.session.get('current_question_index', 0),
+            'total_questions': len(request.session.get('question_ids', [])),
+            'question_token': _question_token(request),
+        })
+    
+    # Verificar si aún estamos generando preguntas
+    if _is_generation_in_progress(request):
+        status = _get_generation_status(request)
+        # Renderizar una página de carga con información de estado
+        return render(request, 'quiz.html', {
+            'loading': True,
+            'status': status,
+            'metrics': request.session.get('metrics', {}),
+        })
+            
+    # Verificar si hubo un error durante la generación
+    if 'generation_error' in request.session:
+        error = request.session.pop('generation_error')
+        return render(request, 'error.html', {'error': error})
+        
+    # Si llegamos aquí, aún estamos esperando preguntas
+    return render(request, 'quiz.html', {
+        'loading': True,
+        'message': 'Preparing your quiz questions...',
+        'metrics': request.session.get('metrics', {})
+    })
+
+
 @require_http_methods(["GET"])
 def check_generation_status(request):
     """Endpoint para verificar el estado de la generación de preguntas"""
-    status = _get_generation_status(request)
+    return JsonResponse(_generation_status_payload(request))
+
+
+def _generation_status_payload(request):
+    """
+    Obtiene el estado de la generación, incorporando sus preguntas a la sesión si terminó.
     
-    # Si la generación está completa, actualizar la sesión
-    if status.get('status') == 'completed' and status.get('questions'):
-        request.session['questions'] = status.get('questions')
-        request.session['current_question_index'] = 0
-        request.session['generation_in_progress'] = False
-        request.session.modified = True
+    Args:
+        request: HttpRequest de Django con la sesión activa
         
-    # Si la generación falló, registrar el error
-    elif status.get('status') == 'failed':
-        request.session['generation_error'] = status.get('message', 'Unknown error')
-        request.session['generation_in_progress'] = False
-        request.session.modified = True
+    Returns:
+        dict: Diccionario con el estado de la generación
+    """
+    return _collect_generated_questions(request) or _get_generation_status(request)
+
+
+def _sse_event(status):
+    """
+    Formatea el estado de una generación como evento Server-Sent Events.
+    
+    Las preguntas solo se envían en el evento final 'completed'.
+    
+    Args:
+        status: Diccionario de estado devuelto por el controlador
+        
+    Returns:
+        str: Evento SSE listo para escribir en el stream
+    """
+    state = status.get('status', 'unknown')
+    payload = {key: value for key, value in status.items() if key != 'questions'}
+    if state == 'completed':
+        payload['questions'] = status.get('questions', [])
+    event = state if state in FINAL_GENERATION_STATES else 'progress'
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+def _sse_response(stream):
+    """
+    Crea la respuesta HTTP para un stream de eventos SSE.
+    
+    Args:
+        stream: Iterador (síncrono o asíncrono) de eventos SSE
         
-    return JsonResponse(status)
+    Returns:
+        StreamingHttpResponse con las cabeceras adecuadas para SSE
+    """
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Evitar que nginx u otros proxies acumulen los eventos
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@require_http_methods(["GET"])
+def generation_events(request):
+    """
+    Endpoint SSE que envía los cambios de estado de la generación de la sesión.
+    
+    Sustituye al polling de check_generation_status: el cliente recibe cada
+    cambio de progreso y el batch terminado una sola vez. Bajo WSGI cada
+    stream abierto ocupa un hilo del worker, así que es un long-poll acotado:
+    se cierra tras QUIZ_SSE_WSGI_MAX_DURATION segundos y EventSource se
+    reconecta solo. La versión async (ASGI) mantiene el stream abierto hasta
+    QUIZ_SSE_MAX_DURATION.
+    """
+    task_id = request.session.get('generation_task_id')
+    
+    def stream():
+        yield "retry: 1000\n\n"
+        if not task_id:
+            yield _sse_event(get_controller().get_generation_status(''))
+            return
+        
+        version = 0
+        deadline = time.monotonic() + settings.QUIZ_SSE_WSGI_MAX_DURATION
+        while time.monotonic() < deadline:
+            timeout = min(SSE_KEEPALIVE_SECONDS, deadline - time.monotonic())
+            status, new_version = get_controller().wait_for_generation_update(task_id, version, timeout)
+            if new_version and new_version == version:
+                # Comentario SSE para mantener viva la conexión
+                yield ": keepalive\n\n"
+                continue
+            version = new_version
+            yield _sse_event(status)
+            if status.get('status') in FINAL_GENERATION_STATES:
+                return
+    
+    return _sse_response(stream())
+
+
+MISSING_TOKEN_ERROR = "Falta el token de la pregunta"
+# Pasos cuyas acciones se recuerdan: el actual y el anterior, para aceptar una
+# respuesta que llega después de que next_question ya avanzara
+MAX_TRACKED_STEPS = 2
+
+
+def _claim_action(request, token, action):
+    """
+    Registra una acción ('answer' o 'next') sobre la pregunta de un token.
+    
+    La idempotencia va por (token, acción): cada acción se aplica una sola
+    vez por pregunta, en cualquier orden. Una respuesta se acepta para la
+    pregunta actual o para la anterior (si next_question llegó antes);
+    avanzar solo se acepta desde la pregunta actual.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        token: Token enviado por el cliente
+        action: 'answer' o 'next'
+        
+    Returns:
+        bool: True si la acción debe aplicarse, False si es repetida o antigua
+    """
+    actions = request.session.get('question_actions', {})
+    current = _question_token(request)
+    if token != current and (action != 'answer' or token not in actions):
+        return False
+    if action in actions.get(token, []):
+        return False
+    # La pregunta actual queda la última del dict, que se poda por orden
+    actions.setdefault(current, [])
+    actions[token] = actions.get(token, []) + [action]
+    request.session['question_actions'] = actions
+    return True
 
 
 @require_http_methods(["POST"])
 def submit_answer(request):
     try:
-        # Verificar si ya se registró esta respuesta para evitar duplicación
-        if request.session.get('answer_recorded', False):
-            # Si ya se registró, simplemente devolver los datos actuales
-            return JsonResponse({'success': True, 'metrics': request.session.get('metrics', {})})
-            
         data = json.loads(request.body)
+        token = data.get('token')
+        if not token:
+            return JsonResponse({'error': MISSING_TOKEN_ERROR}, status=400)
+        
+        # Una respuesta repetida, o de una pregunta anterior a la última, no
+        # se vuelve a contar ni escribe en la sesión
+        if not _claim_action(request, token, 'answer'):
+            return JsonResponse({'success': True, 'metrics': request.session.get('metrics', {})})
+        
         is_correct = data.get('is_correct', False)
         # Utilizar la clase Metrics para actualizar las métricas de la sesión
         metrics_obj = Metrics.from_dict(request.session.get('metrics', {}))
@@ -315,10 +795,6 @@ def submit_answer(request):
         updated_metrics = metrics_obj.to_dict()
         request.session['metrics'] = updated_metrics
         
-        # Marcar que la respuesta ha sido registrada
-        request.session['answer_recorded'] = True
-        request.session.modified = True
-        
         return JsonResponse({'success': True, 'metrics': updated_metrics})
     except Exception as e:
         logger.error(f"Error processing answer: {e}", exc_info=True)
@@ -327,32 +803,64 @@ def submit_answer(request):
 
 @require_http_methods(["GET"])
 def next_question(request):
-    logger.info(f"NEXT QUESTION - Current question index: {request.session.get('current_question_index', 0)}")
-    
-    # Verificar si la bandera de incremento está configurada para evitar incrementos dobles
-    if not request.session.get('increment_pending', False):
-        # Avanzar a la siguiente pregunta
-        current_idx = request.session.get('current_question_index', 0)
-        request.session['current_question_index'] = current_idx + 1
-        # Establecer bandera para indicar que hemos incrementado
-        request.session['increment_pending'] = True
-        logger.info(f"Incremented question index to: {current_idx + 1}")
-    
-    # Resetear la bandera answer_recorded para la nueva pregunta
-    request.session['answer_recorded'] = False
-    request.session.modified = True
+    error = _advance_question(request)
+    if error is not None:
+        return error
     
     # Re-inicializar el quiz si es necesario (batch agotado)
     _init_quiz(request)
+    return _next_question_response(request)
+
+
+def _advance_question(request):
+    """
+    Avanza a la siguiente pregunta si el token corresponde a la pregunta actual.
     
-    # Verificar si aún estamos generando preguntas
-    if _is_generation_in_progress(request):
-        status = _get_generation_status(request)
-        return JsonResponse({
-            'loading': True,
-            'status': status
-        })
+    Cada token avanza una sola vez: un next_question repetido lleva el token
+    de una pregunta que ya quedó atrás y no mueve el cursor. Responder no
+    avanza, así que submit_answer y next_question pueden llegar en cualquier
+    orden.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        JsonResponse de error si falta el token, None en otro caso
+    """
+    token = request.GET.get('token')
+    if not token:
+        return JsonResponse({'error': MISSING_TOKEN_ERROR}, status=400)
+    if _claim_action(request, token, 'next'):
+        _move_cursor(request)
+    return None
+
+
+def _move_cursor(request):
+    """
+    Mueve el cursor del batch a la siguiente pregunta.
     
+    Args:
+        request: HttpRequest de Django con la sesión activa
+    """
+    current_idx = request.session.get('current_question_index', 0)
+    request.session['current_question_index'] = current_idx + 1
+    request.session['question_step'] = request.session.get('question_step', 0) + 1
+    # Olvidar las acciones de los pasos más antiguos
+    actions = request.session.get('question_actions', {})
+    request.session['question_actions'] = dict(list(actions.items())[-(MAX_TRACKED_STEPS - 1):])
+    logger.info(f"Incremented question index to: {current_idx + 1}")
+
+
+def _next_question_response(request):
+    """
+    Construye la respuesta JSON de next_question a partir del estado de la sesión.
+    
+    Args:
+        request: HttpRequest de Django con la sesión activa
+        
+    Returns:
+        JsonResponse con la pregunta actual o el estado de carga
+    """
     # Si las preguntas están listas, devolverlas
     current_question = _get_current_question(request)
     if current_question:
@@ -362,7 +870,16 @@ def next_question(request):
             'question': current_question,
             'metrics': metrics,
             'question_number': idx,
-            'total_questions': len(request.session.get('questions', []))
+            'total_questions': len(request.session.get('question_ids', [])),
+            'question_token': _question_token(request),
+        })
+    
+    # Verificar si aún estamos generando preguntas
+    if _is_generation_in_progress(request):
+        status = _get_generation_status(request)
+        return JsonResponse({
+            'loading': True,
+            'status': status
         })
     
     # Si aún no tenemos preguntas
@@ -372,6 +889,28 @@ def next_question(request):
     })
 
 
+@require_http_methods(["GET"])
+def pool_stats(request):
+    """Endpoint con el tamaño y los contadores de aciertos/fallos del pool de preguntas"""
+    controller = get_controller()
+    stats = controller.get_pool_stats()
+    stats['prompt_cache'] = controller.prompt_cache.get_stats()
+    stats['parsing'] = controller.get_parse_stats()
+    stats['coalescing'] = controller.get_coalescing_stats()
+    stats['hedging'] = controller.get_hedge_stats()
+    return JsonResponse(stats)
+
+
+@require_http_methods(["GET"])
+def metrics(request):
+    """
+    Endpoint con las métricas de generación en formato de texto de Prometheus.
+    
+    Con QUIZ_METRICS_DIR configurado, suma las métricas de todos los workers.
+    """
+    return HttpResponse(get_controller().metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 @require_http_methods(["GET"])
 def get_metrics(request):
     return JsonResponse({'metrics': request.session.get('metrics', {})})
@@ -0,0 +1,33 @@
+# gunicorn.conf.py
+# Picked up automatically by `gunicorn cs_quiz_project.wsgi` (see Procfile).
+import glob
+import logging
+import os
+
+# Threaded workers, so an open /generation_events/ stream (a bounded long-poll
+# under WSGI) or a request waiting on Gemini holds a thread, not a whole worker.
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+
+def on_starting(server):
+    """Drop the metrics files of a previous run, so counters start from zero."""
+    metrics_dir = os.getenv('QUIZ_METRICS_DIR')
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, 'metrics-*.json')):
+            os.remove(path)
+
+
+def post_worker_init(worker):
+    """
+    Start warming the question pool once the worker has loaded Django.
+
+    The controller is created on a background thread (and not at all without
+    credentials), and an error here would stop gunicorn, so any failure is
+    only logged.
+    """
+    try:
+        from gemini_app.views import warm_pool_in_background
+        warm_pool_in_background()
+    except Exception as e:
+        logging.getLogger(__name__).warning(f"Question pool warm-up not started: {e}")